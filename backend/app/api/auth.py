@@ -2,9 +2,9 @@
 楚然智考系统 - 认证API路由
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_async_db
 from app.redis_client import get_redis, RedisClient
 from app.services.auth_service import AuthService
 from app.services.user_service import UserService
@@ -15,7 +15,7 @@ from app.schemas.auth import (
 )
 from app.schemas.user import UserCreate
 from app.api.deps import get_current_user
-from app.models.user import User
+from app.services.principal_cache import Principal
 
 
 router = APIRouter()
@@ -23,7 +23,7 @@ router = APIRouter()
 
 @router.get("/captcha", response_model=CaptchaResponse, summary="获取图形验证码")
 async def get_captcha(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     redis: RedisClient = Depends(get_redis)
 ):
     """
@@ -47,7 +47,7 @@ async def get_captcha(
 @router.post("/sms/send", response_model=SendSmsResponse, summary="发送短信验证码")
 async def send_sms_code(
     request: SendSmsRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     redis: RedisClient = Depends(get_redis)
 ):
     """
@@ -72,7 +72,7 @@ async def send_sms_code(
 @router.post("/login", response_model=Token, summary="用户登录")
 async def login(
     request: LoginRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     redis: RedisClient = Depends(get_redis)
 ):
     """
@@ -80,7 +80,6 @@ async def login(
     需要验证图形验证码
     """
     auth_service = AuthService(db, redis)
-    user_service = UserService(db)
     
     # 验证图形验证码
     if not await auth_service.verify_captcha(request.captcha_key, request.captcha_code):
@@ -89,14 +88,8 @@ async def login(
             detail="图形验证码错误"
         )
     
-    # 尝试用户名登录
-    user = auth_service.authenticate_user(request.username, request.password)
-    
-    # 如果用户名登录失败，尝试手机号登录
-    if not user:
-        user = user_service.get_user_by_phone(request.username)
-        if user and not auth_service.verify_password(request.password, user.hashed_password):
-            user = None
+    # 用户名或手机号登录
+    user = await auth_service.authenticate_user(request.username, request.password)
     
     if not user:
         raise HTTPException(
@@ -111,10 +104,10 @@ async def login(
         )
     
     # 更新登录时间
-    auth_service.update_last_login(user)
+    await auth_service.update_last_login(user)
     
     # 生成Token
-    access_token, expires_in = auth_service.create_access_token(user)
+    access_token, expires_in = await auth_service.create_access_token(user)
     
     return Token(
         access_token=access_token,
@@ -126,7 +119,7 @@ async def login(
 @router.post("/register", summary="用户注册")
 async def register(
     request: RegisterRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     redis: RedisClient = Depends(get_redis)
 ):
     """
@@ -144,14 +137,14 @@ async def register(
         )
     
     # 检查用户名是否存在
-    if user_service.get_user_by_username(request.username):
+    if await user_service.get_user_by_username(request.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="用户名已存在"
         )
     
     # 检查手机号是否存在（如果提供了手机号）
-    if request.phone and user_service.get_user_by_phone(request.phone):
+    if request.phone and await user_service.get_user_by_phone(request.phone):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="手机号已注册"
@@ -163,7 +156,7 @@ async def register(
         password=request.password,
         phone=request.phone
     )
-    user = user_service.create_user(user_data)
+    user = await user_service.create_user(user_data)
     
     return {"message": "注册成功"}
 
@@ -171,7 +164,7 @@ async def register(
 @router.post("/password/reset", summary="重置密码")
 async def reset_password(
     request: ResetPasswordRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     redis: RedisClient = Depends(get_redis)
 ):
     """
@@ -188,7 +181,7 @@ async def reset_password(
         )
     
     # 重置密码
-    success, message = user_service.reset_password(request.phone, request.new_password)
+    success, message = await user_service.reset_password(request.phone, request.new_password)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -200,25 +193,27 @@ async def reset_password(
 
 @router.get("/me", response_model=UserInfo, summary="获取当前用户信息")
 async def get_current_user_info(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     获取当前登录用户信息
     """
     user_service = UserService(db)
-    permissions = user_service.get_user_permissions(current_user.id)
-    roles = [role.code for role in current_user.roles]
+    # 一次查询用户及角色，权限取自登录主体（由角色权限快照合并）
+    user = await user_service.get_user_with_roles(current_user.id)
+    roles = [role.code for role in user.roles]
+    permissions = sorted(current_user.permissions)
     
     return UserInfo(
-        id=current_user.id,
-        username=current_user.username,
-        email=current_user.email,
-        phone=current_user.phone,
-        real_name=current_user.real_name,
-        avatar=current_user.avatar,
-        gender=current_user.gender,
-        is_superuser=current_user.is_superuser,
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        phone=user.phone,
+        real_name=user.real_name,
+        avatar=user.avatar,
+        gender=user.gender,
+        is_superuser=user.is_superuser,
         roles=roles,
         permissions=permissions
     )
@@ -3,14 +3,15 @@
 """
 from typing import Optional, List
 from functools import wraps
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, status, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_async_db
 from app.redis_client import get_redis, RedisClient
-from app.models.user import User
 from app.services.auth_service import AuthService
+from app.services.principal_cache import Principal, principal_cache
+from app.services.pagination import PageParams
 from app.schemas.auth import TokenData
 
 
@@ -18,13 +19,12 @@ from app.schemas.auth import TokenData
 security = HTTPBearer()
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
+def get_token_data(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> TokenData:
     """
-    获取当前登录用户
-    从JWT Token中解析用户信息
+    获取Token数据
+    同一请求内的依赖结果会被复用，令牌只解析一次
     """
     token = credentials.credentials
     token_data = AuthService.decode_token(token)
@@ -36,13 +36,31 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    user = db.query(User).filter(User.id == token_data.user_id).first()
+    return token_data
+
+
+async def get_current_user(
+    token_data: TokenData = Depends(get_token_data),
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """
+    获取当前登录用户
+    从JWT Token中解析用户ID，用户状态和权限从登录主体缓存读取
+    """
+    user = await principal_cache.get(db, token_data.user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户不存在"
         )
     
+    if token_data.token_version < user.token_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="登录已失效，请重新登录",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    
     if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -53,15 +71,15 @@ async def get_current_user(
 
 
 async def get_current_active_user(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: Principal = Depends(get_current_user)
+) -> Principal:
     """获取当前活跃用户"""
     return current_user
 
 
 async def get_current_superuser(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: Principal = Depends(get_current_user)
+) -> Principal:
     """获取当前超级管理员"""
     if not current_user.is_superuser:
         raise HTTPException(
@@ -71,22 +89,6 @@ async def get_current_superuser(
     return current_user
 
 
-def get_token_data(
-    credentials: HTTPAuthorizationCredentials = Depends(security)
-) -> TokenData:
-    """获取Token数据"""
-    token = credentials.credentials
-    token_data = AuthService.decode_token(token)
-    
-    if not token_data:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="无效的认证凭证"
-        )
-    
-    return token_data
-
-
 class PermissionChecker:
     """权限检查器"""
     
@@ -95,15 +97,14 @@ class PermissionChecker:
     
     def __call__(
         self,
-        token_data: TokenData = Depends(get_token_data),
-        current_user: User = Depends(get_current_user)
-    ) -> User:
+        current_user: Principal = Depends(get_current_user)
+    ) -> Principal:
         # 超级管理员跳过权限检查
         if current_user.is_superuser:
             return current_user
         
-        # 检查是否拥有所需权限
-        user_permissions = token_data.permissions
+        # 检查是否拥有所需权限（以缓存中的最新权限为准，不使用令牌中签发时的权限）
+        user_permissions = current_user.permissions
         for perm in self.required_permissions:
             if perm not in user_permissions:
                 raise HTTPException(
@@ -130,13 +131,12 @@ def requires_any_permission(*permissions: str):
     class AnyPermissionChecker:
         def __call__(
             self,
-            token_data: TokenData = Depends(get_token_data),
-            current_user: User = Depends(get_current_user)
-        ) -> User:
+            current_user: Principal = Depends(get_current_user)
+        ) -> Principal:
             if current_user.is_superuser:
                 return current_user
             
-            user_permissions = token_data.permissions
+            user_permissions = current_user.permissions
             for perm in permissions:
                 if perm in user_permissions:
                     return current_user
@@ -147,3 +147,22 @@ def requires_any_permission(*permissions: str):
             )
     
     return Depends(AnyPermissionChecker())
+
+
+def get_page_params(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分页方式：offset偏移 cursor游标"),
+    cursor: Optional[str] = Query(None, max_length=512, description="游标分页时上一页返回的 next_cursor")
+) -> PageParams:
+    """列表分页参数（游标分页不返回总数）"""
+    return PageParams(skip=skip, limit=limit, pagination=pagination, cursor=cursor)
+
+
+def get_admin_page_params(
+    page: PageParams = Depends(get_page_params),
+    total: str = Query("none", pattern="^(none|exact|approx)$", description="游标分页时的总数：none不返回 exact精确 approx估算")
+) -> PageParams:
+    """管理端列表分页参数（游标分页可按需返回缓存的总数）"""
+    page.total = total
+    return page
@@ -2,22 +2,30 @@
 楚然智考系统 - 考试管理API路由
 """
 from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_async_db, get_read_db
+from app.redis_client import redis_client
 from app.services.exam_service import ExamService
 from app.services.question_service import QuestionService
+from app.services.paper_cache import paper_cache
+from app.services.grading_queue import grading_queue
+from app.services.regrade_service import regrade_jobs
+from app.services.exam_session import exam_sessions
+from app.services.recent_writes import recent_writes
 from app.schemas.exam import (
     ExamCreate, ExamUpdate, ExamResponse, ExamListResponse, ExamDetail,
     StartExamResponse, SubmitExamRequest, ExamRecordResponse,
-    ExamRecordListResponse, ExamRecordDetail, ExamAnswerDetail,
+    ExamRecordListResponse, ExamRecordDetail, ExamAnswerDetail, ExamRecordStatusResponse,
+    RegradeRequest, RegradeJobResponse, AutosaveRequest, SavedAnswersResponse,
     WrongQuestionResponse, WrongQuestionListResponse, WrongQuestionUpdate
 )
-from app.schemas.question import QuestionBrief, QuestionResponse
-from app.api.deps import get_current_user, requires_permission
-from app.models.user import User
-from app.models.exam import RecordStatus
+from app.schemas.question import QuestionResponse
+from app.api.deps import get_current_user, requires_permission, get_page_params, get_admin_page_params
+from app.services.pagination import PageParams
+from app.services.principal_cache import Principal
+from app.models.exam import RecordStatus, ExamStatus
 from app.models.permission import PermissionCode
 import json
 
@@ -29,46 +37,46 @@ router = APIRouter()
 
 @router.get("", response_model=ExamListResponse, summary="获取考试列表")
 async def get_exams(
-    skip: int = Query(0, ge=0),
-    limit: int = Query(20, ge=1, le=100),
+    page: PageParams = Depends(get_admin_page_params),
     keyword: Optional[str] = None,
     exam_type: Optional[str] = None,
     status: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.EXAM_VIEW)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = requires_permission(PermissionCode.EXAM_VIEW)
 ):
     """获取考试列表"""
     exam_service = ExamService(db)
-    exams, total = exam_service.get_exams(
-        skip=skip,
-        limit=limit,
+    result = await exam_service.get_exams(
+        page=page,
         keyword=keyword,
         exam_type=exam_type,
         status=status
     )
     
-    return ExamListResponse(total=total, items=exams)
+    return ExamListResponse(
+        total=result.total, items=result.items, has_more=result.has_more, next_cursor=result.next_cursor
+    )
 
 
 @router.get("/available", response_model=List[ExamResponse], summary="获取可参加的考试")
 async def get_available_exams(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """获取当前用户可参加的考试"""
     exam_service = ExamService(db)
-    return exam_service.get_available_exams(current_user.id)
+    return await exam_service.get_available_exams(current_user.id)
 
 
 @router.get("/{exam_id}", response_model=ExamDetail, summary="获取考试详情")
 async def get_exam(
     exam_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.EXAM_VIEW)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.EXAM_VIEW)
 ):
     """获取考试详情（含题目列表）"""
     exam_service = ExamService(db)
-    exam = exam_service.get_exam_by_id(exam_id)
+    exam = await exam_service.get_exam_by_id(exam_id)
     
     if not exam:
         raise HTTPException(
@@ -76,24 +84,13 @@ async def get_exam(
             detail="考试不存在"
         )
     
-    # 获取题目列表
-    questions = exam_service.generate_exam_questions(exam)
-    question_briefs = []
-    for q in questions:
-        options = None
-        if q.options:
-            try:
-                options = json.loads(q.options)
-            except:
-                pass
-        question_briefs.append(QuestionBrief(
-            id=q.id,
-            question_type=q.question_type,
-            title=q.title,
-            options=options,
-            score=q.score,
-            image_url=q.image_url
-        ))
+    # 获取题目列表（固定组卷读取试卷缓存）
+    paper = await paper_cache.get_paper(db, exam)
+    if paper:
+        question_briefs = paper["student"]
+    else:
+        questions = await exam_service.generate_exam_questions(exam)
+        question_briefs = [exam_service.question_brief_dict(q) for q in questions]
     
     return ExamDetail(
         id=exam.id,
@@ -123,12 +120,12 @@ async def get_exam(
 @router.post("", response_model=ExamResponse, summary="创建考试")
 async def create_exam(
     exam_data: ExamCreate,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.EXAM_CREATE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.EXAM_CREATE)
 ):
     """创建考试"""
     exam_service = ExamService(db)
-    exam = exam_service.create_exam(exam_data, current_user.id)
+    exam = await exam_service.create_exam(exam_data, current_user.id)
     return exam
 
 
@@ -136,12 +133,12 @@ async def create_exam(
 async def update_exam(
     exam_id: int,
     exam_data: ExamUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.EXAM_UPDATE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.EXAM_UPDATE)
 ):
     """更新考试"""
     exam_service = ExamService(db)
-    exam = exam_service.update_exam(exam_id, exam_data)
+    exam = await exam_service.update_exam(exam_id, exam_data)
     
     if not exam:
         raise HTTPException(
@@ -149,18 +146,20 @@ async def update_exam(
             detail="考试不存在"
         )
     
+    await paper_cache.invalidate(exam_id)
+    
     return exam
 
 
 @router.delete("/{exam_id}", summary="删除考试")
 async def delete_exam(
     exam_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.EXAM_DELETE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.EXAM_DELETE)
 ):
     """删除考试"""
     exam_service = ExamService(db)
-    success = exam_service.delete_exam(exam_id)
+    success = await exam_service.delete_exam(exam_id)
     
     if not success:
         raise HTTPException(
@@ -168,18 +167,20 @@ async def delete_exam(
             detail="考试不存在"
         )
     
+    await paper_cache.invalidate(exam_id)
+    
     return {"message": "删除成功"}
 
 
 @router.post("/{exam_id}/publish", response_model=ExamResponse, summary="发布考试")
 async def publish_exam(
     exam_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.EXAM_PUBLISH)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.EXAM_PUBLISH)
 ):
     """发布考试"""
     exam_service = ExamService(db)
-    exam = exam_service.publish_exam(exam_id)
+    exam = await exam_service.publish_exam(exam_id)
     
     if not exam:
         raise HTTPException(
@@ -187,6 +188,8 @@ async def publish_exam(
             detail="考试不存在"
         )
     
+    await paper_cache.invalidate(exam_id)
+    
     return exam
 
 
@@ -195,12 +198,49 @@ async def publish_exam(
 @router.post("/{exam_id}/start", response_model=StartExamResponse, summary="开始考试")
 async def start_exam(
     exam_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.EXAM_TAKE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.EXAM_TAKE)
 ):
-    """开始考试"""
+    """开始考试（重复请求幂等，返回同一份作答）"""
+    # 快速路径：已有进行中的作答时直接返回开考数据，不访问数据库
+    started = await exam_sessions.get_started(current_user.id, exam_id)
+    if started:
+        return Response(content=started, media_type="application/json")
+    
+    # 同一用户同一考试的开考请求串行执行，避免重复点击产生多条进行中记录或超出尝试次数
+    async with redis_client.lock(f"lock:exam:start:{current_user.id}:{exam_id}", ttl_ms=10000, wait_timeout=5) as acquired:
+        if not acquired:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="操作过于频繁，请稍后重试"
+            )
+        
+        # 等待锁期间其他请求可能已完成开考
+        started = await exam_sessions.get_started(current_user.id, exam_id)
+        if started:
+            return Response(content=started, media_type="application/json")
+        
+        response = await _start_exam(exam_id, db, current_user)
+        
+        ttl = exam_sessions.session_ttl(response.start_time, response.exam.duration)
+        await exam_sessions.open(response.record_id, current_user.id, ttl)
+        await exam_sessions.bind_start(
+            current_user.id, exam_id, response.record_id, response.model_dump_json(), ttl
+        )
+        return response
+
+
+async def _start_exam(exam_id: int, db: AsyncSession, current_user: Principal) -> StartExamResponse:
+    """开考或继续作答，返回开考数据"""
     exam_service = ExamService(db)
-    record, error = exam_service.start_exam(current_user.id, exam_id)
+    exam = await exam_service.get_exam_by_id(exam_id)
+    
+    # 固定组卷读取试卷缓存，开考时无需再查询题目
+    paper = None
+    if exam and exam.status == ExamStatus.PUBLISHED:
+        paper = await paper_cache.get_paper(db, exam)
+    
+    record, error = await exam_service.start_exam(current_user.id, exam_id, paper)
     
     if error:
         raise HTTPException(
@@ -208,31 +248,24 @@ async def start_exam(
             detail=error
         )
     
-    exam = exam_service.get_exam_by_id(exam_id)
-    questions = exam_service.generate_exam_questions(exam)
-    
     # 判断是否练习模式
     is_practice = exam.exam_type == 'practice'
     
-    # 转换题目格式（练习模式包含答案）
-    question_briefs = []
-    for q in questions:
-        options = None
-        if q.options:
-            try:
-                options = json.loads(q.options)
-            except:
-                pass
-        question_briefs.append(QuestionBrief(
-            id=q.id,
-            question_type=q.question_type,
-            title=q.title,
-            options=options,
-            score=q.score,
-            image_url=q.image_url,
-            answer=q.answer if is_practice else None,
-            analysis=q.analysis if is_practice else None
-        ))
+    # 读取本次作答的试卷快照（继续作答时返回同一份试卷）
+    record_paper = await exam_service.get_record_paper(record, exam)
+    if (
+        paper
+        and record_paper["key_version"] == paper["key_version"]
+        and record_paper["question_ids"] == paper["question_ids"]
+    ):
+        # 快照与缓存一致，直接使用预序列化的题目（练习模式包含答案）
+        question_briefs = paper["practice" if is_practice else "student"]
+    else:
+        questions = await exam_service.get_paper_questions(record_paper)
+        question_briefs = [
+            exam_service.question_brief_dict(q, with_answer=is_practice)
+            for q in questions
+        ]
     
     from datetime import timedelta
     end_time = record.start_time + timedelta(minutes=exam.duration)
@@ -249,24 +282,29 @@ async def start_exam(
 @router.post("/submit", response_model=ExamRecordResponse, summary="提交考试")
 async def submit_exam(
     submit_data: SubmitExamRequest,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.EXAM_TAKE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.EXAM_TAKE)
 ):
     """提交考试答案"""
     exam_service = ExamService(db)
     
     # 验证记录属于当前用户
-    record = exam_service.get_exam_record_detail(submit_data.record_id)
+    record = await exam_service.get_exam_record_detail(submit_data.record_id)
     if not record or record.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="无权操作此考试记录"
         )
     
-    # 转换答案格式
+    # 转换答案格式，并与作答过程中自动保存的答案合并
     answers = [{"question_id": a.question_id, "answer": a.answer} for a in submit_data.answers]
+    answers = exam_sessions.merge(await exam_sessions.load(submit_data.record_id), answers)
     
-    record, error = exam_service.submit_exam(submit_data.record_id, answers)
+    # 异步判分模式只保存答案，判分结果通过状态接口轮询
+    if grading_queue.enabled:
+        record, error = await exam_service.accept_submission(submit_data.record_id, answers)
+    else:
+        record, error = await exam_service.submit_exam(submit_data.record_id, answers)
     
     if error:
         raise HTTPException(
@@ -274,7 +312,12 @@ async def submit_exam(
             detail=error
         )
     
-    exam = exam_service.get_exam_by_id(record.exam_id)
+    await exam_sessions.clear(record.id)
+    await recent_writes.mark(current_user.id)
+    if record.status == RecordStatus.SUBMITTED:
+        await grading_queue.enqueue(record.id)
+    
+    exam = await exam_service.get_exam_by_id(record.exam_id)
     
     return ExamRecordResponse(
         id=record.id,
@@ -295,27 +338,120 @@ async def submit_exam(
     )
 
 
+@router.put("/records/{record_id}/answers", summary="自动保存答案")
+async def autosave_answers(
+    record_id: int,
+    autosave_data: AutosaveRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.EXAM_TAKE)
+):
+    """作答过程中逐题保存答案，只写Redis，不访问数据库"""
+    answers = {a.question_id: a.answer for a in autosave_data.answers}
+    owner_id = await exam_sessions.get_owner(record_id)
+    if owner_id is not None and owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权操作此考试记录"
+        )
+    
+    if owner_id is None or not await exam_sessions.save(record_id, answers):
+        # 会话不存在（已过期或开考早于本功能上线），回源数据库校验后重建
+        exam_service = ExamService(db)
+        record = await exam_service.get_exam_record_detail(record_id)
+        if not record or record.user_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="无权操作此考试记录"
+            )
+        if record.status != RecordStatus.IN_PROGRESS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="考试已提交"
+            )
+        exam = await exam_service.get_exam_by_id(record.exam_id)
+        await exam_sessions.open(
+            record.id, current_user.id, exam_sessions.session_ttl(record.start_time, exam.duration)
+        )
+        await exam_sessions.save(record_id, answers)
+    
+    return {"saved": len(answers)}
+
+
+@router.get("/records/{record_id}/answers", response_model=SavedAnswersResponse, summary="获取已保存的答案")
+async def get_saved_answers(
+    record_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.EXAM_TAKE)
+):
+    """继续作答时恢复已自动保存的答案"""
+    owner_id = await exam_sessions.get_owner(record_id)
+    if owner_id is None:
+        record = await ExamService(db).get_exam_record_detail(record_id)
+        if not record or record.user_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="无权查看此记录"
+            )
+    elif owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权查看此记录"
+        )
+    
+    saved = await exam_sessions.load(record_id)
+    return SavedAnswersResponse(
+        record_id=record_id,
+        answers=[{"question_id": q_id, "answer": answer} for q_id, answer in saved.items()]
+    )
+
+
+# ==================== 重新判分 ====================
+
+@router.post("/regrade", response_model=RegradeJobResponse, summary="重新判分")
+async def create_regrade_job(
+    regrade_data: RegradeRequest,
+    current_user: Principal = requires_permission(PermissionCode.EXAM_GRADE)
+):
+    """题目答案修正后，按题目/考试/题库重新判分已交卷的记录（后台执行）"""
+    job = await regrade_jobs.submit(regrade_data.scope, regrade_data.target_id, current_user.id)
+    return job
+
+
+@router.get("/regrade/{job_id}", response_model=RegradeJobResponse, summary="重新判分进度")
+async def get_regrade_job(
+    job_id: str,
+    current_user: Principal = requires_permission(PermissionCode.EXAM_GRADE)
+):
+    """查询重新判分任务进度"""
+    job = await regrade_jobs.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    return job
+
+
 # ==================== 考试记录 ====================
 
 @router.get("/records/my", response_model=ExamRecordListResponse, summary="我的考试记录")
 async def get_my_exam_records(
-    skip: int = Query(0, ge=0),
-    limit: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    page: PageParams = Depends(get_page_params),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """获取当前用户的考试记录"""
+    await recent_writes.route(db, current_user.id)
     exam_service = ExamService(db)
-    records, total = exam_service.get_exam_records(
+    result = await exam_service.get_exam_records(
         user_id=current_user.id,
-        skip=skip,
-        limit=limit
+        page=page
     )
     
     # 添加考试标题
     items = []
-    for record in records:
-        exam = exam_service.get_exam_by_id(record.exam_id)
+    for record in result.items:
+        exam = await exam_service.get_exam_by_id(record.exam_id)
         items.append(ExamRecordResponse(
             id=record.id,
             user_id=record.user_id,
@@ -334,20 +470,56 @@ async def get_my_exam_records(
             created_at=record.created_at
         ))
     
-    return ExamRecordListResponse(total=total, items=items)
+    return ExamRecordListResponse(
+        total=result.total, items=items, has_more=result.has_more, next_cursor=result.next_cursor
+    )
+
+
+@router.get("/records/{record_id}/status", response_model=ExamRecordStatusResponse, summary="考试记录判分状态")
+async def get_exam_record_status(
+    record_id: int,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """查询考试记录判分状态，异步判分模式下交卷后轮询该接口"""
+    await recent_writes.route(db, current_user.id)
+    exam_service = ExamService(db)
+    record = await exam_service.get_exam_record_detail(record_id)
+    if not record:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="记录不存在"
+        )
+    
+    if record.user_id != current_user.id and not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权查看此记录"
+        )
+    
+    graded = record.status == RecordStatus.GRADED
+    return ExamRecordStatusResponse(
+        record_id=record.id,
+        status=record.status,
+        score=record.score if graded else None,
+        is_passed=record.is_passed if graded else None,
+        submit_time=record.submit_time
+    )
 
 
 @router.get("/records/{record_id}", response_model=ExamRecordDetail, summary="考试记录详情")
 async def get_exam_record_detail(
     record_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """获取考试记录详情（含答题详情）"""
+    # 交卷后立即查看详情时副本可能尚未同步
+    await recent_writes.route(db, current_user.id)
     exam_service = ExamService(db)
     question_service = QuestionService(db)
     
-    record = exam_service.get_exam_record_detail(record_id)
+    record = await exam_service.get_exam_record_detail(record_id, with_answers=True)
     if not record:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -361,12 +533,18 @@ async def get_exam_record_detail(
             detail="无权查看此记录"
         )
     
-    exam = exam_service.get_exam_by_id(record.exam_id)
+    exam = await exam_service.get_exam_by_id(record.exam_id)
+    
+    # 按试卷快照一次性加载题目，答题详情按试卷顺序排列
+    paper = await exam_service.get_record_paper(record, exam)
+    question_map = {q.id: q for q in await exam_service.get_paper_questions(paper)}
+    paper_order = {q_id: i for i, q_id in enumerate(paper["question_ids"])}
+    answers = sorted(record.answers, key=lambda a: paper_order.get(a.question_id, len(paper_order)))
     
     # 获取答题详情
     answer_details = []
-    for answer in record.answers:
-        question = question_service.get_question_by_id(answer.question_id)
+    for answer in answers:
+        question = question_map.get(answer.question_id) or await question_service.get_question_by_id(answer.question_id)
         if question:
             # 处理选项
             options = None
@@ -426,27 +604,26 @@ async def get_exam_record_detail(
 
 @router.get("/wrong/list", response_model=WrongQuestionListResponse, summary="错题列表")
 async def get_wrong_questions(
-    skip: int = Query(0, ge=0),
-    limit: int = Query(20, ge=1, le=100),
+    page: PageParams = Depends(get_page_params),
     is_mastered: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """获取错题列表"""
+    await recent_writes.route(db, current_user.id)
     exam_service = ExamService(db)
     question_service = QuestionService(db)
     
-    wrongs, total = exam_service.get_wrong_questions(
+    result = await exam_service.get_wrong_questions(
         user_id=current_user.id,
-        skip=skip,
-        limit=limit,
+        page=page,
         is_mastered=is_mastered
     )
     
     # 添加题目详情
     items = []
-    for wrong in wrongs:
-        question = question_service.get_question_by_id(wrong.question_id)
+    for wrong in result.items:
+        question = await question_service.get_question_by_id(wrong.question_id)
         if question:
             options = None
             if question.options:
@@ -486,21 +663,23 @@ async def get_wrong_questions(
                 updated_at=wrong.updated_at
             ))
     
-    return WrongQuestionListResponse(total=total, items=items)
+    return WrongQuestionListResponse(
+        total=result.total, items=items, has_more=result.has_more, next_cursor=result.next_cursor
+    )
 
 
 @router.put("/wrong/{wrong_id}", summary="更新错题状态")
 async def update_wrong_question(
     wrong_id: int,
     update_data: WrongQuestionUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """更新错题状态（标记已掌握/添加笔记）"""
     exam_service = ExamService(db)
     
     if update_data.is_mastered is not None:
-        success = exam_service.mark_mastered(
+        success = await exam_service.mark_mastered(
             current_user.id, 
             wrong_id, 
             update_data.is_mastered
@@ -510,5 +689,6 @@ async def update_wrong_question(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="错题记录不存在"
             )
+        await recent_writes.mark(current_user.id)
     
     return {"message": "更新成功"}
@@ -3,6 +3,7 @@
 """
 import os
 import uuid
+import functools
 import aiofiles
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query
 from sqlalchemy.orm import Session
@@ -10,10 +11,13 @@ from typing import Optional
 
 from app.database import get_db
 from app.config import settings
-from app.services.import_service import ImportService
+from app.services.import_service import ImportService, load_bank_list, delete_bank_by_id
+from app.services.query_cache import query_cache
+from app.services.paper_cache import paper_cache
+from app.services.task_executor import task_executor
 from app.schemas.question import ImportResult, QuestionBankResponse, QuestionBankListResponse
 from app.api.deps import get_current_user, requires_permission
-from app.models.user import User
+from app.services.principal_cache import Principal
 from app.models.permission import PermissionCode
 
 
@@ -60,7 +64,7 @@ async def save_upload_file(upload_file: UploadFile, allowed_extensions: list) ->
 async def import_from_excel(
     file: UploadFile = File(..., description="Excel文件(.xlsx)"),
     db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_IMPORT)
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_IMPORT)
 ):
     """
     从Excel文件导入题库
@@ -76,7 +80,7 @@ async def import_from_excel(
     
     try:
         import_service = ImportService(db)
-        result = import_service.import_from_excel(file_path, current_user.id)
+        result = await import_service.import_from_excel(file_path, current_user.id)
         return result
     finally:
         # 清理临时文件
@@ -89,7 +93,7 @@ async def import_from_word(
     file: UploadFile = File(..., description="Word文件(.docx)"),
     bank_name: str = Form(..., description="题库名称"),
     db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_IMPORT)
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_IMPORT)
 ):
     """
     从Word文件导入题库
@@ -111,7 +115,7 @@ async def import_from_word(
     
     try:
         import_service = ImportService(db)
-        result = import_service.import_from_word(file_path, bank_name.strip(), current_user.id)
+        result = await import_service.import_from_word(file_path, bank_name.strip(), current_user.id)
         return result
     finally:
         if os.path.exists(file_path):
@@ -122,7 +126,7 @@ async def import_from_word(
 async def import_from_image(
     file: UploadFile = File(..., description="图片文件(.jpg/.png)"),
     db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_IMPORT)
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_IMPORT)
 ):
     """
     从图片OCR识别导入题库
@@ -138,7 +142,7 @@ async def import_from_image(
     
     try:
         import_service = ImportService(db)
-        result = import_service.import_from_image(file_path, current_user.id)
+        result = await import_service.import_from_image(file_path, current_user.id)
         return result
     finally:
         if os.path.exists(file_path):
@@ -149,7 +153,7 @@ async def import_from_image(
 async def ocr_preview(
     file: UploadFile = File(..., description="图片文件(.jpg/.png)"),
     db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_IMPORT)
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_IMPORT)
 ):
     """
     OCR识别预览
@@ -160,7 +164,7 @@ async def ocr_preview(
     
     try:
         import_service = ImportService(db)
-        result = import_service.ocr_preview(file_path)
+        result = await import_service.ocr_preview(file_path)
         return result
     finally:
         if os.path.exists(file_path):
@@ -172,7 +176,7 @@ async def import_from_pdf(
     file: UploadFile = File(..., description="PDF文件(.pdf)"),
     bank_name: str = Form(..., description="题库名称"),
     db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_IMPORT)
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_IMPORT)
 ):
     """
     从PDF文件导入题库
@@ -194,7 +198,7 @@ async def import_from_pdf(
     
     try:
         import_service = ImportService(db)
-        result = import_service.import_from_pdf(file_path, bank_name.strip(), current_user.id)
+        result = await import_service.import_from_pdf(file_path, bank_name.strip(), current_user.id)
         return result
     finally:
         if os.path.exists(file_path):
@@ -205,7 +209,7 @@ async def import_from_pdf(
 async def pdf_preview(
     file: UploadFile = File(..., description="PDF文件(.pdf)"),
     db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_IMPORT)
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_IMPORT)
 ):
     """
     PDF识别预览
@@ -216,7 +220,7 @@ async def pdf_preview(
     
     try:
         import_service = ImportService(db)
-        result = import_service.pdf_preview(file_path)
+        result = await import_service.pdf_preview(file_path)
         return result
     finally:
         if os.path.exists(file_path):
@@ -282,24 +286,24 @@ async def download_excel_template():
 async def get_banks(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """获取所有题库列表"""
-    import_service = ImportService(db)
-    result = import_service.get_banks(skip, limit)
-    return result
+    loader = functools.partial(task_executor.run_io, load_bank_list, skip, limit)
+    return await query_cache.get_or_load(
+        f"banks:{skip}:{limit}", loader, ttl=60, tags=("bank", "question"), stale_ttl=300
+    )
 
 
 @router.get("/banks/{bank_id}", response_model=QuestionBankResponse, summary="获取题库详情")
 async def get_bank(
     bank_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """获取单个题库详情"""
     import_service = ImportService(db)
-    bank = import_service.get_bank(bank_id)
+    bank = await task_executor.run_io(import_service.get_bank, bank_id)
     if not bank:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -311,15 +315,17 @@ async def get_bank(
 @router.delete("/banks/{bank_id}", summary="删除题库")
 async def delete_bank(
     bank_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_DELETE)
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_DELETE)
 ):
     """删除题库及其所有题目"""
-    import_service = ImportService(db)
-    success = import_service.delete_bank(bank_id)
-    if not success:
+    # 独立会话写库，开始后等待完成
+    exam_ids = await task_executor.run_io(delete_bank_by_id, bank_id, timeout=0)
+    if exam_ids is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="题库不存在"
         )
+    await query_cache.invalidate_tags(f"bank:{bank_id}", "question:*")
+    # 试卷中引用了该题库题目的固定试卷缓存失效
+    await paper_cache.invalidate_many(exam_ids)
     return {"message": "删除成功"}
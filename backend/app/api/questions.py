@@ -3,17 +3,21 @@
 """
 from typing import Optional, List, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_async_db, get_read_db
 from app.services.question_service import QuestionService
+from app.services.exam_service import ExamService
+from app.services.paper_cache import paper_cache
+from app.services.question_counters import question_counters
 from app.schemas.question import (
     QuestionCreate, QuestionUpdate, QuestionResponse, QuestionListResponse,
     KnowledgePointCreate, KnowledgePointUpdate, KnowledgePointResponse,
     KnowledgePointTree
 )
-from app.api.deps import get_current_user, requires_permission
-from app.models.user import User
+from app.api.deps import get_current_user, requires_permission, get_admin_page_params
+from app.services.pagination import PageParams
+from app.services.principal_cache import Principal
 from app.models.permission import PermissionCode
 
 
@@ -24,22 +28,20 @@ router = APIRouter()
 
 @router.get("", response_model=QuestionListResponse, summary="获取题目列表")
 async def get_questions(
-    skip: int = Query(0, ge=0),
-    limit: int = Query(20, ge=1, le=100),
+    page: PageParams = Depends(get_admin_page_params),
     keyword: Optional[str] = None,
     question_type: Optional[str] = None,
     difficulty: Optional[str] = None,
     knowledge_id: Optional[int] = None,
     is_active: Optional[int] = None,
     bank_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_VIEW)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_VIEW)
 ):
     """获取题目列表"""
     question_service = QuestionService(db)
-    questions, total = question_service.get_questions(
-        skip=skip,
-        limit=limit,
+    result = await question_service.get_questions(
+        page=page,
         keyword=keyword,
         question_type=question_type,
         difficulty=difficulty,
@@ -47,6 +49,10 @@ async def get_questions(
         is_active=is_active,
         bank_id=bank_id
     )
+    questions = result.items
+    
+    # 使用次数/正确次数叠加尚未写库的增量
+    await question_counters.apply_pending(questions)
     
     # 处理选项JSON
     for q in questions:
@@ -57,28 +63,30 @@ async def get_questions(
             except:
                 pass
     
-    return QuestionListResponse(total=total, items=questions)
+    return QuestionListResponse(
+        total=result.total, items=questions, has_more=result.has_more, next_cursor=result.next_cursor
+    )
 
 
 @router.get("/statistics", summary="获取题库统计")
 async def get_question_statistics(
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_VIEW)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_VIEW)
 ):
     """获取题库统计信息"""
     question_service = QuestionService(db)
-    return question_service.get_question_statistics()
+    return await question_service.get_question_statistics()
 
 
 @router.get("/{question_id}", response_model=QuestionResponse, summary="获取题目详情")
 async def get_question(
     question_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_VIEW)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_VIEW)
 ):
     """获取题目详情"""
     question_service = QuestionService(db)
-    question = question_service.get_question_by_id(question_id)
+    question = await question_service.get_question_by_id(question_id)
     
     if not question:
         raise HTTPException(
@@ -86,6 +94,8 @@ async def get_question(
             detail="题目不存在"
         )
     
+    await question_counters.apply_pending([question])
+    
     # 处理选项JSON
     if question.options:
         import json
@@ -100,12 +110,12 @@ async def get_question(
 @router.post("", response_model=QuestionResponse, summary="创建题目")
 async def create_question(
     question_data: QuestionCreate,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_CREATE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_CREATE)
 ):
     """创建题目"""
     question_service = QuestionService(db)
-    question = question_service.create_question(question_data, current_user.id)
+    question = await question_service.create_question(question_data, current_user.id)
     
     # 处理选项JSON
     if question.options:
@@ -121,12 +131,12 @@ async def create_question(
 @router.post("/batch", summary="批量创建题目")
 async def create_questions_batch(
     questions_data: List[QuestionCreate],
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_CREATE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_CREATE)
 ):
     """批量创建题目"""
     question_service = QuestionService(db)
-    questions = question_service.create_questions_batch(questions_data, current_user.id)
+    questions = await question_service.create_questions_batch(questions_data, current_user.id)
     
     return {
         "message": f"成功创建{len(questions)}道题目",
@@ -138,12 +148,12 @@ async def create_questions_batch(
 async def update_question(
     question_id: int,
     question_data: QuestionUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_UPDATE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_UPDATE)
 ):
     """更新题目"""
     question_service = QuestionService(db)
-    question = question_service.update_question(question_id, question_data)
+    question = await question_service.update_question(question_id, question_data)
     
     if not question:
         raise HTTPException(
@@ -151,6 +161,9 @@ async def update_question(
             detail="题目不存在"
         )
     
+    # 包含该题的固定试卷缓存失效
+    await paper_cache.invalidate_many(await ExamService(db).get_exam_ids_by_question(question_id))
+    
     # 处理选项JSON
     if question.options:
         import json
@@ -164,24 +177,26 @@ async def update_question(
 
 @router.delete("/all", summary="删除所有题目")
 async def delete_all_questions(
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_DELETE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_DELETE)
 ):
     """删除所有题目（清空题库）"""
     question_service = QuestionService(db)
-    count = question_service.delete_all_questions()
+    count = await question_service.delete_all_questions()
     return {"message": f"已删除{count}道题目", "count": count}
 
 
 @router.delete("/{question_id}", summary="删除题目")
 async def delete_question(
     question_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.QUESTION_DELETE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.QUESTION_DELETE)
 ):
     """删除题目"""
     question_service = QuestionService(db)
-    success = question_service.delete_question(question_id)
+    # 删除前记录包含该题的固定试卷，删除后使其缓存失效
+    exam_ids = await ExamService(db).get_exam_ids_by_question(question_id)
+    success = await question_service.delete_question(question_id)
     
     if not success:
         raise HTTPException(
@@ -189,6 +204,8 @@ async def delete_question(
             detail="题目不存在"
         )
     
+    await paper_cache.invalidate_many(exam_ids)
+    
     return {"message": "删除成功"}
 
 
@@ -196,47 +213,47 @@ async def delete_question(
 
 @router.get("/knowledge/tree", summary="获取知识点树")
 async def get_knowledge_tree(
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.KNOWLEDGE_VIEW)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.KNOWLEDGE_VIEW)
 ):
     """获取知识点树形结构"""
     question_service = QuestionService(db)
-    return question_service.get_knowledge_tree()
+    return await question_service.get_knowledge_tree()
 
 
 @router.get("/knowledge/list", response_model=List[KnowledgePointResponse], summary="获取知识点列表")
 async def get_knowledge_points(
     parent_id: Optional[int] = None,
     is_active: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.KNOWLEDGE_VIEW)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = requires_permission(PermissionCode.KNOWLEDGE_VIEW)
 ):
     """获取知识点列表"""
     question_service = QuestionService(db)
-    return question_service.get_knowledge_points(parent_id, is_active)
+    return await question_service.get_knowledge_points(parent_id, is_active)
 
 
 @router.post("/knowledge", response_model=KnowledgePointResponse, summary="创建知识点")
 async def create_knowledge_point(
     kp_data: KnowledgePointCreate,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.KNOWLEDGE_CREATE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.KNOWLEDGE_CREATE)
 ):
     """创建知识点"""
     question_service = QuestionService(db)
-    return question_service.create_knowledge_point(kp_data)
+    return await question_service.create_knowledge_point(kp_data)
 
 
 @router.put("/knowledge/{kp_id}", response_model=KnowledgePointResponse, summary="更新知识点")
 async def update_knowledge_point(
     kp_id: int,
     kp_data: KnowledgePointUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.KNOWLEDGE_UPDATE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.KNOWLEDGE_UPDATE)
 ):
     """更新知识点"""
     question_service = QuestionService(db)
-    kp = question_service.update_knowledge_point(kp_id, kp_data)
+    kp = await question_service.update_knowledge_point(kp_id, kp_data)
     
     if not kp:
         raise HTTPException(
@@ -250,12 +267,12 @@ async def update_knowledge_point(
 @router.delete("/knowledge/{kp_id}", summary="删除知识点")
 async def delete_knowledge_point(
     kp_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.KNOWLEDGE_DELETE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.KNOWLEDGE_DELETE)
 ):
     """删除知识点"""
     question_service = QuestionService(db)
-    success = question_service.delete_knowledge_point(kp_id)
+    success = await question_service.delete_knowledge_point(kp_id)
     
     if not success:
         raise HTTPException(
@@ -1,102 +1,129 @@
 """
 楚然智考系统 - 统计分析API路由
 """
-from typing import Optional
+from datetime import date, datetime, timedelta
+from typing import Optional, Dict
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 
-from app.database import get_db
+from app.database import get_read_db
+from app.models.user import User as UserModel
+from app.models.exam import ExamRecord, StudyRecord
 from app.services.exam_service import ExamService
 from app.schemas.exam import StudyStatistics, StudyTrend
 from app.api.deps import get_current_user, requires_permission
-from app.models.user import User
+from app.services.principal_cache import Principal
 from app.models.permission import PermissionCode
 
 
 router = APIRouter()
 
 
+def overview_date_range_queries(today: date) -> Dict[str, Select]:
+    """
+    系统概览中按日期统计的查询（benchmarks/explain_date_ranges.py 对同一组语句检查执行计划）
+    日期条件一律写成左闭右开的时间区间，不对列套 DATE()，才能使用索引
+    """
+    today_start = datetime.combine(today, datetime.min.time())
+    tomorrow_start = today_start + timedelta(days=1)
+    week_start = today_start - timedelta(days=6)
+    return {
+        # 今日新增用户
+        "new_users_today": select(func.count(UserModel.id)).where(
+            UserModel.created_at >= today_start,
+            UserModel.created_at < tomorrow_start
+        ),
+        # 今日考试记录
+        "today_records": select(func.count(ExamRecord.id)).where(
+            ExamRecord.created_at >= today_start,
+            ExamRecord.created_at < tomorrow_start
+        ),
+        # 今日活跃用户
+        "today_active": select(func.count(func.distinct(StudyRecord.user_id))).where(
+            StudyRecord.study_date >= today_start,
+            StudyRecord.study_date < tomorrow_start
+        ),
+        # 最近7天考试记录趋势
+        "daily_records": select(
+            func.date(ExamRecord.created_at).label('date'),
+            func.count(ExamRecord.id).label('count')
+        ).where(
+            ExamRecord.created_at >= week_start,
+            ExamRecord.created_at < tomorrow_start
+        ).group_by(
+            func.date(ExamRecord.created_at)
+        ),
+    }
+
+
 @router.get("/study", response_model=StudyStatistics, summary="学习统计")
 async def get_study_statistics(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """获取当前用户的学习统计"""
     exam_service = ExamService(db)
-    return exam_service.get_study_statistics(current_user.id)
+    return await exam_service.get_study_statistics(current_user.id)
 
 
 @router.get("/study/trend", response_model=StudyTrend, summary="学习趋势")
 async def get_study_trend(
     days: int = Query(30, ge=7, le=90, description="统计天数"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """获取学习趋势数据"""
     exam_service = ExamService(db)
-    return exam_service.get_study_trend(current_user.id, days)
+    return await exam_service.get_study_trend(current_user.id, days)
 
 
 @router.get("/overview", summary="系统概览统计")
 async def get_system_overview(
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.STATS_VIEW)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = requires_permission(PermissionCode.STATS_VIEW)
 ):
     """
     获取系统概览统计（管理员）
     包含：用户数、题目数、考试数、今日活跃等
     """
-    from sqlalchemy import func
-    from datetime import datetime, timedelta
-    from app.models.user import User as UserModel
     from app.models.question import Question
-    from app.models.exam import Exam, ExamRecord, StudyRecord
+    from app.models.exam import Exam
     
     today = datetime.now().date()
+    date_queries = overview_date_range_queries(today)
     
     # 用户统计
-    total_users = db.query(func.count(UserModel.id)).scalar()
-    active_users = db.query(func.count(UserModel.id)).filter(
+    total_users = await db.scalar(select(func.count(UserModel.id)))
+    active_users = await db.scalar(select(func.count(UserModel.id)).where(
         UserModel.is_active == True
-    ).scalar()
+    ))
     
     # 今日新增用户
-    new_users_today = db.query(func.count(UserModel.id)).filter(
-        func.date(UserModel.created_at) == today
-    ).scalar()
+    new_users_today = await db.scalar(date_queries["new_users_today"])
     
     # 题目统计
-    total_questions = db.query(func.count(Question.id)).filter(
+    total_questions = await db.scalar(select(func.count(Question.id)).where(
         Question.is_active == 1
-    ).scalar()
+    ))
     
     # 考试统计
-    total_exams = db.query(func.count(Exam.id)).scalar()
-    published_exams = db.query(func.count(Exam.id)).filter(
+    total_exams = await db.scalar(select(func.count(Exam.id)))
+    published_exams = await db.scalar(select(func.count(Exam.id)).where(
         Exam.status == "published"
-    ).scalar()
+    ))
     
     # 考试记录统计
-    total_records = db.query(func.count(ExamRecord.id)).scalar()
-    today_records = db.query(func.count(ExamRecord.id)).filter(
-        func.date(ExamRecord.created_at) == today
-    ).scalar()
+    total_records = await db.scalar(select(func.count(ExamRecord.id)))
+    today_records = await db.scalar(date_queries["today_records"])
     
     # 今日活跃用户
-    today_active = db.query(func.count(func.distinct(StudyRecord.user_id))).filter(
-        func.date(StudyRecord.study_date) == today
-    ).scalar()
+    today_active = await db.scalar(date_queries["today_active"])
     
     # 最近7天趋势
     week_ago = today - timedelta(days=6)
-    daily_records = db.query(
-        func.date(ExamRecord.created_at).label('date'),
-        func.count(ExamRecord.id).label('count')
-    ).filter(
-        func.date(ExamRecord.created_at) >= week_ago
-    ).group_by(
-        func.date(ExamRecord.created_at)
-    ).all()
+    daily_records = (await db.execute(date_queries["daily_records"])).all()
     
     # 构建7天数据
     record_trend = {}
@@ -140,17 +167,17 @@ async def get_system_overview(
 @router.get("/exam/{exam_id}", summary="考试统计")
 async def get_exam_statistics(
     exam_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.STATS_VIEW)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = requires_permission(PermissionCode.STATS_VIEW)
 ):
     """
     获取指定考试的统计数据
     包含：参与人数、平均分、及格率、分数分布等
     """
-    from sqlalchemy import func
+    from sqlalchemy import func, select
     from app.models.exam import Exam, ExamRecord, RecordStatus
     
-    exam = db.query(Exam).filter(Exam.id == exam_id).first()
+    exam = await db.get(Exam, exam_id)
     if not exam:
         from fastapi import HTTPException, status
         raise HTTPException(
@@ -159,12 +186,12 @@ async def get_exam_statistics(
         )
     
     # 基础统计
-    records = db.query(ExamRecord).filter(
+    graded = (
         ExamRecord.exam_id == exam_id,
         ExamRecord.status == RecordStatus.GRADED
     )
     
-    total_participants = records.count()
+    total_participants = await db.scalar(select(func.count(ExamRecord.id)).where(*graded))
     
     if total_participants == 0:
         return {
@@ -180,16 +207,13 @@ async def get_exam_statistics(
         }
     
     # 分数统计
-    stats = db.query(
+    stats = (await db.execute(select(
         func.avg(ExamRecord.score).label('avg_score'),
         func.max(ExamRecord.score).label('max_score'),
         func.min(ExamRecord.score).label('min_score'),
         func.avg(ExamRecord.duration).label('avg_duration'),
         func.sum(ExamRecord.is_passed).label('pass_count')
-    ).filter(
-        ExamRecord.exam_id == exam_id,
-        ExamRecord.status == RecordStatus.GRADED
-    ).first()
+    ).where(*graded))).first()
     
     pass_rate = (stats.pass_count / total_participants * 100) if total_participants > 0 else 0
     
@@ -204,12 +228,11 @@ async def get_exam_statistics(
     
     score_distribution = []
     for low, high, label in score_ranges:
-        count = db.query(func.count(ExamRecord.id)).filter(
-            ExamRecord.exam_id == exam_id,
-            ExamRecord.status == RecordStatus.GRADED,
+        count = await db.scalar(select(func.count(ExamRecord.id)).where(
+            *graded,
             ExamRecord.score >= low,
             ExamRecord.score < high
-        ).scalar()
+        ))
         score_distribution.append({
             "range": label,
             "count": count
@@ -226,3 +249,30 @@ async def get_exam_statistics(
         "average_duration": int(stats.avg_duration or 0),
         "score_distribution": score_distribution
     }
+
+
+@router.get("/executor", summary="任务执行器运行指标")
+async def get_executor_statistics(
+    current_user: Principal = requires_permission(PermissionCode.STATS_VIEW)
+):
+    """
+    获取当前worker进程的任务执行器指标
+    包含：进程池/线程池的排队数、完成数、失败数、超时数、拒绝数、平均耗时等
+    """
+    from app.services.task_executor import task_executor
+    
+    return task_executor.stats()
+
+
+@router.get("/redis", summary="Redis客户端运行指标")
+async def get_redis_statistics(
+    current_user: Principal = requires_permission(PermissionCode.STATS_VIEW)
+):
+    """
+    获取当前worker进程的Redis客户端指标
+    包含：运行模式、连接池上限/已创建/使用中/空闲连接数、命令数、批量管道数、降级次数，
+    以及内存缓存的键数量、估算字节数、命中/未命中/淘汰/过期次数
+    """
+    from app.redis_client import redis_client
+    
+    return redis_client.stats()
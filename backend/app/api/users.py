@@ -3,17 +3,18 @@
 """
 from typing import Optional, List
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_async_db, get_read_db
 from app.services.user_service import UserService
 from app.schemas.user import (
     UserCreate, UserUpdate, UserResponse, UserListResponse,
     UserPasswordUpdate, RoleCreate, RoleUpdate, RoleResponse,
     PermissionResponse
 )
-from app.api.deps import get_current_user, requires_permission
-from app.models.user import User
+from app.api.deps import get_current_user, requires_permission, get_admin_page_params
+from app.services.pagination import PageParams
+from app.services.principal_cache import Principal
 from app.models.permission import PermissionCode
 
 
@@ -24,36 +25,36 @@ router = APIRouter()
 
 @router.get("", response_model=UserListResponse, summary="获取用户列表")
 async def get_users(
-    skip: int = Query(0, ge=0),
-    limit: int = Query(20, ge=1, le=100),
+    page: PageParams = Depends(get_admin_page_params),
     keyword: Optional[str] = None,
     role_id: Optional[int] = None,
     is_active: Optional[bool] = None,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.USER_VIEW)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = requires_permission(PermissionCode.USER_VIEW)
 ):
     """获取用户列表（需要用户查看权限）"""
     user_service = UserService(db)
-    users, total = user_service.get_users(
-        skip=skip,
-        limit=limit,
+    result = await user_service.get_users(
+        page=page,
         keyword=keyword,
         role_id=role_id,
         is_active=is_active
     )
     
-    return UserListResponse(total=total, items=users)
+    return UserListResponse(
+        total=result.total, items=result.items, has_more=result.has_more, next_cursor=result.next_cursor
+    )
 
 
 @router.get("/{user_id}", response_model=UserResponse, summary="获取用户详情")
 async def get_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.USER_VIEW)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.USER_VIEW)
 ):
     """获取用户详情"""
     user_service = UserService(db)
-    user = user_service.get_user_by_id(user_id)
+    user = await user_service.get_user_by_id(user_id)
     
     if not user:
         raise HTTPException(
@@ -67,27 +68,27 @@ async def get_user(
 @router.post("", response_model=UserResponse, summary="创建用户")
 async def create_user(
     user_data: UserCreate,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.USER_CREATE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.USER_CREATE)
 ):
     """创建用户（需要用户创建权限）"""
     user_service = UserService(db)
     
     # 检查用户名是否存在
-    if user_service.get_user_by_username(user_data.username):
+    if await user_service.get_user_by_username(user_data.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="用户名已存在"
         )
     
     # 检查手机号是否存在
-    if user_data.phone and user_service.get_user_by_phone(user_data.phone):
+    if user_data.phone and await user_service.get_user_by_phone(user_data.phone):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="手机号已注册"
         )
     
-    user = user_service.create_user(user_data)
+    user = await user_service.create_user(user_data)
     return user
 
 
@@ -95,12 +96,12 @@ async def create_user(
 async def update_user(
     user_id: int,
     user_data: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.USER_UPDATE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.USER_UPDATE)
 ):
     """更新用户（需要用户编辑权限）"""
     user_service = UserService(db)
-    user = user_service.update_user(user_id, user_data)
+    user = await user_service.update_user(user_id, user_data)
     
     if not user:
         raise HTTPException(
@@ -114,8 +115,8 @@ async def update_user(
 @router.delete("/{user_id}", summary="删除用户")
 async def delete_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.USER_DELETE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.USER_DELETE)
 ):
     """删除用户（需要用户删除权限）"""
     user_service = UserService(db)
@@ -126,7 +127,7 @@ async def delete_user(
             detail="不能删除自己"
         )
     
-    success = user_service.delete_user(user_id)
+    success = await user_service.delete_user(user_id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -140,12 +141,12 @@ async def delete_user(
 async def assign_user_roles(
     user_id: int,
     role_ids: List[int],
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.USER_UPDATE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.USER_UPDATE)
 ):
     """分配用户角色"""
     user_service = UserService(db)
-    success = user_service.assign_roles(user_id, role_ids)
+    success = await user_service.assign_roles(user_id, role_ids)
     
     if not success:
         raise HTTPException(
@@ -159,12 +160,12 @@ async def assign_user_roles(
 @router.put("/me/password", summary="修改密码")
 async def change_password(
     password_data: UserPasswordUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """修改当前用户密码"""
     user_service = UserService(db)
-    success, message = user_service.change_password(
+    success, message = await user_service.change_password(
         current_user.id,
         password_data.old_password,
         password_data.new_password
@@ -182,8 +183,8 @@ async def change_password(
 @router.put("/me/profile", response_model=UserResponse, summary="更新个人信息")
 async def update_profile(
     user_data: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """更新当前用户个人信息"""
     user_service = UserService(db)
@@ -193,7 +194,7 @@ async def update_profile(
     update_data = user_data.model_dump(exclude_unset=True)
     filtered_data = {k: v for k, v in update_data.items() if k in allowed_fields}
     
-    user = user_service.update_user(current_user.id, UserUpdate(**filtered_data))
+    user = await user_service.update_user(current_user.id, UserUpdate(**filtered_data))
     return user
 
 
@@ -201,24 +202,24 @@ async def update_profile(
 
 @router.get("/roles/list", response_model=List[RoleResponse], summary="获取角色列表")
 async def get_roles(
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.ROLE_VIEW)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = requires_permission(PermissionCode.ROLE_VIEW)
 ):
     """获取角色列表"""
     user_service = UserService(db)
-    roles, _ = user_service.get_roles()
+    roles, _ = await user_service.get_roles()
     return roles
 
 
 @router.post("/roles", response_model=RoleResponse, summary="创建角色")
 async def create_role(
     role_data: RoleCreate,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.ROLE_CREATE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.ROLE_CREATE)
 ):
     """创建角色"""
     user_service = UserService(db)
-    role = user_service.create_role(role_data)
+    role = await user_service.create_role(role_data)
     return role
 
 
@@ -226,12 +227,12 @@ async def create_role(
 async def update_role(
     role_id: int,
     role_data: RoleUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.ROLE_UPDATE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.ROLE_UPDATE)
 ):
     """更新角色"""
     user_service = UserService(db)
-    role = user_service.update_role(role_id, role_data)
+    role = await user_service.update_role(role_id, role_data)
     
     if not role:
         raise HTTPException(
@@ -245,12 +246,12 @@ async def update_role(
 @router.delete("/roles/{role_id}", summary="删除角色")
 async def delete_role(
     role_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.ROLE_DELETE)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.ROLE_DELETE)
 ):
     """删除角色"""
     user_service = UserService(db)
-    success = user_service.delete_role(role_id)
+    success = await user_service.delete_role(role_id)
     
     if not success:
         raise HTTPException(
@@ -265,10 +266,10 @@ async def delete_role(
 
 @router.get("/permissions/list", response_model=List[PermissionResponse], summary="获取权限列表")
 async def get_permissions(
-    db: Session = Depends(get_db),
-    current_user: User = requires_permission(PermissionCode.ROLE_VIEW)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = requires_permission(PermissionCode.ROLE_VIEW)
 ):
     """获取所有权限"""
     user_service = UserService(db)
-    permissions = user_service.get_permissions()
+    permissions = await user_service.get_permissions()
     return permissions
@@ -2,10 +2,26 @@
 楚然智考系统 - 数据库连接模块
 """
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
 from app.config import settings
 
+# 同步驱动 -> 异步驱动
+ASYNC_DRIVERS = {
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    """同步数据库URL转为对应的异步驱动URL（库名、参数不变）"""
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
 # 创建数据库引擎
 engine = create_engine(
     settings.DATABASE_URL,
@@ -19,13 +35,65 @@ engine = create_engine(
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步数据库引擎（请求处理与后台任务使用，不占用线程池）
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL or to_async_url(settings.DATABASE_URL),
+    pool_pre_ping=True,
+    pool_size=10,
+    max_overflow=20,
+    pool_recycle=3600,
+    echo=settings.DEBUG
+)
+
+# 异步会话工厂：提交后不过期对象，避免在事件循环中触发隐式懒加载
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# 只读副本（未配置时读写都走主库）
+READ_REPLICA_ENABLED = bool(settings.DATABASE_READ_URL)
+read_async_engine = create_async_engine(
+    to_async_url(settings.DATABASE_READ_URL),
+    pool_pre_ping=True,
+    pool_size=10,
+    max_overflow=20,
+    pool_recycle=3600,
+    echo=settings.DEBUG
+) if READ_REPLICA_ENABLED else async_engine
+
+# 会话 info 中的标记：之后的查询都走主库
+USE_PRIMARY = "use_primary"
+
+
+class RoutingSession(Session):
+    """
+    读写分离会话：普通查询走只读副本；
+    写入（flush、INSERT/UPDATE/DELETE、原生SQL）和加锁查询走主库，
+    之后同一会话内的查询也走主库，保证读到本会话的写入
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if not self.info.get(USE_PRIMARY) and not self._flushing and clause is not None \
+                and clause.is_select and getattr(clause, "_for_update_arg", None) is None:
+            return read_async_engine.sync_engine
+        self.info[USE_PRIMARY] = True
+        return async_engine.sync_engine
+
+
+# 读会话工厂：统计、列表等只读接口使用
+ReadSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False
+) if READ_REPLICA_ENABLED else AsyncSessionLocal
+
 # 创建基类
 Base = declarative_base()
 
 
 def get_db():
     """
-    获取数据库会话的依赖注入函数
+    获取同步数据库会话的依赖注入函数（题库导入等同步流程使用）
     使用yield确保会话在请求结束后正确关闭
     """
     db = SessionLocal()
@@ -35,6 +103,29 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """
+    获取异步数据库会话的依赖注入函数
+    同一请求内的依赖共享同一个会话
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_read_db():
+    """
+    获取读会话的依赖注入函数（配置只读副本时查询走副本，写入仍走主库）
+    副本有复制延迟，需要读到刚写入数据的场景先调用 use_primary
+    """
+    async with ReadSessionLocal() as db:
+        yield db
+
+
+def use_primary(db: AsyncSession):
+    """读会话之后的查询改走主库"""
+    db.sync_session.info[USE_PRIMARY] = True
+
+
 def init_db():
     """
     初始化数据库，创建所有表
@@ -2,8 +2,9 @@
 楚然智考系统 - FastAPI主应用
 """
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from loguru import logger
 import os
@@ -11,6 +12,13 @@ import os
 from app.config import settings
 from app.database import init_db
 from app.redis_client import redis_client
+from app.services.question_counters import question_counters
+from app.services.grading_queue import grading_queue
+from app.services.exam_sweeper import exam_sweeper
+from app.services.captcha import captcha_pool
+from app.services.cache_bus import cache_bus
+from app.services.task_executor import task_executor, ExecutorBusyError, ExecutorTimeoutError
+from app.services.pagination import InvalidCursor
 from app.api import api_router
 
 
@@ -34,11 +42,32 @@ async def lifespan(app: FastAPI):
     # 初始化默认数据
     await init_default_data()
     
+    # 启动题目计数批量写库任务
+    question_counters.start()
+    
+    # 启动未判分记录兜底扫描（ASYNC_GRADING 开启时同时启动异步判分任务）
+    grading_queue.start()
+    
+    # 启动超时自动交卷任务（多worker选主执行）
+    exam_sweeper.start()
+    
+    # 启动验证码池后台补充任务
+    captcha_pool.start()
+    
+    # 订阅其他worker的缓存失效事件
+    cache_bus.start()
+    
     logger.info("楚然智考系统启动完成")
     
     yield
     
     # 关闭时执行
+    await cache_bus.stop()
+    await captcha_pool.stop()
+    await exam_sweeper.stop()
+    await grading_queue.stop()
+    await question_counters.stop()
+    task_executor.shutdown()
     await redis_client.disconnect()
     logger.info("楚然智考系统已关闭")
 
@@ -52,11 +81,11 @@ async def init_default_data():
     from app.models.permission import DEFAULT_ROLE_PERMISSIONS, PERMISSION_DESCRIPTIONS, PermissionCode
     from app.core.security import get_password_hash
     
-    # 使用简单的Redis锁键，减少多worker并发初始化的概率
-    lock_key = "init_default_data_lock"
-    try:
-        # 写入一个短期锁标记（不使用 nx 参数，兼容当前 RedisClient 实现）
-        await redis_client.set(lock_key, "1", expire=60)
+    # 分布式锁：多个worker同时启动时只有一个执行初始化，其余等待锁释放后走双重检查
+    async with redis_client.lock("lock:init_default_data", ttl_ms=60000, wait_timeout=60) as acquired:
+        if not acquired:
+            logger.warning("等待初始化锁超时，跳过默认数据初始化")
+            return
         
         db = SessionLocal()
         
@@ -134,10 +163,6 @@ async def init_default_data():
             logger.error(f"✗ 初始化默认数据失败: {e}")
         finally:
             db.close()
-    
-    finally:
-        # 尝试删除锁键（如果不存在也不会报错）
-        await redis_client.delete(lock_key)
 
 
 # 创建FastAPI应用
@@ -160,6 +185,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 任务执行器排队已满、执行超时
+@app.exception_handler(ExecutorBusyError)
+async def executor_busy_handler(request: Request, exc: ExecutorBusyError):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": "服务繁忙，请稍后重试"})
+
+
+@app.exception_handler(ExecutorTimeoutError)
+async def executor_timeout_handler(request: Request, exc: ExecutorTimeoutError):
+    return JSONResponse(status_code=status.HTTP_504_GATEWAY_TIMEOUT, content={"detail": "处理超时，请稍后重试"})
+
+
+# 分页游标无效（被篡改或排序方式不匹配）
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+    return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"detail": str(exc)})
+
+
 # 注册API路由
 app.include_router(api_router, prefix=settings.API_V1_PREFIX)
 
@@ -180,8 +222,8 @@ async def root():
 
 @app.get("/health", tags=["健康检查"])
 async def health_check():
-    """健康检查接口"""
-    return {"status": "healthy"}
+    """健康检查接口（redis: 当前worker的Redis连接模式）"""
+    return {"status": "healthy", "redis": redis_client.mode}
 
 
 if __name__ == "__main__":
@@ -3,7 +3,7 @@
 包含：考试表、考试题目表、考试记录表、答题详情表、错题本表、学习记录表
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, Enum, Float
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, ForeignKey, Index, Enum, Float
 from sqlalchemy.orm import relationship
 from app.database import Base
 import enum
@@ -176,6 +176,8 @@ class ExamRecord(Base):
     start_time = Column(DateTime, default=datetime.now, comment="开始时间")
     submit_time = Column(DateTime, nullable=True, comment="提交时间")
     is_passed = Column(Integer, default=0, comment="是否及格")
+    paper_snapshot = Column(Text, nullable=True, comment="试卷快照JSON：题目ID顺序、分值、答案版本")
+    submitted_answers = Column(Text, nullable=True, comment="待判分的原始答案JSON（异步判分，判分后清空）")
     created_at = Column(DateTime, default=datetime.now, comment="创建时间")
     
     # 关联关系
@@ -187,6 +189,8 @@ class ExamRecord(Base):
         Index("idx_record_user", "user_id"),
         Index("idx_record_exam", "exam_id"),
         Index("idx_record_status", "status"),
+        Index("idx_record_status_start", "status", "start_time"),
+        Index("idx_record_created", "created_at"),
         {"comment": "考试记录表"}
     )
 
@@ -257,6 +261,7 @@ class WrongQuestion(Base):
         Index("idx_wrong_user", "user_id"),
         Index("idx_wrong_question", "question_id"),
         Index("idx_wrong_user_question", "user_id", "question_id", unique=True),
+        Index("idx_wrong_user_updated", "user_id", "updated_at"),
         {"comment": "错题本表"}
     )
 
@@ -273,6 +278,7 @@ class StudyRecord(Base):
         comment="用户ID"
     )
     study_date = Column(DateTime, default=datetime.now, comment="学习日期")
+    study_day = Column(Date, nullable=False, comment="学习日（每个用户每天一行）")
     study_duration = Column(Integer, default=0, comment="学习时长(分钟)")
     question_count = Column(Integer, default=0, comment="练习题数")
     correct_count = Column(Integer, default=0, comment="正确题数")
@@ -286,5 +292,6 @@ class StudyRecord(Base):
     __table_args__ = (
         Index("idx_study_user", "user_id"),
         Index("idx_study_date", "study_date"),
+        Index("uk_study_user_day", "user_id", "study_day", unique=True),
         {"comment": "学习记录表"}
     )
@@ -94,6 +94,10 @@ class Question(Base):
         Index("idx_question_difficulty", "difficulty"),
         Index("idx_question_active", "is_active"),
         Index("idx_question_bank", "bank_id"),
+        Index(
+            "ft_question_text", "title", "options", "analysis",
+            mysql_prefix="FULLTEXT", mysql_with_parser="ngram"
+        ),
         {"comment": "题目表"}
     )
 
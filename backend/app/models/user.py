@@ -22,6 +22,7 @@ class User(Base):
     gender = Column(Integer, default=0, comment="性别：0未知 1男 2女")
     is_active = Column(Boolean, default=True, comment="是否激活")
     is_superuser = Column(Boolean, default=False, comment="是否超级管理员")
+    token_version = Column(Integer, default=0, nullable=False, comment="令牌版本，递增后之前签发的令牌失效")
     last_login = Column(DateTime, nullable=True, comment="最后登录时间")
     created_at = Column(DateTime, default=datetime.now, comment="创建时间")
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment="更新时间")
@@ -35,6 +36,7 @@ class User(Base):
     __table_args__ = (
         Index("idx_user_phone", "phone"),
         Index("idx_user_username", "username"),
+        Index("idx_user_created", "created_at"),
         {"comment": "用户表"}
     )
 
@@ -4,155 +4,1028 @@
 支持Redis不可用时使用内存缓存
 """
 import time
+import uuid
+import heapq
+import fnmatch
+import random
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, AsyncIterator, Awaitable, Callable, Iterable, Mapping, Tuple, Union
+
 import redis.asyncio as redis
-from typing import Optional, Dict, Any
+from loguru import logger
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
 from app.config import settings
 
+# 释放锁：只有持有者（令牌一致）才能删除
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# 续期锁：只有持有者（令牌一致）才能延长过期时间
+RENEW_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# 仅在哈希已存在时写入字段（保留原过期时间）：键过期后写入不会重建一个没有过期时间的哈希
+HSET_EXISTING_SCRIPT = """
+if redis.call("exists", KEYS[1]) == 1 then
+    redis.call("hset", KEYS[1], unpack(ARGV))
+    return 1
+end
+return 0
+"""
+
+# 哈希合并：源哈希各字段按整数累加到目标哈希后删除源哈希，返回合并的字段数
+HMERGE_SCRIPT = """
+local data = redis.call("hgetall", KEYS[1])
+for i = 1, #data, 2 do
+    redis.call("hincrby", KEYS[2], data[i], data[i + 1])
+end
+redis.call("del", KEYS[1])
+return #data / 2
+"""
+
+# 原子重命名：源键不存在时返回0（RENAME 会报错，放在批量命令中不便处理）
+RENAME_SCRIPT = """
+if redis.call("exists", KEYS[1]) == 1 then
+    redis.call("rename", KEYS[1], KEYS[2])
+    return 1
+end
+return 0
+"""
+
+# 批量写入并设置相同的过期时间：KEYS 为键，ARGV 为对应的值，最后一个参数为过期秒数
+MSET_EXPIRE_SCRIPT = """
+local expire = ARGV[#ARGV]
+for i = 1, #KEYS do
+    redis.call("set", KEYS[i], ARGV[i], "EX", expire)
+end
+return #KEYS
+"""
+
+# Redis不可用（连接失败、超时、连接池耗尽）时降级到内存缓存；命令本身的错误（如类型不符）照常抛出
+REDIS_UNAVAILABLE = (RedisConnectionError, RedisTimeoutError)
+
+Score = Union[float, str]  # 有序集合分值，区间端点可用 "-inf"/"+inf"
+
 
 class MemoryCache:
-    """内存缓存，Redis不可用时的备用方案"""
-    
-    def __init__(self):
-        self._cache: Dict[str, Any] = {}
+    """
+    内存缓存，Redis不可用时的备用方案
+    有界：条目数或估算字节数超过上限时按最近最少使用淘汰；
+    过期时间记入最小堆，写入时顺带清理少量到期键，后台任务定期清理全部到期键，
+    未被再次读取的键（如未校验的图形验证码）也会按时释放
+    """
+
+    # 每个键的固定开销估算(字节)
+    ENTRY_OVERHEAD = 64
+    # 每次写入顺带清理的到期键数量上限
+    EXPIRE_BATCH = 20
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None, sweep_interval: float = None):
+        self.max_entries = max_entries or settings.MEMORY_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or settings.MEMORY_CACHE_MAX_BYTES
+        self.sweep_interval = sweep_interval or settings.MEMORY_CACHE_SWEEP_INTERVAL
+        # 按访问顺序排列，最久未使用的在最前
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
         self._expires: Dict[str, float] = {}
-    
+        # (过期时间, 键)，键被覆盖或删除后旧记录留在堆中，弹出时与 _expires 比对跳过
+        self._heap: List[Tuple[float, str]] = []
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    # ==================== 容量与过期 ====================
+
     def _is_expired(self, key: str) -> bool:
         if key in self._expires:
             return time.time() > self._expires[key]
         return False
-    
+
     def _cleanup(self, key: str):
         if self._is_expired(key):
-            self._cache.pop(key, None)
-            self._expires.pop(key, None)
-    
-    async def set(self, key: str, value: str, expire: int = None) -> bool:
+            self._remove(key)
+            self._stats["expirations"] += 1
+
+    def _lookup(self, key: str) -> Any:
+        """读取并记录命中情况，命中时标记为最近使用"""
+        self._cleanup(key)
+        value = self._cache.get(key)
+        if value is None:
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        self._cache.move_to_end(key)
+        return value
+
+    def _store(self, key: str, value: Any, size: int):
+        """写入（覆盖）键值，不改变过期时间"""
+        self._expire_due(self.EXPIRE_BATCH)
         self._cache[key] = value
+        self._cache.move_to_end(key)
+        self._resize(key, size + len(key) + self.ENTRY_OVERHEAD - self._sizes.get(key, 0))
+
+    def _container(self, key: str, factory: Callable[[], Any]) -> Any:
+        """获取容器类型的值（哈希、列表、集合、有序集合），不存在时创建"""
+        self._cleanup(key)
+        value = self._cache.get(key)
+        if value is None:
+            value = factory()
+            self._store(key, value, 0)
+        else:
+            self._cache.move_to_end(key)
+        return value
+
+    def _resize(self, key: str, delta: int):
+        """调整键的估算大小，超出上限时淘汰最久未使用的键（至少保留当前键）"""
+        self._sizes[key] = self._sizes.get(key, 0) + delta
+        self._bytes += delta
+        while len(self._cache) > 1 and (len(self._cache) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._cache))
+            if oldest == key:
+                self._cache.move_to_end(key)
+                oldest = next(iter(self._cache))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+
+    def _remove(self, key: str) -> bool:
+        self._expires.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+        return self._cache.pop(key, None) is not None
+
+    def _set_expire(self, key: str, expire_at: float):
+        self._expires[key] = expire_at
+        heapq.heappush(self._heap, (expire_at, key))
+
+    def _expire_due(self, limit: int = None) -> int:
+        """清理已到期的键，limit 为本次最多处理的堆记录数"""
+        now = time.time()
+        removed = 0
+        while self._heap and self._heap[0][0] <= now and (limit is None or limit > 0):
+            expire_at, key = heapq.heappop(self._heap)
+            if limit is not None:
+                limit -= 1
+            if self._expires.get(key) == expire_at:
+                self._remove(key)
+                self._stats["expirations"] += 1
+                removed += 1
+        return removed
+
+    def sweep(self) -> int:
+        """清理全部到期键，返回清理数量"""
+        removed = self._expire_due()
+        # 覆盖写入留下的旧记录过多时重建堆
+        if len(self._heap) > 2 * len(self._expires) + 1024:
+            self._heap = [(at, key) for key, at in self._expires.items()]
+            heapq.heapify(self._heap)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._cache),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            **self._stats,
+        }
+
+    def start(self):
+        """启动后台清理任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    # ==================== 字符串 ====================
+
+    async def set(self, key: str, value: str, expire: int = None, nx: bool = False) -> bool:
+        if nx:
+            self._cleanup(key)
+            if key in self._cache:
+                return False
+        self._store(key, value, len(value))
+        self._expires.pop(key, None)
         if expire:
-            self._expires[key] = time.time() + expire
+            self._set_expire(key, time.time() + expire)
         return True
-    
+
     async def get(self, key: str) -> Optional[str]:
-        self._cleanup(key)
-        return self._cache.get(key)
-    
-    async def delete(self, key: str) -> int:
-        deleted = 1 if key in self._cache else 0
-        self._cache.pop(key, None)
-        self._expires.pop(key, None)
+        return self._lookup(key)
+
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        return [self._lookup(key) for key in keys]
+
+    async def mset(self, mapping: Dict[str, str]) -> bool:
+        for key, value in mapping.items():
+            await self.set(key, value)
+        return True
+
+    async def mset_expire(self, mapping: Dict[str, str], expire: int) -> int:
+        for key, value in mapping.items():
+            await self.set(key, value, expire)
+        return len(mapping)
+
+    async def delete(self, *keys: str) -> int:
+        deleted = 0
+        for key in keys:
+            self._cleanup(key)
+            if self._remove(key):
+                deleted += 1
         return deleted
-    
+
     async def exists(self, key: str) -> bool:
         self._cleanup(key)
         return key in self._cache
-    
+
     async def ttl(self, key: str) -> int:
+        self._cleanup(key)
+        if key not in self._cache:
+            return -2
         if key in self._expires:
             remaining = self._expires[key] - time.time()
             return max(0, int(remaining))
         return -1
-    
+
     async def incr(self, key: str) -> int:
-        val = int(self._cache.get(key, 0)) + 1
-        self._cache[key] = str(val)
-        return val
-    
+        self._cleanup(key)
+        val = str(int(self._cache.get(key, 0)) + 1)
+        self._store(key, val, len(val))
+        return int(val)
+
     async def expire(self, key: str, seconds: int) -> bool:
+        self._cleanup(key)
         if key in self._cache:
-            self._expires[key] = time.time() + seconds
+            self._set_expire(key, time.time() + seconds)
             return True
         return False
 
+    async def rename(self, key: str, new_key: str) -> bool:
+        self._cleanup(key)
+        if key not in self._cache:
+            return False
+        expire_at = self._expires.get(key)
+        size = self._sizes[key] - len(key) - self.ENTRY_OVERHEAD
+        value = self._cache[key]
+        self._remove(key)
+        self._remove(new_key)
+        self._store(new_key, value, size)
+        if expire_at:
+            self._set_expire(new_key, expire_at)
+        return True
+
+    # ==================== 哈希 ====================
+
+    async def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        data = self._container(key, dict)
+        old = data.get(field)
+        val = str(int(old or 0) + amount)
+        data[field] = val
+        self._resize(key, len(val) - (len(old) if old is not None else -len(field)))
+        return int(val)
+
+    async def hset(self, key: str, mapping: Dict[str, str]) -> int:
+        data = self._container(key, dict)
+        added, delta = 0, 0
+        for field, value in mapping.items():
+            old = data.get(field)
+            if old is None:
+                added += 1
+                delta += len(field)
+            else:
+                delta -= len(old)
+            data[field] = value
+            delta += len(value)
+        self._resize(key, delta)
+        return added
+
+    async def hset_existing(self, key: str, mapping: Dict[str, str]) -> bool:
+        self._cleanup(key)
+        if key not in self._cache:
+            return False
+        await self.hset(key, mapping)
+        return True
+
+    async def hmget(self, key: str, fields: List[str]) -> List[Optional[str]]:
+        data = self._lookup(key) or {}
+        return [data.get(f) for f in fields]
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        return dict(self._lookup(key) or {})
+
+    async def hmerge(self, source: str, dest: str) -> int:
+        data = await self.hgetall(source)
+        for field, value in data.items():
+            await self.hincrby(dest, field, int(value))
+        await self.delete(source)
+        return len(data)
+
+    async def scan_keys(self, pattern: str) -> List[str]:
+        self._expire_due()
+        return [key for key in list(self._cache) if fnmatch.fnmatchcase(key, pattern)]
+
+    async def hdel(self, key: str, *fields: str) -> int:
+        data = self._lookup(key)
+        if not data:
+            return 0
+        removed = [(f, data.pop(f)) for f in fields if f in data]
+        self._resize(key, -sum(len(f) + len(v) for f, v in removed))
+        if not data:
+            self._remove(key)
+        return len(removed)
+
+    # ==================== 列表、集合 ====================
+
+    async def lpush(self, key: str, *values: str) -> int:
+        items = self._container(key, deque)
+        items.extendleft(values)
+        self._resize(key, sum(len(v) for v in values))
+        return len(items)
+
+    async def rpop(self, key: str, count: int = 1) -> List[str]:
+        items = self._lookup(key)
+        if not items:
+            return []
+        result = [items.pop() for _ in range(min(count, len(items)))]
+        self._resize(key, -sum(len(v) for v in result))
+        if not items:
+            self._remove(key)
+        return result
+
+    async def llen(self, key: str) -> int:
+        self._cleanup(key)
+        return len(self._cache.get(key) or ())
+
+    async def sadd(self, key: str, *members: str) -> int:
+        items = self._container(key, set)
+        new = set(members) - items
+        items.update(new)
+        self._resize(key, sum(len(m) for m in new))
+        return len(new)
+
+    async def smembers(self, key: str) -> set:
+        return set(self._lookup(key) or ())
+
+    # ==================== 有序集合 ====================
+
+    # 有序集合每个成员的分值开销估算(字节)
+    SCORE_SIZE = 8
+
+    def _zsorted(self, key: str) -> List[Tuple[str, float]]:
+        return sorted((self._lookup(key) or {}).items(), key=lambda item: (item[1], item[0]))
+
+    async def zadd(self, key: str, mapping: Dict[str, float]) -> int:
+        data = self._container(key, dict)
+        new = [m for m in mapping if m not in data]
+        data.update({m: float(s) for m, s in mapping.items()})
+        self._resize(key, sum(len(m) + self.SCORE_SIZE for m in new))
+        return len(new)
+
+    async def zincrby(self, key: str, amount: float, member: str) -> float:
+        data = self._container(key, dict)
+        if member not in data:
+            self._resize(key, len(member) + self.SCORE_SIZE)
+        data[member] = data.get(member, 0.0) + amount
+        return data[member]
+
+    async def zscore(self, key: str, member: str) -> Optional[float]:
+        return (self._lookup(key) or {}).get(member)
+
+    async def zrem(self, key: str, *members: str) -> int:
+        data = self._lookup(key)
+        if not data:
+            return 0
+        removed = [m for m in members if data.pop(m, None) is not None]
+        self._resize(key, -sum(len(m) + self.SCORE_SIZE for m in removed))
+        if not data:
+            self._remove(key)
+        return len(removed)
+
+    async def zcard(self, key: str) -> int:
+        self._cleanup(key)
+        return len(self._cache.get(key) or ())
+
+    async def zrange(self, key: str, start: int, end: int, desc: bool = False, withscores: bool = False) -> list:
+        items = self._zsorted(key)
+        if desc:
+            items.reverse()
+        # 与 Redis 一致：end 为闭区间，负数从末尾计
+        end = len(items) + end if end < 0 else end
+        items = items[start if start >= 0 else max(len(items) + start, 0):end + 1]
+        return items if withscores else [m for m, _ in items]
+
+    async def zrangebyscore(
+        self, key: str, min: Score, max: Score, start: int = None, num: int = None, withscores: bool = False
+    ) -> list:
+        items = [(m, s) for m, s in self._zsorted(key) if float(min) <= s <= float(max)]
+        if start is not None and num is not None:
+            items = items[start:start + num] if num >= 0 else items[start:]
+        return items if withscores else [m for m, _ in items]
+
+    async def zremrangebyscore(self, key: str, min: Score, max: Score) -> int:
+        members = await self.zrangebyscore(key, min, max)
+        return await self.zrem(key, *members)
+
+    # ==================== 锁与消息 ====================
+
+    async def acquire_lock(self, key: str, token: str, ttl_ms: int) -> bool:
+        self._cleanup(key)
+        if key in self._cache:
+            return False
+        self._store(key, token, len(token))
+        self._set_expire(key, time.time() + ttl_ms / 1000)
+        return True
+
+    async def release_lock(self, key: str, token: str) -> bool:
+        self._cleanup(key)
+        if self._cache.get(key) != token:
+            return False
+        self._remove(key)
+        return True
+
+    async def renew_lock(self, key: str, token: str, ttl_ms: int) -> bool:
+        self._cleanup(key)
+        if self._cache.get(key) != token:
+            return False
+        self._set_expire(key, time.time() + ttl_ms / 1000)
+        return True
+
+    async def publish(self, channel: str, message: str) -> int:
+        # 单进程内没有其他订阅者
+        return 0
+
+
+def _to_list(value) -> list:
+    return value or []
+
+
+async def _scan_keys(r, pattern: str) -> List[str]:
+    """SCAN 遍历匹配的键（不阻塞服务端，遍历期间新增的键可能不包含）"""
+    return [key async for key in r.scan_iter(match=pattern, count=500)]
+
+
+# 命令名 -> (在 Redis 客户端或管道上发出命令, 返回值转换)
+# 命令名与 MemoryCache 的方法名、参数一致，降级时直接调用内存缓存的同名方法
+REDIS_COMMANDS: Dict[str, Tuple[Callable, Optional[Callable]]] = {
+    "set": (lambda r, key, value, expire, nx: r.set(key, value, ex=expire, nx=nx or None), bool),
+    "get": (lambda r, key: r.get(key), None),
+    "mget": (lambda r, keys: r.mget(keys), None),
+    "mset": (lambda r, mapping: r.mset(mapping), bool),
+    "mset_expire": (lambda r, mapping, expire: r.eval(
+        MSET_EXPIRE_SCRIPT, len(mapping), *mapping.keys(), *mapping.values(), expire
+    ), int),
+    "delete": (lambda r, *keys: r.delete(*keys), None),
+    "exists": (lambda r, key: r.exists(key), bool),
+    "ttl": (lambda r, key: r.ttl(key), None),
+    "incr": (lambda r, key: r.incr(key), None),
+    "expire": (lambda r, key, seconds: r.expire(key, seconds), bool),
+    "rename": (lambda r, key, new_key: r.eval(RENAME_SCRIPT, 2, key, new_key), bool),
+    "hincrby": (lambda r, key, field, amount: r.hincrby(key, field, amount), None),
+    "hset": (lambda r, key, mapping: r.hset(key, mapping=mapping), None),
+    "hset_existing": (lambda r, key, mapping: r.eval(
+        HSET_EXISTING_SCRIPT, 1, key, *[item for pair in mapping.items() for item in pair]
+    ), bool),
+    "hmget": (lambda r, key, fields: r.hmget(key, fields), None),
+    "hgetall": (lambda r, key: r.hgetall(key), None),
+    "hmerge": (lambda r, source, dest: r.eval(HMERGE_SCRIPT, 2, source, dest), int),
+    "scan_keys": (lambda r, pattern: _scan_keys(r, pattern), list),
+    "hdel": (lambda r, key, *fields: r.hdel(key, *fields), None),
+    "lpush": (lambda r, key, *values: r.lpush(key, *values), None),
+    "rpop": (lambda r, key, count: r.rpop(key, count), _to_list),
+    "llen": (lambda r, key: r.llen(key), None),
+    "sadd": (lambda r, key, *members: r.sadd(key, *members), None),
+    "smembers": (lambda r, key: r.smembers(key), set),
+    "zadd": (lambda r, key, mapping: r.zadd(key, mapping), None),
+    "zincrby": (lambda r, key, amount, member: r.zincrby(key, amount, member), float),
+    "zscore": (lambda r, key, member: r.zscore(key, member), None),
+    "zrem": (lambda r, key, *members: r.zrem(key, *members), None),
+    "zcard": (lambda r, key: r.zcard(key), None),
+    "zrange": (lambda r, key, start, end, desc, withscores: r.zrange(
+        key, start, end, desc=desc, withscores=withscores
+    ), list),
+    "zrangebyscore": (lambda r, key, min, max, start, num, withscores: r.zrangebyscore(
+        key, min, max, start=start, num=num, withscores=withscores
+    ), list),
+    "zremrangebyscore": (lambda r, key, min, max: r.zremrangebyscore(key, min, max), None),
+    "acquire_lock": (lambda r, key, token, ttl_ms: r.set(key, token, px=ttl_ms, nx=True), bool),
+    "release_lock": (lambda r, key, token: r.eval(RELEASE_LOCK_SCRIPT, 1, key, token), bool),
+    "renew_lock": (lambda r, key, token, ttl_ms: r.eval(RENEW_LOCK_SCRIPT, 1, key, token, ttl_ms), bool),
+    "publish": (lambda r, channel, message: r.publish(channel, message), None),
+}
+
+
+class RedisCommands:
+    """
+    RedisClient 与 RedisPipeline 共用的命令方法
+    客户端上调用返回可等待对象（立即执行），管道上调用只排队、返回管道本身
+    """
+
+    def _execute(self, name: str, *args):
+        raise NotImplementedError
+
+    def _constant(self, value):
+        """批量参数为空时不发送命令，直接得到 value"""
+        raise NotImplementedError
+
+    # ==================== 字符串 ====================
+
+    def set(self, key: str, value: str, expire: int = None, nx: bool = False) -> Awaitable[bool]:
+        """写入键值，nx=True 时仅在键不存在时写入（返回是否写入）"""
+        return self._execute("set", key, value, expire, nx)
+
+    def get(self, key: str) -> Awaitable[Optional[str]]:
+        return self._execute("get", key)
+
+    def mget(self, keys: Iterable[str]) -> Awaitable[List[Optional[str]]]:
+        """批量读取，按 keys 顺序返回（不存在为 None）"""
+        keys = list(keys)
+        if not keys:
+            return self._constant([])
+        return self._execute("mget", keys)
+
+    def mset(self, mapping: Mapping[str, str], expire: int = None) -> Awaitable[bool]:
+        """批量写入，expire 不为空时所有键使用相同的过期时间"""
+        if not mapping:
+            return self._constant(True)
+        if expire:
+            return self._execute("mset_expire", dict(mapping), expire)
+        return self._execute("mset", dict(mapping))
+
+    def delete(self, *keys: str) -> Awaitable[int]:
+        """删除一个或多个键，返回删除数量"""
+        if not keys:
+            return self._constant(0)
+        return self._execute("delete", *keys)
+
+    def exists(self, key: str) -> Awaitable[bool]:
+        return self._execute("exists", key)
+
+    def ttl(self, key: str) -> Awaitable[int]:
+        return self._execute("ttl", key)
+
+    def incr(self, key: str) -> Awaitable[int]:
+        return self._execute("incr", key)
+
+    def expire(self, key: str, seconds: int) -> Awaitable[bool]:
+        return self._execute("expire", key, seconds)
+
+    def rename(self, key: str, new_key: str) -> Awaitable[bool]:
+        """原子重命名，源键不存在时返回False"""
+        return self._execute("rename", key, new_key)
+
+    # ==================== 哈希 ====================
+
+    def hincrby(self, key: str, field: str, amount: int = 1) -> Awaitable[int]:
+        return self._execute("hincrby", key, field, amount)
+
+    def hset(self, key: str, mapping: Mapping[str, str]) -> Awaitable[int]:
+        """批量写入哈希字段"""
+        if not mapping:
+            return self._constant(0)
+        return self._execute("hset", key, dict(mapping))
+
+    def hset_existing(self, key: str, mapping: Mapping[str, str]) -> Awaitable[bool]:
+        """仅在哈希已存在时批量写入字段，返回是否写入"""
+        if not mapping:
+            return self._constant(True)
+        return self._execute("hset_existing", key, dict(mapping))
+
+    def hmerge(self, source: str, dest: str) -> Awaitable[int]:
+        """源哈希各字段按整数累加到目标哈希并删除源哈希（原子执行），返回合并的字段数"""
+        return self._execute("hmerge", source, dest)
+
+    def hmget(self, key: str, fields: Iterable[str]) -> Awaitable[List[Optional[str]]]:
+        fields = list(fields)
+        if not fields:
+            return self._constant([])
+        return self._execute("hmget", key, fields)
+
+    def hgetall(self, key: str) -> Awaitable[Dict[str, str]]:
+        return self._execute("hgetall", key)
+
+    def hdel(self, key: str, *fields: str) -> Awaitable[int]:
+        if not fields:
+            return self._constant(0)
+        return self._execute("hdel", key, *fields)
+
+    # ==================== 列表、集合 ====================
+
+    def lpush(self, key: str, *values: str) -> Awaitable[int]:
+        return self._execute("lpush", key, *values)
+
+    def rpop(self, key: str, count: int = 1) -> Awaitable[List[str]]:
+        """从列表尾部弹出最多count个元素，列表为空时返回空列表"""
+        return self._execute("rpop", key, count)
+
+    def llen(self, key: str) -> Awaitable[int]:
+        return self._execute("llen", key)
+
+    def sadd(self, key: str, *members: str) -> Awaitable[int]:
+        if not members:
+            return self._constant(0)
+        return self._execute("sadd", key, *members)
+
+    def smembers(self, key: str) -> Awaitable[set]:
+        return self._execute("smembers", key)
+
+    # ==================== 有序集合 ====================
+
+    def zadd(self, key: str, mapping: Mapping[str, float]) -> Awaitable[int]:
+        """批量写入成员分值 {成员: 分值}，返回新增成员数"""
+        if not mapping:
+            return self._constant(0)
+        return self._execute("zadd", key, dict(mapping))
+
+    def zincrby(self, key: str, amount: float, member: str) -> Awaitable[float]:
+        return self._execute("zincrby", key, amount, member)
+
+    def zscore(self, key: str, member: str) -> Awaitable[Optional[float]]:
+        return self._execute("zscore", key, member)
+
+    def zrem(self, key: str, *members: str) -> Awaitable[int]:
+        if not members:
+            return self._constant(0)
+        return self._execute("zrem", key, *members)
+
+    def zcard(self, key: str) -> Awaitable[int]:
+        return self._execute("zcard", key)
+
+    def zrange(self, key: str, start: int, end: int, desc: bool = False, withscores: bool = False) -> Awaitable[list]:
+        """按排名取成员（end 为闭区间，-1 表示末尾），withscores=True 时返回 [(成员, 分值)]"""
+        return self._execute("zrange", key, start, end, desc, withscores)
+
+    def zrangebyscore(
+        self, key: str, min: Score, max: Score, start: int = None, num: int = None, withscores: bool = False
+    ) -> Awaitable[list]:
+        """按分值区间取成员，start/num 用于分页（需同时提供）"""
+        return self._execute("zrangebyscore", key, min, max, start, num, withscores)
+
+    def zremrangebyscore(self, key: str, min: Score, max: Score) -> Awaitable[int]:
+        return self._execute("zremrangebyscore", key, min, max)
+
+
+class RedisPipeline(RedisCommands):
+    """
+    批量命令管道：命令在本地排队，execute 时一次网络往返发送，结果按排队顺序返回
+    内存缓存模式下依次调用内存缓存；发送失败时整批降级到内存缓存
+    fallback=False 时不降级：Redis不可用则不执行任何命令，results 为 None，由调用方保留数据稍后重试
+    用法:
+        async with redis_client.pipeline() as pipe:
+            pipe.hset(key, mapping)
+            pipe.expire(key, ttl)
+        pipe.results  # [hset结果, expire结果]
+    """
+
+    def __init__(self, client: "RedisClient", transaction: bool = False, fallback: bool = True):
+        self._client = client
+        self._transaction = transaction
+        self._fallback = fallback
+        self._commands: List[Tuple[Optional[str], tuple]] = []
+        self.results: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def _execute(self, name: str, *args) -> "RedisPipeline":
+        self._commands.append((name, args))
+        return self
+
+    def _constant(self, value) -> "RedisPipeline":
+        self._commands.append((None, (value,)))
+        return self
+
+    async def execute(self) -> List[Any]:
+        """发送排队的命令并清空队列，返回各命令结果"""
+        commands, self._commands = self._commands, []
+        if not commands:
+            self.results = []
+            return self.results
+
+        client = self._client
+        client._stats["pipelines"] += 1
+        client._stats["commands"] += len(commands)
+        self.results = None
+        if not client._use_memory:
+            try:
+                self.results = await self._execute_redis(commands)
+                client._failures = 0
+            except REDIS_UNAVAILABLE as e:
+                client._on_error("pipeline", e)
+        if self.results is None and self._fallback:
+            self.results = [
+                args[0] if name is None else await getattr(client._memory_cache, name)(*args)
+                for name, args in commands
+            ]
+        return self.results
+
+    async def _execute_redis(self, commands: List[Tuple[Optional[str], tuple]]) -> List[Any]:
+        pipe = self._client.redis.pipeline(transaction=self._transaction)
+        for name, args in commands:
+            if name is not None:
+                REDIS_COMMANDS[name][0](pipe, *args)
+        replies = iter(await pipe.execute())
+
+        results = []
+        for name, args in commands:
+            if name is None:
+                results.append(args[0])
+                continue
+            parse = REDIS_COMMANDS[name][1]
+            reply = next(replies)
+            results.append(parse(reply) if parse else reply)
+        return results
+
+
+class BlockingConnectionPool(redis.BlockingConnectionPool):
+    """
+    阻塞连接池：连接数达到上限时等待空闲连接，而不是直接报错
+    redis-py 5.0.1 在持有条件锁时建立连接，连接失败后释放连接又需要同一把锁，
+    Redis不可用时会卡到等待超时并泄漏连接名额；这里只在锁内占用名额，在锁外建立连接
+    """
+
+    async def get_connection(self, command_name, *keys, **options):
+        try:
+            async with asyncio.timeout(self.timeout):
+                async with self._condition:
+                    await self._condition.wait_for(self.can_get_connection)
+                    if self._available_connections:
+                        connection = self._available_connections.pop()
+                    else:
+                        connection = self.make_connection()
+                    self._in_use_connections.add(connection)
+        except asyncio.TimeoutError as err:
+            raise RedisConnectionError("No connection available.") from err
+
+        try:
+            await self.ensure_connection(connection)
+        except BaseException:
+            await self.release(connection)
+            raise
+        return connection
+
+
+class RedisClient(RedisCommands):
+    """
+    Redis客户端封装类，支持降级到内存缓存
+    熔断：连续 REDIS_BREAKER_THRESHOLD 次连接失败后断开，命令直接走内存缓存（不再逐次等待失败），
+    后台按指数退避探测Redis，恢复后自动切回并通知注册的回调
+    """
+
+    # 同一类错误日志的最小间隔(秒)，避免Redis故障期间刷屏
+    ERROR_LOG_INTERVAL = 10
 
-class RedisClient:
-    """Redis客户端封装类，支持降级到内存缓存"""
-    
     def __init__(self):
         self.redis: Optional[redis.Redis] = None
         self._memory_cache = MemoryCache()
         self._use_memory = True  # 默认使用内存缓存，连接成功后切换
-        self._connected = False
-    
+        self._failures = 0  # 连续失败次数
+        self._stats = {"commands": 0, "pipelines": 0, "errors": 0, "trips": 0, "probes": 0, "reconnects": 0}
+        self._last_error: Optional[str] = None
+        self._error_logged_at = 0.0
+        self._probe_task: Optional[asyncio.Task] = None
+        self._reconnect_callbacks: List[Callable[[], None]] = []
+
     async def connect(self):
         """建立Redis连接"""
+        # 内存缓存也可能在Redis短暂故障时写入，清理任务始终运行
+        self._memory_cache.start()
         try:
-            self.redis = redis.from_url(
+            pool = BlockingConnectionPool.from_url(
                 settings.REDIS_URL,
                 encoding="utf-8",
-                decode_responses=True
+                decode_responses=True,
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT
             )
+            self.redis = redis.Redis(connection_pool=pool)
             # 测试连接
             await self.redis.ping()
             self._use_memory = False
-            self._connected = True
             print("Redis连接成功")
         except Exception as e:
-            print(f"Redis连接失败，使用内存缓存: {e}")
+            print(f"Redis连接失败，先使用内存缓存并在后台重连: {e}")
             self._use_memory = True
-            self._connected = True
-    
+            self._last_error = repr(e)
+            self._start_probe()
+
+    @property
+    def using_memory(self) -> bool:
+        """当前是否处于内存缓存模式（各worker数据不共享）"""
+        return self._use_memory
+
+    @property
+    def mode(self) -> str:
+        """redis: 正常; reconnecting: 已断开、后台重连中; memory: 未配置可用的Redis"""
+        if not self._use_memory:
+            return "redis"
+        return "reconnecting" if self._probe_task is not None and not self._probe_task.done() else "memory"
+
     async def disconnect(self):
         """关闭Redis连接"""
-        if self.redis and not self._use_memory:
+        await self._memory_cache.stop()
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+        if self.redis:
             await self.redis.close()
-    
-    async def set(self, key: str, value: str, expire: int = None) -> bool:
-        if self._use_memory:
-            return await self._memory_cache.set(key, value, expire)
-        try:
-            if expire:
-                return await self.redis.setex(key, expire, value)
-            return await self.redis.set(key, value)
-        except:
-            return await self._memory_cache.set(key, value, expire)
-    
-    async def get(self, key: str) -> Optional[str]:
-        if self._use_memory:
-            return await self._memory_cache.get(key)
-        try:
-            return await self.redis.get(key)
-        except:
-            return await self._memory_cache.get(key)
-    
-    async def delete(self, key: str) -> int:
-        if self._use_memory:
-            return await self._memory_cache.delete(key)
-        try:
-            return await self.redis.delete(key)
-        except:
-            return await self._memory_cache.delete(key)
-    
-    async def exists(self, key: str) -> bool:
-        if self._use_memory:
-            return await self._memory_cache.exists(key)
-        try:
-            return await self.redis.exists(key)
-        except:
-            return await self._memory_cache.exists(key)
-    
-    async def ttl(self, key: str) -> int:
-        if self._use_memory:
-            return await self._memory_cache.ttl(key)
-        try:
-            return await self.redis.ttl(key)
-        except:
-            return await self._memory_cache.ttl(key)
-    
-    async def incr(self, key: str) -> int:
+            await self.redis.connection_pool.disconnect()
+
+    def on_reconnect(self, callback: Callable[[], None]):
+        """
+        注册Redis恢复后的回调（在事件循环中同步执行）
+        断开期间的写入只在本worker的内存缓存中，进程内缓存可据此整体失效
+        """
+        self._reconnect_callbacks.append(callback)
+
+    async def _execute(self, name: str, *args):
+        """执行单条命令，Redis出错时降级到内存缓存的同名方法"""
+        self._stats["commands"] += 1
+        if not self._use_memory:
+            command, parse = REDIS_COMMANDS[name]
+            try:
+                reply = await command(self.redis, *args)
+                self._failures = 0
+                return parse(reply) if parse else reply
+            except REDIS_UNAVAILABLE as e:
+                self._on_error(name, e)
+        return await getattr(self._memory_cache, name)(*args)
+
+    async def _constant(self, value):
+        return value
+
+    def _on_error(self, name: str, error: Exception):
+        self._stats["errors"] += 1
+        self._failures += 1
+        self._last_error = repr(error)
+        if self._failures >= settings.REDIS_BREAKER_THRESHOLD:
+            self._trip()
+            return
+        now = time.monotonic()
+        if now - self._error_logged_at >= self.ERROR_LOG_INTERVAL:
+            self._error_logged_at = now
+            logger.warning(f"Redis命令 {name} 执行失败，本次使用内存缓存: {error!r}")
+
+    # ==================== 熔断与重连 ====================
+
+    def _trip(self):
+        """断开：后续命令直接使用内存缓存，后台探测恢复"""
         if self._use_memory:
-            return await self._memory_cache.incr(key)
-        try:
-            return await self.redis.incr(key)
-        except:
-            return await self._memory_cache.incr(key)
-    
-    async def expire(self, key: str, seconds: int) -> bool:
+            return
+        self._use_memory = True
+        self._stats["trips"] += 1
+        logger.error(f"Redis连续{self._failures}次失败，切换到内存缓存并在后台重连: {self._last_error}")
+        self._start_probe()
+
+    def _start_probe(self):
+        if self.redis is None or (self._probe_task is not None and not self._probe_task.done()):
+            return
+        self._probe_task = asyncio.create_task(self._probe())
+
+    async def _probe(self):
+        delay = settings.REDIS_RECONNECT_MIN_DELAY
+        while True:
+            # 随机浮动，避免多个worker同时探测
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            self._stats["probes"] += 1
+            try:
+                await self.redis.ping()
+            except Exception as e:
+                self._last_error = repr(e)
+                delay = min(delay * 2, settings.REDIS_RECONNECT_MAX_DELAY)
+                continue
+
+            self._failures = 0
+            self._use_memory = False
+            self._stats["reconnects"] += 1
+            logger.info("Redis已恢复，切回Redis")
+            for callback in self._reconnect_callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"Redis恢复回调执行失败: {e}")
+            return
+
+    @asynccontextmanager
+    async def pipeline(self, transaction: bool = False, fallback: bool = True) -> AsyncIterator[RedisPipeline]:
+        """
+        批量命令管道，退出上下文时发送尚未执行的命令（上下文内出现异常则丢弃）
+        transaction=True 时以 MULTI/EXEC 原子执行
+        fallback=False 时Redis不可用不降级到内存缓存，pipe.results 为 None
+        """
+        pipe = RedisPipeline(self, transaction, fallback)
+        yield pipe
+        if len(pipe):
+            await pipe.execute()
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池与命令计数（当前worker）"""
+        pool = self.redis.connection_pool if self.redis is not None else None
+        in_use = len(pool._in_use_connections) if pool else 0
+        available = len(pool._available_connections) if pool else 0
+        return {
+            "mode": self.mode,
+            "consecutive_failures": self._failures,
+            "last_error": self._last_error,
+            "max_connections": pool.max_connections if pool else settings.REDIS_MAX_CONNECTIONS,
+            "created_connections": in_use + available,
+            "in_use_connections": in_use,
+            "available_connections": available,
+            **self._stats,
+            "memory_cache": self._memory_cache.stats(),
+        }
+
+    # ==================== 发布订阅 ====================
+
+    def publish(self, channel: str, message: str) -> Awaitable[int]:
+        """发布消息，返回收到消息的订阅者数量（内存缓存模式下没有其他进程，直接返回0）"""
+        return self._execute("publish", channel, message)
+
+    def pubsub(self):
+        """获取订阅对象，内存缓存模式下返回 None"""
         if self._use_memory:
-            return await self._memory_cache.expire(key, seconds)
+            return None
+        return self.redis.pubsub(ignore_subscribe_messages=True)
+
+    # ==================== 分布式锁 ====================
+
+    async def acquire_lock(
+        self,
+        key: str,
+        ttl_ms: int = 10000,
+        wait_timeout: float = 0,
+        retry_interval: float = 0.05
+    ) -> Optional[str]:
+        """
+        获取锁（SET NX PX），成功返回令牌，超时未获取返回 None
+        ttl_ms: 锁自动过期时间，防止持有者崩溃后死锁
+        wait_timeout: 等待时间(秒)，0 表示只尝试一次
+        """
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + wait_timeout
+        while True:
+            if await self._execute("acquire_lock", key, token, ttl_ms):
+                return token
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(retry_interval)
+
+    async def scan_keys(self, pattern: str) -> List[str]:
+        """按通配符遍历键（SCAN，不能放入管道）"""
+        return await self._execute("scan_keys", pattern)
+
+    async def release_lock(self, key: str, token: str) -> bool:
+        """释放锁（Lua脚本校验令牌，避免误删他人在过期后重新获取的锁）"""
+        return await self._execute("release_lock", key, token)
+
+    async def renew_lock(self, key: str, token: str, ttl_ms: int) -> bool:
+        """续期锁（Lua脚本校验令牌，已过期被他人获取的锁不会被续上）"""
+        return await self._execute("renew_lock", key, token, ttl_ms)
+
+    @asynccontextmanager
+    async def lock(
+        self,
+        key: str,
+        ttl_ms: int = 10000,
+        wait_timeout: float = 0
+    ) -> AsyncIterator[bool]:
+        """
+        锁上下文管理器，产出是否获取成功
+        用法: async with redis_client.lock("lock:xxx", wait_timeout=3) as acquired: ...
+        """
+        token = await self.acquire_lock(key, ttl_ms, wait_timeout)
         try:
-            return await self.redis.expire(key, seconds)
-        except:
-            return await self._memory_cache.expire(key, seconds)
+            yield token is not None
+        finally:
+            if token:
+                await self.release_lock(key, token)
 
 
 # 全局Redis客户端实例
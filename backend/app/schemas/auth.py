@@ -18,6 +18,7 @@ class TokenData(BaseModel):
     username: Optional[str] = None
     roles: List[str] = []
     permissions: List[str] = []
+    token_version: int = 0
 
 
 class LoginRequest(BaseModel):
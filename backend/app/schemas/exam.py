@@ -80,8 +80,10 @@ class ExamResponse(ExamBase):
 
 class ExamListResponse(BaseModel):
     """考试列表响应模式"""
-    total: int
+    total: Optional[int] = Field(None, description="总数（游标分页时按需返回）")
     items: List[ExamResponse]
+    has_more: Optional[bool] = Field(None, description="游标分页：是否还有下一页")
+    next_cursor: Optional[str] = Field(None, description="游标分页：下一页游标")
 
 
 class ExamDetail(ExamResponse):
@@ -130,7 +132,18 @@ class SubmitAnswerRequest(BaseModel):
 class SubmitExamRequest(BaseModel):
     """交卷请求"""
     record_id: int = Field(description="考试记录ID")
-    answers: List[SubmitAnswerRequest] = Field(description="答案列表")
+    answers: List[SubmitAnswerRequest] = Field(default_factory=list, description="答案列表（与自动保存的答案合并）")
+
+
+class AutosaveRequest(BaseModel):
+    """自动保存答案请求"""
+    answers: List[SubmitAnswerRequest] = Field(description="本次变化的答案")
+
+
+class SavedAnswersResponse(BaseModel):
+    """已自动保存的答案（继续作答）"""
+    record_id: int
+    answers: List[SubmitAnswerRequest]
 
 
 class ExamRecordResponse(BaseModel):
@@ -155,10 +168,41 @@ class ExamRecordResponse(BaseModel):
         from_attributes = True
 
 
+class ExamRecordStatusResponse(BaseModel):
+    """考试记录判分状态（异步判分轮询）"""
+    record_id: int
+    status: RecordStatus
+    score: Optional[float] = None
+    is_passed: Optional[int] = None
+    submit_time: Optional[datetime] = None
+
+
+class RegradeRequest(BaseModel):
+    """重新判分请求"""
+    scope: str = Field(pattern="^(question|exam|bank)$", description="范围：question题目 exam考试 bank题库")
+    target_id: int = Field(description="题目/考试/题库ID")
+
+
+class RegradeJobResponse(BaseModel):
+    """重新判分任务进度"""
+    job_id: str
+    scope: str
+    target_id: int
+    status: str = Field(description="pending排队 running进行中 completed完成 failed失败")
+    processed: int = Field(description="已处理答题记录数")
+    changed: int = Field(description="结果变化的答题记录数")
+    records: int = Field(description="重新汇总的考试记录数")
+    created_at: str
+    finished_at: Optional[str] = None
+    error: Optional[str] = None
+
+
 class ExamRecordListResponse(BaseModel):
     """考试记录列表响应"""
-    total: int
+    total: Optional[int] = Field(None, description="总数（游标分页时按需返回）")
     items: List[ExamRecordResponse]
+    has_more: Optional[bool] = Field(None, description="游标分页：是否还有下一页")
+    next_cursor: Optional[str] = Field(None, description="游标分页：下一页游标")
 
 
 class ExamAnswerDetail(BaseModel):
@@ -199,8 +243,10 @@ class WrongQuestionResponse(BaseModel):
 
 class WrongQuestionListResponse(BaseModel):
     """错题列表响应"""
-    total: int
+    total: Optional[int] = Field(None, description="总数（游标分页时按需返回）")
     items: List[WrongQuestionResponse]
+    has_more: Optional[bool] = Field(None, description="游标分页：是否还有下一页")
+    next_cursor: Optional[str] = Field(None, description="游标分页：下一页游标")
 
 
 class WrongQuestionUpdate(BaseModel):
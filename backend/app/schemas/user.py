@@ -55,8 +55,10 @@ class UserResponse(UserBase):
 
 class UserListResponse(BaseModel):
     """用户列表响应模式"""
-    total: int
+    total: Optional[int] = Field(None, description="总数（游标分页时按需返回）")
     items: List[UserResponse]
+    has_more: Optional[bool] = Field(None, description="游标分页：是否还有下一页")
+    next_cursor: Optional[str] = Field(None, description="游标分页：下一页游标")
 
 
 # ==================== 角色模式 ====================
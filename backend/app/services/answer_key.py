@@ -0,0 +1,142 @@
+"""
+楚然智考系统 - 编译答案键
+把试卷题目的标准答案预处理为紧凑结构，判分时不再重复做字符串处理：
+单选/判断题为规范化答案串，多选题为字母位掩码，填空题为预先规范化的备选答案集合
+判分结果与 ExamService.grade_answer 完全一致（含多选题少选得一半分）
+"""
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple, Any
+
+from app.models.question import Question, QuestionType
+
+# 题型编码
+_EXACT = 1      # 单选题、判断题：忽略大小写精确匹配
+_LETTERS = 2    # 多选题：字母集合比较
+_BLANK = 3      # 填空题：多个备选答案 + 去标点模糊匹配
+_MANUAL = 0     # 简答题等需人工判分
+
+_NON_LETTER = re.compile(r'[^A-Za-z]')
+_BLANK_PUNCT = re.compile(r'[\s\.,，。、；;：:！!？?]')
+
+# 判分结果: (是否正确, 得分)，is_correct: 0错误 1正确 2部分正确
+GradeResult = Tuple[int, float]
+
+
+@lru_cache(maxsize=8192)
+def letter_mask(text: str) -> int:
+    """答案中的英文字母转为位掩码（A=bit0 ... Z=bit25），忽略逗号空格等符号"""
+    mask = 0
+    for ch in _NON_LETTER.sub('', text).upper():
+        mask |= 1 << (ord(ch) - 65)
+    return mask
+
+
+def _normalize_blank(text: str) -> str:
+    return _BLANK_PUNCT.sub('', text)
+
+
+def _compile_entry(question: Question) -> Tuple[int, Any, Any]:
+    correct_answer = (question.answer or "").strip()
+    question_type = question.question_type
+
+    if question_type in (QuestionType.SINGLE_CHOICE, QuestionType.TRUE_FALSE):
+        return _EXACT, correct_answer.upper(), None
+
+    if question_type == QuestionType.MULTIPLE_CHOICE:
+        return _LETTERS, letter_mask(correct_answer), None
+
+    if question_type == QuestionType.FILL_BLANK:
+        alternatives = [a.strip().lower() for a in correct_answer.split("|")]
+        return _BLANK, frozenset(alternatives), frozenset(_normalize_blank(a) for a in alternatives)
+
+    return _MANUAL, None, None
+
+
+class AnswerKey:
+    """
+    一份试卷的编译答案键
+    entries: {题目ID: (题型编码, 答案数据, 辅助数据, 分值)}
+    """
+
+    __slots__ = ("entries",)
+
+    def __init__(self, entries: Dict[int, Tuple[int, Any, Any, float]]):
+        self.entries = entries
+
+    @classmethod
+    def compile(cls, questions: Iterable[Question], scores: Dict[int, float] = None) -> "AnswerKey":
+        """
+        编译答案键
+        scores: 题目分值（以试卷快照为准），未提供时取题目当前分值
+        """
+        entries = {}
+        for q in questions:
+            kind, data, extra = _compile_entry(q)
+            score = scores.get(q.id, q.score) if scores else q.score
+            entries[q.id] = (kind, data, extra, score)
+        return cls(entries)
+
+    def __contains__(self, question_id: int) -> bool:
+        return question_id in self.entries
+
+    def grade(self, question_id: int, user_answer: Optional[str], score: float = None) -> Optional[GradeResult]:
+        """
+        判分单题，题目不在试卷中时返回 None
+        score: 覆盖编译时的分值（如按考试记录各自的试卷快照）
+        """
+        entry = self.entries.get(question_id)
+        if entry is None:
+            return None
+        if not user_answer:
+            return 0, 0
+
+        kind, data, extra, key_score = entry
+        if score is None:
+            score = key_score
+        if kind == _EXACT:
+            return (1, score) if user_answer.strip().upper() == data else (0, 0)
+
+        if kind == _LETTERS:
+            user_mask = letter_mask(user_answer)
+            if user_mask == data:
+                return 1, score
+            if user_mask and not user_mask & ~data:
+                return 2, score * 0.5
+            return 0, 0
+
+        if kind == _BLANK:
+            user_lower = user_answer.strip().lower()
+            if user_lower in data or _normalize_blank(user_lower) in extra:
+                return 1, score
+            return 0, 0
+
+        return 0, 0
+
+    def grade_submission(self, answers: Iterable[Dict[str, Any]]) -> List[Tuple[int, str, int, float]]:
+        """
+        一次判分整份答卷
+        返回: [(题目ID, 用户答案, 是否正确, 得分)]，不在试卷中的题目被忽略
+        """
+        entries = self.entries
+        results = []
+        for ans in answers:
+            question_id = ans.get("question_id")
+            if question_id not in entries:
+                continue
+            user_answer = ans.get("answer", "")
+            is_correct, score = self.grade(question_id, user_answer)
+            results.append((question_id, user_answer, is_correct, score))
+        return results
+
+    def grade_batch(self, submissions: Iterable[Iterable[Dict[str, Any]]]) -> List[List[Tuple[int, str, int, float]]]:
+        """批量判分同一试卷的多份答卷"""
+        return [self.grade_submission(answers) for answers in submissions]
+
+
+def grade_submissions(jobs: List[Tuple["AnswerKey", List[Dict[str, Any]]]]) -> List[List[Tuple[int, str, int, float]]]:
+    """
+    判分多份答卷（可能属于不同试卷）
+    jobs: [(答案键, 答案列表)]，模块级函数，可放入任务执行器的进程池执行
+    """
+    return [key.grade_submission(answers) for key, answers in jobs]
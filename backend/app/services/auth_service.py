@@ -2,27 +2,34 @@
 楚然智考系统 - 认证服务
 处理用户认证、JWT令牌、验证码等功能
 """
-import io
-import base64
 import random
 import string
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
 from jose import JWTError, jwt
-from PIL import Image, ImageDraw, ImageFont
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, joinedload
 
 from app.config import settings
 from app.models.user import User, Role
 from app.schemas.auth import TokenData
 from app.redis_client import RedisClient
 from app.core import security
+from app.services.captcha import captcha_pool
+from app.services.role_permissions import role_permissions
+
+# 用户查询预加载角色及权限（序列化用户信息时使用，异步会话不能懒加载）
+USER_ROLES_LOADER = selectinload(User.roles).selectinload(Role.permissions)
+
+# 只预加载角色，与用户同一条SQL查出（签发令牌、/auth/me 使用，权限从角色权限快照获取）
+USER_ROLES_ONLY_LOADER = joinedload(User.roles)
 
 
 class AuthService:
     """认证服务类"""
     
-    def __init__(self, db: Session, redis: RedisClient):
+    def __init__(self, db: AsyncSession, redis: RedisClient):
         self.db = db
         self.redis = redis
     
@@ -40,18 +47,15 @@ class AuthService:
     
     # ==================== JWT令牌 ====================
     
-    def create_access_token(self, user: User) -> Tuple[str, int]:
+    async def create_access_token(self, user: User) -> Tuple[str, int]:
         """
         创建访问令牌
+        user 需已加载角色（USER_ROLES_ONLY_LOADER）
         返回: (token, expires_in)
         """
         # 获取用户角色和权限
         roles = [role.code for role in user.roles]
-        permissions = []
-        for role in user.roles:
-            for perm in role.permissions:
-                if perm.code not in permissions:
-                    permissions.append(perm.code)
+        permissions = sorted(await role_permissions.permissions_for(self.db, roles))
         
         # 构建令牌数据
         expires_delta = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -62,6 +66,7 @@ class AuthService:
             "username": user.username,
             "roles": roles,
             "permissions": permissions,
+            "ver": user.token_version or 0,
             "exp": expire
         }
         
@@ -90,7 +95,8 @@ class AuthService:
                 user_id=int(user_id),
                 username=payload.get("username"),
                 roles=payload.get("roles", []),
-                permissions=payload.get("permissions", [])
+                permissions=payload.get("permissions", []),
+                token_version=payload.get("ver", 0)
             )
         except JWTError:
             return None
@@ -102,173 +108,12 @@ class AuthService:
         生成图形验证码（4位纯数字）
         返回: (captcha_key, captcha_image_base64)
         """
-        # 生成4位纯数字验证码
-        code = ''.join(random.choices(string.digits, k=4))
+        # 从预生成的验证码池取出一张（4位纯数字）
+        code, image_base64 = await captcha_pool.pop()
         
         # 生成唯一key
         captcha_key = ''.join(random.choices(string.ascii_lowercase + string.digits, k=32))
         
-        # 创建大尺寸图片，最后再缩小
-        width, height = 160, 60
-        bg_color = (random.randint(245, 255), random.randint(245, 255), random.randint(245, 255))
-        image = Image.new('RGB', (width, height), color=bg_color)
-        draw = ImageDraw.Draw(image)
-        
-        # 添加少量干扰线
-        for _ in range(2):
-            x1 = random.randint(0, width)
-            y1 = random.randint(0, height)
-            x2 = random.randint(0, width)
-            y2 = random.randint(0, height)
-            draw.line([(x1, y1), (x2, y2)], fill=(200, 200, 200), width=1)
-        
-        # 定义大号数字的像素图案 (每个数字 12x20 像素)
-        digit_patterns = {
-            '0': [
-                "  ######  ",
-                " ##    ## ",
-                "##      ##",
-                "##      ##",
-                "##      ##",
-                "##      ##",
-                "##      ##",
-                "##      ##",
-                " ##    ## ",
-                "  ######  ",
-            ],
-            '1': [
-                "    ##    ",
-                "   ###    ",
-                "  # ##    ",
-                "    ##    ",
-                "    ##    ",
-                "    ##    ",
-                "    ##    ",
-                "    ##    ",
-                "    ##    ",
-                " ######## ",
-            ],
-            '2': [
-                " ######## ",
-                "##      ##",
-                "        ##",
-                "       ## ",
-                "     ##   ",
-                "   ##     ",
-                " ##       ",
-                "##        ",
-                "##        ",
-                "##########",
-            ],
-            '3': [
-                " ######## ",
-                "##      ##",
-                "        ##",
-                "       ## ",
-                "   #####  ",
-                "       ## ",
-                "        ##",
-                "        ##",
-                "##      ##",
-                " ######## ",
-            ],
-            '4': [
-                "      ##  ",
-                "     ###  ",
-                "    # ##  ",
-                "   #  ##  ",
-                "  #   ##  ",
-                " #    ##  ",
-                "##########",
-                "      ##  ",
-                "      ##  ",
-                "      ##  ",
-            ],
-            '5': [
-                "##########",
-                "##        ",
-                "##        ",
-                "##        ",
-                "#######   ",
-                "       ## ",
-                "        ##",
-                "        ##",
-                "##      ##",
-                " ######## ",
-            ],
-            '6': [
-                "  ######  ",
-                " ##       ",
-                "##        ",
-                "##        ",
-                "########  ",
-                "##      ##",
-                "##      ##",
-                "##      ##",
-                " ##    ## ",
-                "  ######  ",
-            ],
-            '7': [
-                "##########",
-                "        ##",
-                "       ## ",
-                "      ##  ",
-                "     ##   ",
-                "    ##    ",
-                "   ##     ",
-                "   ##     ",
-                "   ##     ",
-                "   ##     ",
-            ],
-            '8': [
-                "  ######  ",
-                " ##    ## ",
-                "##      ##",
-                " ##    ## ",
-                "  ######  ",
-                " ##    ## ",
-                "##      ##",
-                "##      ##",
-                " ##    ## ",
-                "  ######  ",
-            ],
-            '9': [
-                "  ######  ",
-                " ##    ## ",
-                "##      ##",
-                "##      ##",
-                " ########",
-                "        ##",
-                "        ##",
-                "       ## ",
-                "      ##  ",
-                "  ####    ",
-            ],
-        }
-        
-        # 绘制每个数字
-        for i, char in enumerate(code):
-            x_offset = 10 + i * 38
-            y_offset = random.randint(5, 15)
-            color = (random.randint(20, 80), random.randint(20, 80), random.randint(20, 80))
-            
-            pattern = digit_patterns.get(char, digit_patterns['0'])
-            for row_idx, row in enumerate(pattern):
-                for col_idx, pixel in enumerate(row):
-                    if pixel == '#':
-                        # 绘制2x2像素块使数字更粗
-                        px = x_offset + col_idx * 3
-                        py = y_offset + row_idx * 4
-                        draw.rectangle([px, py, px+2, py+3], fill=color)
-        
-        # 缩放到目标尺寸
-        image = image.resize((120, 40), Image.Resampling.LANCZOS)
-        
-        # 转换为base64
-        buffer = io.BytesIO()
-        image.save(buffer, format='PNG')
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
-        
         # 存储到缓存
         await self.redis.set(
             f"captcha:{captcha_key}",
@@ -280,13 +125,14 @@ class AuthService:
     
     async def verify_captcha(self, captcha_key: str, captcha_code: str) -> bool:
         """验证图形验证码"""
-        stored_code = await self.redis.get(f"captcha:{captcha_key}")
+        # 读取后立即删除（一次往返），同一验证码只能校验一次
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.get(f"captcha:{captcha_key}")
+            pipe.delete(f"captcha:{captcha_key}")
+        stored_code = pipe.results[0]
         if not stored_code:
             return False
         
-        # 验证后删除
-        await self.redis.delete(f"captcha:{captcha_key}")
-        
         return stored_code.lower() == captcha_code.lower()
     
     # ==================== 短信验证码 ====================
@@ -349,26 +195,29 @@ class AuthService:
     
     # ==================== 用户认证 ====================
     
-    def authenticate_user(self, username: str, password: str) -> Optional[User]:
-        """通过用户名密码认证"""
-        user = self.db.query(User).filter(
-            (User.username == username) | (User.phone == username)
-        ).first()
+    async def authenticate_user(self, username: str, password: str) -> Optional[User]:
+        """
+        通过用户名或手机号 + 密码认证
+        用户禁用状态由调用方判断
+        """
+        user = (await self.db.scalars(
+            select(User).options(USER_ROLES_ONLY_LOADER).where(
+                (User.username == username) | (User.phone == username)
+            ).limit(1)
+        )).unique().first()
         
         if not user:
             return None
         if not self.verify_password(password, user.hashed_password):
             return None
-        if not user.is_active:
-            return None
         
         return user
     
-    def get_user_by_phone(self, phone: str) -> Optional[User]:
+    async def get_user_by_phone(self, phone: str) -> Optional[User]:
         """通过手机号获取用户"""
-        return self.db.query(User).filter(User.phone == phone).first()
+        return await self.db.scalar(select(User).options(USER_ROLES_LOADER).where(User.phone == phone))
     
-    def update_last_login(self, user: User):
+    async def update_last_login(self, user: User):
         """更新最后登录时间"""
         user.last_login = datetime.now()
-        self.db.commit()
+        await self.db.commit()
@@ -0,0 +1,120 @@
+"""
+楚然智考系统 - 缓存失效总线
+数据变更提交后发布带标签的失效事件（如 "exam:42"、"question:1001"、"role:*"），
+当前worker立即处理，其他worker通过Redis发布订阅收到后清理各自的进程内缓存。
+内存缓存模式下只有当前进程，发布只在本地生效
+"""
+import asyncio
+import json
+import os
+import uuid
+from fnmatch import fnmatchcase
+from typing import Callable, List, Tuple
+
+from loguru import logger
+
+from app.redis_client import redis_client, RedisClient
+
+CHANNEL = "cache:invalidate"
+
+# 失效事件处理函数：参数为事件标签，在事件循环中同步执行
+Handler = Callable[[str], None]
+
+
+def tag_matches(tag: str, event: str) -> bool:
+    """
+    缓存标签是否受事件影响
+    - 完全相同: "exam:42" 与 "exam:42"
+    - 事件更具体时影响其所属集合: "exam:42" 影响 "exam"
+    - 事件带通配符: "role:*" 影响 "role:1"、"role"，"*" 影响全部
+    """
+    return (
+        tag == event
+        or event.startswith(tag + ":")
+        or fnmatchcase(tag, event)
+        or (event.endswith(":*") and tag == event[:-2])
+    )
+
+
+class InvalidationBus:
+    """缓存失效总线"""
+
+    def __init__(self, redis: RedisClient):
+        self.redis = redis
+        self.origin = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # (处理函数, 是否只处理其他worker的事件)
+        self._handlers: List[Tuple[Handler, bool]] = []
+        self._task: asyncio.Task = None
+
+    def subscribe(self, handler: Handler, remote_only: bool = False):
+        """
+        注册本地缓存的失效处理函数
+        remote_only: 发布方已自行增量更新本地缓存时只处理其他worker的事件
+        """
+        self._handlers.append((handler, remote_only))
+
+    async def publish(self, *events: str):
+        """发布失效事件（提交事务后调用），本worker立即处理"""
+        if not events:
+            return
+        self._dispatch(events, remote=False)
+        await self.redis.publish(CHANNEL, json.dumps({"origin": self.origin, "events": list(events)}))
+
+    def _dispatch(self, events, remote: bool):
+        for event in events:
+            for handler, remote_only in self._handlers:
+                if remote_only and not remote:
+                    continue
+                try:
+                    handler(event)
+                except Exception as e:
+                    logger.error(f"缓存失效处理失败 {event}: {e}")
+
+    # ==================== 订阅 ====================
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            # Redis断开期间没有其他worker的事件可收，等待重连
+            pubsub = self.redis.pubsub()
+            if pubsub is None:
+                await asyncio.sleep(1)
+                continue
+            try:
+                await pubsub.subscribe(CHANNEL)
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    data = json.loads(message["data"])
+                    if data.get("origin") != self.origin:
+                        self._dispatch(data.get("events", []), remote=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"缓存失效订阅中断，稍后重连: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+
+# 全局缓存失效总线实例
+cache_bus = InvalidationBus(redis_client)
+# 断开期间错过了其他worker的失效事件，恢复后清空本worker的进程内缓存
+redis_client.on_reconnect(lambda: cache_bus._dispatch(["*"], remote=True))
@@ -0,0 +1,295 @@
+"""
+楚然智考系统 - 图形验证码
+数字字形在模块加载时预先栅格化为目标尺寸并量化透明度，生成验证码时用NumPy整块写入调色板图像，
+不再逐像素绘制和整图缩放；后台任务在进程池中批量生成，预先填充Redis验证码池，
+获取验证码接口只需从池中弹出一张
+"""
+import asyncio
+import base64
+import io
+import random
+import string
+from typing import List, Tuple
+
+import numpy as np
+from loguru import logger
+from PIL import Image
+
+from app.config import settings
+from app.redis_client import redis_client, RedisClient
+from app.services.task_executor import task_executor, ExecutorBusyError, ExecutorTimeoutError
+
+# 预生成的验证码池，元素为 "<验证码>:<PNG base64>"
+POOL_KEY = "captcha:pool"
+
+# 图片尺寸
+WIDTH, HEIGHT = 120, 40
+
+# 数字点阵图案（10x10），栅格化时每格放大为 3x4 像素后按图片比例缩小
+DIGIT_PATTERNS = {
+    '0': [
+        "  ######  ",
+        " ##    ## ",
+        "##      ##",
+        "##      ##",
+        "##      ##",
+        "##      ##",
+        "##      ##",
+        "##      ##",
+        " ##    ## ",
+        "  ######  ",
+    ],
+    '1': [
+        "    ##    ",
+        "   ###    ",
+        "  # ##    ",
+        "    ##    ",
+        "    ##    ",
+        "    ##    ",
+        "    ##    ",
+        "    ##    ",
+        "    ##    ",
+        " ######## ",
+    ],
+    '2': [
+        " ######## ",
+        "##      ##",
+        "        ##",
+        "       ## ",
+        "     ##   ",
+        "   ##     ",
+        " ##       ",
+        "##        ",
+        "##        ",
+        "##########",
+    ],
+    '3': [
+        " ######## ",
+        "##      ##",
+        "        ##",
+        "       ## ",
+        "   #####  ",
+        "       ## ",
+        "        ##",
+        "        ##",
+        "##      ##",
+        " ######## ",
+    ],
+    '4': [
+        "      ##  ",
+        "     ###  ",
+        "    # ##  ",
+        "   #  ##  ",
+        "  #   ##  ",
+        " #    ##  ",
+        "##########",
+        "      ##  ",
+        "      ##  ",
+        "      ##  ",
+    ],
+    '5': [
+        "##########",
+        "##        ",
+        "##        ",
+        "##        ",
+        "#######   ",
+        "       ## ",
+        "        ##",
+        "        ##",
+        "##      ##",
+        " ######## ",
+    ],
+    '6': [
+        "  ######  ",
+        " ##       ",
+        "##        ",
+        "##        ",
+        "########  ",
+        "##      ##",
+        "##      ##",
+        "##      ##",
+        " ##    ## ",
+        "  ######  ",
+    ],
+    '7': [
+        "##########",
+        "        ##",
+        "       ## ",
+        "      ##  ",
+        "     ##   ",
+        "    ##    ",
+        "   ##     ",
+        "   ##     ",
+        "   ##     ",
+        "   ##     ",
+    ],
+    '8': [
+        "  ######  ",
+        " ##    ## ",
+        "##      ##",
+        " ##    ## ",
+        "  ######  ",
+        " ##    ## ",
+        "##      ##",
+        "##      ##",
+        " ##    ## ",
+        "  ######  ",
+    ],
+    '9': [
+        "  ######  ",
+        " ##    ## ",
+        "##      ##",
+        "##      ##",
+        " ########",
+        "        ##",
+        "        ##",
+        "       ## ",
+        "      ##  ",
+        "  ####    ",
+    ],
+}
+
+
+# 字形透明度量化级数：每个数字占用调色板中 LEVELS 个颜色
+LEVELS = 15
+
+# 调色板索引：0 背景，1 干扰线，2 起每个数字 LEVELS 个由浅到深的颜色
+BG_INDEX, LINE_INDEX, GLYPH_INDEX = 0, 1, 2
+
+# 量化透明度对应的混合比例 [LEVELS, 1]
+ALPHA_STEPS = np.arange(1, LEVELS + 1, dtype=np.float32)[:, None] / LEVELS
+
+_rng = np.random.default_rng()
+
+
+def _rasterize(pattern: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    点阵图案放大为高分辨率蒙版，再缩小为目标尺寸并量化透明度
+    返回: 非透明像素的 (行坐标, 列坐标, 透明度级别 1~LEVELS)
+    """
+    cells = np.array([[ch == '#' for ch in row.ljust(10)] for row in pattern], dtype=np.uint8) * 255
+    hires = Image.fromarray(np.kron(cells, np.ones((4, 3), dtype=np.uint8)))
+    size = (round(hires.width * 0.75), round(hires.height * 2 / 3))
+    glyph = np.asarray(hires.resize(size, Image.Resampling.LANCZOS), dtype=np.float32) / 255.0
+    levels = np.rint(glyph * LEVELS).astype(np.uint8)
+    rows, cols = np.nonzero(levels)
+    return rows, cols, levels[rows, cols]
+
+
+# 各数字的预栅格化字形（进程内只生成一次）
+GLYPHS = {digit: _rasterize(pattern) for digit, pattern in DIGIT_PATTERNS.items()}
+GLYPH_HEIGHT = max(rows.max() for rows, _, _ in GLYPHS.values()) + 1
+
+
+def render_captcha(code: str) -> str:
+    """
+    渲染验证码图片
+    画布只记录调色板索引，字形按预先计算的坐标整块写入，颜色混合放在调色板中完成
+    返回: PNG图片的base64编码
+    """
+    canvas = np.full((HEIGHT, WIDTH), BG_INDEX, dtype=np.uint8)
+
+    # 添加少量干扰线
+    for x1, y1, x2, y2 in _rng.integers(0, [WIDTH, HEIGHT, WIDTH, HEIGHT], size=(2, 4)).tolist():
+        steps = max(abs(x2 - x1), abs(y2 - y1), 1)
+        t = np.arange(steps + 1) / steps
+        canvas[np.rint(y1 + (y2 - y1) * t).astype(np.intp), np.rint(x1 + (x2 - x1) * t).astype(np.intp)] = LINE_INDEX
+
+    # 写入字形
+    y_offsets = _rng.integers(3, HEIGHT - GLYPH_HEIGHT - 3, size=len(code), endpoint=True).tolist()
+    for i, char in enumerate(code):
+        rows, cols, levels = GLYPHS.get(char, GLYPHS['0'])
+        x = round((10 + i * 38) * 0.75)
+        canvas[rows + y_offsets[i], cols + x] = levels + (GLYPH_INDEX - 1 + i * LEVELS)
+
+    # 调色板：背景色 + 干扰线 + 每个数字的颜色按透明度与背景混合
+    bg_color = _rng.integers(245, 256, size=3).astype(np.float32)
+    colors = _rng.integers(20, 81, size=(len(code), 1, 3)).astype(np.float32)
+    palette = np.vstack([
+        bg_color,
+        np.full(3, 200, dtype=np.float32),
+        (bg_color + (colors - bg_color) * ALPHA_STEPS).reshape(-1, 3)
+    ])
+
+    image = Image.fromarray(canvas, 'P')
+    image.putpalette(np.rint(palette).astype(np.uint8).tobytes())
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def new_captcha() -> Tuple[str, str]:
+    """生成4位纯数字验证码及其图片，返回: (code, image_base64)"""
+    code = ''.join(random.choices(string.digits, k=4))
+    return code, render_captcha(code)
+
+
+def generate_captchas(count: int) -> List[Tuple[str, str]]:
+    """批量生成验证码（模块级函数，可在进程池中执行）"""
+    return [new_captcha() for _ in range(count)]
+
+
+class CaptchaPool:
+    """
+    预生成验证码池
+    后台任务保持池中约 size 张验证码，每个worker各自补充，
+    多个worker同时补充时最多超出 worker数 x batch_size 张
+    """
+
+    def __init__(self, redis: RedisClient, size: int = None, batch_size: int = None):
+        self.redis = redis
+        self.size = size or settings.CAPTCHA_POOL_SIZE
+        self.batch_size = batch_size or settings.CAPTCHA_POOL_BATCH
+        self.interval = settings.CAPTCHA_POOL_REFILL_INTERVAL
+        self._task: asyncio.Task = None
+
+    async def pop(self) -> Tuple[str, str]:
+        """取出一张验证码，返回: (code, image_base64)；池已取空时直接生成"""
+        items = await self.redis.rpop(POOL_KEY, 1)
+        if items:
+            code, _, image = items[0].partition(":")
+            return code, image
+        return new_captcha()
+
+    async def refill(self) -> int:
+        """补充验证码池至目标数量，返回本次补充数量"""
+        missing = self.size - await self.redis.llen(POOL_KEY)
+        added = 0
+        while missing > 0:
+            batch = await task_executor.run_cpu(generate_captchas, min(self.batch_size, missing))
+            await self.redis.lpush(POOL_KEY, *[f"{code}:{image}" for code, image in batch])
+            added += len(batch)
+            missing -= len(batch)
+        return added
+
+    # ==================== 后台补充 ====================
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refill()
+            except asyncio.CancelledError:
+                raise
+            except (ExecutorBusyError, ExecutorTimeoutError) as e:
+                logger.warning(f"验证码池补充跳过: {e}")
+            except Exception as e:
+                logger.error(f"验证码池补充失败: {e}")
+            await asyncio.sleep(self.interval)
+
+
+# 全局验证码池实例
+captcha_pool = CaptchaPool(redis_client)
@@ -4,70 +4,91 @@
 """
 import json
 import re
-from datetime import datetime, timedelta
+import hashlib
+from datetime import date, datetime, timedelta
 from typing import Optional, List, Tuple, Dict, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from collections import Counter
+from sqlalchemy import select, func, insert, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.sql import Select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 
+from app.config import settings
 from app.models.question import Question, QuestionType
 from app.models.exam import (
     Exam, ExamQuestion, ExamRecord, ExamAnswer,
     WrongQuestion, StudyRecord, ExamType, ExamStatus, RecordStatus,
     ExamQuestionBank,
 )
-from app.schemas.exam import ExamCreate, ExamUpdate, RandomExamConfig
+from app.schemas.exam import ExamCreate, ExamUpdate, ExamResponse, RandomExamConfig
 from app.services.question_service import QuestionService
+from app.services.question_sampler import question_sampler
+from app.services.question_counters import question_counters
+from app.services.answer_key import AnswerKey, grade_submissions
+from app.services.task_executor import task_executor
+from app.services.query_cache import cached, query_cache
+from app.services.pagination import Page, PageParams, paginate
 
 
 class ExamService:
     """考试服务类"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.question_service = QuestionService(db)
     
     # ==================== 考试管理 ====================
     
-    def get_exam_by_id(self, exam_id: int) -> Optional[Exam]:
+    async def get_exam_by_id(self, exam_id: int) -> Optional[Exam]:
         """根据ID获取考试"""
-        return self.db.query(Exam).filter(Exam.id == exam_id).first()
+        return await self.db.scalar(select(Exam).where(Exam.id == exam_id))
     
-    def get_exams(
+    async def get_exams(
         self,
-        skip: int = 0,
-        limit: int = 20,
+        page: PageParams = None,
         keyword: str = None,
         exam_type: str = None,
         status: str = None
-    ) -> Tuple[List[Exam], int]:
-        """获取考试列表"""
-        query = self.db.query(Exam)
+    ) -> Page:
+        """获取考试列表（游标分页按 id 倒序）"""
+        query = select(Exam)
         
         if keyword:
-            query = query.filter(Exam.title.contains(keyword))
+            query = query.where(Exam.title.contains(keyword))
         
         if exam_type:
-            query = query.filter(Exam.exam_type == exam_type)
+            query = query.where(Exam.exam_type == exam_type)
         
         if status:
-            query = query.filter(Exam.status == status)
+            query = query.where(Exam.status == status)
         
-        total = query.count()
-        exams = query.order_by(Exam.id.desc()).offset(skip).limit(limit).all()
-        
-        return exams, total
+        return await paginate(
+            self.db, query, [(Exam.id, True)], page or PageParams(),
+            count_tags=("exam",), table=Exam.__tablename__
+        )
     
-    def get_available_exams(self, user_id: int) -> List[Exam]:
-        """获取用户可参加的考试"""
+    async def get_available_exams(self, user_id: int) -> List[Dict[str, Any]]:
+        """
+        获取用户可参加的考试
+        已发布考试列表对所有用户相同，走查询缓存；开放时间在每次请求时按当前时间过滤
+        """
         now = datetime.now()
-        query = self.db.query(Exam).filter(
-            Exam.status == ExamStatus.PUBLISHED,
-            (Exam.start_time == None) | (Exam.start_time <= now),
-            (Exam.end_time == None) | (Exam.end_time >= now)
-        )
-        return query.order_by(Exam.id.desc()).all()
+        return [
+            exam for exam in await self.get_published_exams()
+            if (exam["start_time"] is None or datetime.fromisoformat(exam["start_time"]) <= now)
+            and (exam["end_time"] is None or datetime.fromisoformat(exam["end_time"]) >= now)
+        ]
     
-    def create_exam(self, exam_data: ExamCreate, creator_id: int = None) -> Exam:
+    @cached("published_exams", ttl=60, tags=("exam",), stale_ttl=60)
+    async def get_published_exams(self) -> List[Dict[str, Any]]:
+        """获取已发布的考试（序列化结果）"""
+        exams = (await self.db.scalars(
+            select(Exam).where(Exam.status == ExamStatus.PUBLISHED).order_by(Exam.id.desc())
+        )).all()
+        return [ExamResponse.model_validate(exam).model_dump(mode="json") for exam in exams]
+    
+    async def create_exam(self, exam_data: ExamCreate, creator_id: int = None) -> Exam:
         """创建考试"""
         # 处理随机组卷配置
         random_config_json = None
@@ -94,7 +115,7 @@ class ExamService:
         )
         
         self.db.add(exam)
-        self.db.flush()
+        await self.db.flush()
         
         # 保存考试与题库的关联
         if exam_data.bank_ids:
@@ -105,7 +126,7 @@ class ExamService:
         # 固定组卷：添加指定题目
         if not exam_data.is_random and exam_data.question_ids:
             for i, q_id in enumerate(exam_data.question_ids):
-                question = self.question_service.get_question_by_id(q_id)
+                question = await self.question_service.get_question_by_id(q_id)
                 if question:
                     eq = ExamQuestion(
                         exam_id=exam.id,
@@ -116,14 +137,15 @@ class ExamService:
                     self.db.add(eq)
             exam.question_count = len(exam_data.question_ids)
 
-        self.db.commit()
-        self.db.refresh(exam)
+        await self.db.commit()
+        await self.db.refresh(exam)
+        await query_cache.invalidate_tags(f"exam:{exam.id}")
         
         return exam
     
-    def update_exam(self, exam_id: int, exam_data: ExamUpdate) -> Optional[Exam]:
+    async def update_exam(self, exam_id: int, exam_data: ExamUpdate) -> Optional[Exam]:
         """更新考试"""
-        exam = self.get_exam_by_id(exam_id)
+        exam = await self.get_exam_by_id(exam_id)
         if not exam:
             return None
         
@@ -138,9 +160,9 @@ class ExamService:
         
         # 更新题目
         if exam_data.question_ids is not None:
-            self.db.query(ExamQuestion).filter(ExamQuestion.exam_id == exam_id).delete()
+            await self.db.execute(delete(ExamQuestion).where(ExamQuestion.exam_id == exam_id))
             for i, q_id in enumerate(exam_data.question_ids):
-                question = self.question_service.get_question_by_id(q_id)
+                question = await self.question_service.get_question_by_id(q_id)
                 if question:
                     eq = ExamQuestion(
                         exam_id=exam_id,
@@ -151,92 +173,91 @@ class ExamService:
                     self.db.add(eq)
             exam.question_count = len(exam_data.question_ids)
         
-        self.db.commit()
-        self.db.refresh(exam)
+        await self.db.commit()
+        await self.db.refresh(exam)
+        await query_cache.invalidate_tags(f"exam:{exam.id}")
         
         return exam
     
-    def delete_exam(self, exam_id: int) -> bool:
+    async def delete_exam(self, exam_id: int) -> bool:
         """删除考试及其所有关联数据"""
-        exam = self.get_exam_by_id(exam_id)
+        exam = await self.get_exam_by_id(exam_id)
         if not exam:
             return False
         
+        no_sync = {"synchronize_session": False}
         # 删除考试答案（先删除子表）
-        self.db.query(ExamAnswer).filter(
+        await self.db.execute(delete(ExamAnswer).where(
             ExamAnswer.record_id.in_(
-                self.db.query(ExamRecord.id).filter(ExamRecord.exam_id == exam_id)
+                select(ExamRecord.id).where(ExamRecord.exam_id == exam_id)
             )
-        ).delete(synchronize_session=False)
+        ), execution_options=no_sync)
         
         # 删除考试记录
-        self.db.query(ExamRecord).filter(ExamRecord.exam_id == exam_id).delete(synchronize_session=False)
+        await self.db.execute(delete(ExamRecord).where(ExamRecord.exam_id == exam_id), execution_options=no_sync)
         
         # 删除考试题目关联
-        self.db.query(ExamQuestion).filter(ExamQuestion.exam_id == exam_id).delete(synchronize_session=False)
+        await self.db.execute(delete(ExamQuestion).where(ExamQuestion.exam_id == exam_id), execution_options=no_sync)
         
         # 删除考试
-        self.db.delete(exam)
-        self.db.commit()
+        await self.db.delete(exam)
+        await self.db.commit()
+        await query_cache.invalidate_tags(f"exam:{exam_id}")
         
         return True
     
-    def publish_exam(self, exam_id: int) -> Optional[Exam]:
+    async def publish_exam(self, exam_id: int) -> Optional[Exam]:
         """发布考试"""
-        exam = self.get_exam_by_id(exam_id)
+        exam = await self.get_exam_by_id(exam_id)
         if not exam:
             return None
         
         exam.status = ExamStatus.PUBLISHED
-        self.db.commit()
-        self.db.refresh(exam)
+        await self.db.commit()
+        await self.db.refresh(exam)
+        await query_cache.invalidate_tags(f"exam:{exam.id}")
         
         return exam
     
     # ==================== 组卷引擎 ====================
     
-    def generate_exam_questions(self, exam: Exam) -> List[Question]:
+    async def generate_exam_questions(self, exam: Exam) -> List[Question]:
         """
         生成考试题目
         支持固定组卷和随机组卷
         """
         # 优先使用统一随机抽题配置（基于 random_question_count / question_type_filter / 多题库）
         if exam.random_question_count and exam.random_question_count > 0:
-            query = self.db.query(Question).filter(Question.is_active == 1)
-
             # 按题库过滤（多题库）
-            if getattr(exam, "banks", None):
-                bank_ids = [link.bank_id for link in exam.banks]
-                if bank_ids:
-                    query = query.filter(Question.bank_id.in_(bank_ids))
+            bank_ids = list((await self.db.scalars(
+                select(ExamQuestionBank.bank_id).where(ExamQuestionBank.exam_id == exam.id)
+            )).all()) or None
 
             # 按题型过滤
+            question_types = None
             if exam.question_type_filter == "single":
-                query = query.filter(Question.question_type == QuestionType.SINGLE_CHOICE)
+                question_types = [QuestionType.SINGLE_CHOICE]
             elif exam.question_type_filter == "multiple":
-                query = query.filter(Question.question_type == QuestionType.MULTIPLE_CHOICE)
+                question_types = [QuestionType.MULTIPLE_CHOICE]
 
-            # 随机抽题（MySQL 使用 RAND）
-            questions = (
-                query
-                .order_by(func.rand())
-                .limit(exam.random_question_count)
-                .all()
+            # 从内存索引随机抽取ID，再按ID加载题目
+            question_ids = await question_sampler.sample(
+                self.db,
+                exam.random_question_count,
+                bank_ids=bank_ids,
+                question_types=question_types
             )
-            return questions
+            return await self.question_service.get_questions_by_ids(question_ids)
 
         if not exam.is_random:
-            # 固定组卷：返回预设题目
-            exam_questions = self.db.query(ExamQuestion).filter(
-                ExamQuestion.exam_id == exam.id
-            ).order_by(ExamQuestion.sort_order).all()
-            
-            questions = []
-            for eq in exam_questions:
-                question = self.question_service.get_question_by_id(eq.question_id)
-                if question:
-                    questions.append(question)
-            return questions
+            # 固定组卷：一次联表查询返回预设题目
+            return list((await self.db.scalars(
+                select(Question).join(
+                    ExamQuestion, ExamQuestion.question_id == Question.id
+                ).where(
+                    ExamQuestion.exam_id == exam.id
+                ).order_by(ExamQuestion.sort_order)
+            )).all())
         
         # 随机组卷
         if not exam.random_config:
@@ -252,7 +273,7 @@ class ExamService:
             knowledge_ids = item.get("knowledge_ids")
             difficulty = item.get("difficulty")
             
-            random_questions = self.question_service.get_random_questions(
+            random_questions = await self.question_service.get_random_questions(
                 count=count,
                 question_type=q_type,
                 difficulty=difficulty,
@@ -266,14 +287,108 @@ class ExamService:
         
         return questions
     
+    # ==================== 试卷快照 ====================
+    
+    @staticmethod
+    def compute_key_version(questions: List[Question]) -> str:
+        """计算答案版本：题目ID与标准答案的摘要，答案被修改后版本随之变化"""
+        digest = hashlib.md5()
+        for q in questions:
+            digest.update(f"{q.id}:{q.answer}\n".encode("utf-8"))
+        return digest.hexdigest()
+    
+    async def create_paper_snapshot(self, exam: Exam) -> Tuple[List[Question], Dict[str, Any]]:
+        """
+        组卷并生成试卷快照
+        返回: (题目列表, 快照)，快照包含有序题目ID、分值和答案版本
+        """
+        questions = await self.generate_exam_questions(exam)
+        snapshot = {
+            "question_ids": [q.id for q in questions],
+            "scores": [q.score for q in questions],
+            "key_version": self.compute_key_version(questions),
+        }
+        return questions, snapshot
+    
+    @staticmethod
+    def question_brief_dict(question: Question, with_answer: bool = False) -> Dict[str, Any]:
+        """题目转为考试用的简要信息（与 QuestionBrief 字段一致）"""
+        options = None
+        if question.options:
+            try:
+                options = json.loads(question.options)
+            except (TypeError, ValueError):
+                pass
+        return {
+            "id": question.id,
+            "question_type": question.question_type.value,
+            "title": question.title,
+            "options": options,
+            "score": question.score,
+            "image_url": question.image_url,
+            "answer": question.answer if with_answer else None,
+            "analysis": question.analysis if with_answer else None,
+        }
+    
+    async def build_paper_payload(self, exam: Exam) -> Dict[str, Any]:
+        """
+        构建固定试卷的缓存内容
+        包含快照字段（题目ID、分值、答案版本）以及考生视图和练习视图两份题目列表
+        """
+        questions, snapshot = await self.create_paper_snapshot(exam)
+        return {
+            "exam_id": exam.id,
+            **snapshot,
+            "student": [self.question_brief_dict(q) for q in questions],
+            "practice": [self.question_brief_dict(q, with_answer=True) for q in questions],
+        }
+    
+    async def get_exam_ids_by_question(self, question_id: int) -> List[int]:
+        """获取包含指定题目的固定试卷考试ID"""
+        rows = await self.db.scalars(
+            select(ExamQuestion.exam_id).where(
+                ExamQuestion.question_id == question_id
+            ).distinct()
+        )
+        return list(rows.all())
+    
+    async def get_record_paper(self, record: ExamRecord, exam: Exam = None) -> Dict[str, Any]:
+        """
+        读取考试记录的试卷快照
+        历史记录没有快照时重新组卷；进行中的记录会补写快照，保证后续作答与交卷一致
+        """
+        if record.paper_snapshot:
+            return json.loads(record.paper_snapshot)
+        
+        exam = exam or await self.get_exam_by_id(record.exam_id)
+        if not exam:
+            return {"question_ids": [], "scores": [], "key_version": ""}
+        
+        _, snapshot = await self.create_paper_snapshot(exam)
+        if record.status == RecordStatus.IN_PROGRESS:
+            record.paper_snapshot = json.dumps(snapshot)
+            await self.db.commit()
+        return snapshot
+    
+    async def get_paper_questions(self, paper: Dict[str, Any]) -> List[Question]:
+        """按快照顺序一次性加载试卷题目（已删除的题目会被跳过）"""
+        return await self.question_service.get_questions_by_ids(paper["question_ids"])
+    
     # ==================== 考试流程 ====================
     
-    def start_exam(self, user_id: int, exam_id: int) -> Tuple[Optional[ExamRecord], str]:
+    async def start_exam(
+        self,
+        user_id: int,
+        exam_id: int,
+        paper: Dict[str, Any] = None
+    ) -> Tuple[Optional[ExamRecord], str]:
         """
         开始考试
+        paper: 已缓存的固定试卷，传入时直接用其快照字段，无需再组卷
+        并发安全由调用方的 (用户, 考试) 分布式锁保证
         返回: (考试记录, 错误信息)
         """
-        exam = self.get_exam_by_id(exam_id)
+        exam = await self.get_exam_by_id(exam_id)
         if not exam:
             return None, "考试不存在"
         
@@ -287,108 +402,343 @@ class ExamService:
         if exam.end_time and now > exam.end_time:
             return None, "考试已结束"
         
+        # 有未完成的考试时继续作答（不算新的尝试）
+        ongoing = await self.db.scalar(select(ExamRecord).where(
+            ExamRecord.user_id == user_id,
+            ExamRecord.exam_id == exam_id,
+            ExamRecord.status == RecordStatus.IN_PROGRESS
+        ).limit(1))
+        if ongoing:
+            return ongoing, ""
+        
         # 检查尝试次数
         if exam.max_attempts > 0:
-            attempt_count = self.db.query(ExamRecord).filter(
+            attempt_count = await self.db.scalar(select(func.count(ExamRecord.id)).where(
                 ExamRecord.user_id == user_id,
                 ExamRecord.exam_id == exam_id
-            ).count()
+            ))
             if attempt_count >= exam.max_attempts:
                 return None, f"已达到最大尝试次数({exam.max_attempts}次)"
         
-        # 检查是否有未完成的考试
-        ongoing = self.db.query(ExamRecord).filter(
-            ExamRecord.user_id == user_id,
-            ExamRecord.exam_id == exam_id,
-            ExamRecord.status == RecordStatus.IN_PROGRESS
-        ).first()
-        if ongoing:
-            return ongoing, ""
+        # 组卷并冻结试卷快照，交卷时按快照判分
+        if paper:
+            snapshot = {
+                "question_ids": paper["question_ids"],
+                "scores": paper["scores"],
+                "key_version": paper["key_version"],
+            }
+        else:
+            _, snapshot = await self.create_paper_snapshot(exam)
         
         # 创建考试记录
         record = ExamRecord(
             user_id=user_id,
             exam_id=exam_id,
             status=RecordStatus.IN_PROGRESS,
-            start_time=now
+            start_time=now,
+            paper_snapshot=json.dumps(snapshot)
         )
         
         self.db.add(record)
-        self.db.commit()
-        self.db.refresh(record)
+        await self.db.commit()
+        await self.db.refresh(record)
         
         return record, ""
     
-    def submit_exam(
+    async def _get_submittable_record(self, record_id: int) -> Tuple[Optional[ExamRecord], Optional[Exam], str]:
+        """
+        获取可交卷的考试记录及其考试
+        记录加行锁直到调用方提交事务，与超时自动交卷、其他交卷请求互斥，
+        等锁后读到的是最新状态，已被交卷的记录返回"考试已提交"
+        """
+        record = await self.db.scalar(
+            select(ExamRecord).where(ExamRecord.id == record_id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        if not record:
+            return None, None, "考试记录不存在"
+        
+        if record.status != RecordStatus.IN_PROGRESS:
+            return None, None, "考试已提交"
+        
+        exam = await self.get_exam_by_id(record.exam_id)
+        if not exam:
+            return None, None, "考试不存在"
+        
+        return record, exam, ""
+    
+    async def submit_exam(
         self, 
         record_id: int, 
         answers: List[Dict[str, Any]]
     ) -> Tuple[Optional[ExamRecord], str]:
         """
-        提交考试
+        提交考试（同步判分）
         返回: (考试记录, 错误信息)
         """
-        record = self.db.query(ExamRecord).filter(ExamRecord.id == record_id).first()
-        if not record:
-            return None, "考试记录不存在"
+        record, exam, error = await self._get_submittable_record(record_id)
+        if error:
+            return None, error
+        
+        # 读取开考时冻结的试卷快照，不再重新组卷
+        paper = await self.get_record_paper(record, exam)
+        question_map = {q.id: q for q in await self.get_paper_questions(paper)}
+        
+        answer_key = self._compile_answer_key(paper, question_map)
+        graded = (await self._grade_submissions([(answer_key, answers)]))[0]
+        counter_deltas = await self.grade_record(
+            record, exam, paper, question_map, answers, datetime.now(), graded=graded
+        )
         
-        if record.status != RecordStatus.IN_PROGRESS:
-            return None, "考试已提交"
+        await self.db.commit()
+        await self.db.refresh(record)
         
-        exam = self.get_exam_by_id(record.exam_id)
-        if not exam:
-            return None, "考试不存在"
+        # 题目使用次数/正确次数写入计数缓冲，由后台任务批量写库
+        question_counters.add(counter_deltas)
+        
+        return record, ""
+    
+    async def accept_submission(
+        self,
+        record_id: int,
+        answers: List[Dict[str, Any]]
+    ) -> Tuple[Optional[ExamRecord], str]:
+        """
+        提交考试（异步判分）
+        只保存原始答案并标记为已提交，判分由后台判分任务完成
+        返回: (考试记录, 错误信息)
+        """
+        record, exam, error = await self._get_submittable_record(record_id)
+        if error:
+            return None, error
         
-        # 获取考试题目
-        questions = self.generate_exam_questions(exam)
-        question_map = {q.id: q for q in questions}
+        now = datetime.now()
+        record.status = RecordStatus.SUBMITTED
+        record.submit_time = now
+        record.duration = int((now - record.start_time).total_seconds())
+        record.submitted_answers = json.dumps(answers, ensure_ascii=False)
         
-        # 处理答案并判分
+        await self.db.commit()
+        await self.db.refresh(record)
+        
+        return record, ""
+    
+    async def grade_submitted_records(self, record_ids: List[int]) -> int:
+        """
+        批量判分已提交的考试记录
+        已被其他判分任务锁定或已判分的记录会被跳过，返回本次判分数量
+        """
+        records = (await self.db.scalars(select(ExamRecord).where(
+            ExamRecord.id.in_(record_ids),
+            ExamRecord.status == RecordStatus.SUBMITTED
+        ).with_for_update(skip_locked=True))).all()
+        if not records:
+            await self.db.rollback()
+            return 0
+        
+        exam_map = {
+            e.id: e for e in
+            (await self.db.scalars(select(Exam).where(Exam.id.in_({r.exam_id for r in records})))).all()
+        }
+        
+        # 同一批次的试卷题目一次加载
+        papers = {r.id: await self.get_record_paper(r, exam_map.get(r.exam_id)) for r in records}
+        question_ids = {q_id for paper in papers.values() for q_id in paper["question_ids"]}
+        question_map = {
+            q.id: q for q in
+            (await self.db.scalars(select(Question).where(Question.id.in_(question_ids)))).all()
+        } if question_ids else {}
+        
+        # 同一试卷（题目、答案、分值均相同）的答案键只编译一次
+        answer_keys: Dict[Tuple, AnswerKey] = {}
+        jobs = []
+        for record in records:
+            if record.exam_id not in exam_map:
+                continue
+            paper = papers[record.id]
+            key = (paper["key_version"], tuple(paper["question_ids"]), tuple(paper["scores"]))
+            if key not in answer_keys:
+                answer_keys[key] = self._compile_answer_key(paper, question_map)
+            jobs.append((record, answer_keys[key], json.loads(record.submitted_answers or "[]")))
+        
+        # 整批答卷一次判分，答案量大时在进程池中计算
+        results = await self._grade_submissions([(answer_key, answers) for _, answer_key, answers in jobs])
+        
+        graded = 0
+        counter_deltas = []
+        for (record, _, answers), result in zip(jobs, results):
+            counter_deltas.append(await self.grade_record(
+                record, exam_map[record.exam_id], papers[record.id], question_map, answers,
+                record.submit_time, graded=result
+            ))
+            record.submitted_answers = None
+            graded += 1
+        
+        await self.db.commit()
+        
+        for deltas in counter_deltas:
+            question_counters.add(deltas)
+        return graded
+    
+    async def get_stale_submitted_record_ids(self, before: datetime, limit: int = 1000) -> List[int]:
+        """获取提交时间早于指定时间仍未判分的记录ID（判分队列丢失时兜底）"""
+        rows = await self.db.scalars(select(ExamRecord.id).where(
+            ExamRecord.status == RecordStatus.SUBMITTED,
+            ExamRecord.submit_time < before
+        ).limit(limit))
+        return list(rows.all())
+    
+    async def get_expired_record_ids(self, grace_seconds: int = 0, limit: int = 200) -> List[int]:
+        """
+        获取已超过考试时长仍在进行中的考试记录ID
+        按考试时长分组，每组走 (status, start_time) 索引范围扫描
+        """
+        now = datetime.now()
+        durations = (await self.db.scalars(
+            select(Exam.duration).where(Exam.duration.isnot(None)).distinct()
+        )).all()
+        record_ids = []
+        for duration in durations:
+            deadline = now - timedelta(minutes=duration, seconds=grace_seconds)
+            rows = await self.db.scalars(select(ExamRecord.id).join(
+                Exam, Exam.id == ExamRecord.exam_id
+            ).where(
+                ExamRecord.status == RecordStatus.IN_PROGRESS,
+                ExamRecord.start_time < deadline,
+                Exam.duration == duration
+            ).order_by(ExamRecord.start_time).limit(limit - len(record_ids)))
+            record_ids.extend(rows.all())
+            if len(record_ids) >= limit:
+                break
+        return record_ids
+    
+    async def expire_records(self, record_answers: Dict[int, List[Dict[str, Any]]]) -> List[int]:
+        """
+        超时的考试记录按已保存的答案自动交卷（标记为已提交，交卷时间记为考试结束时间）
+        返回实际交卷的记录ID，之后由 grade_submitted_records 批量判分
+        """
+        # 正在交卷的记录已被交卷请求锁定，跳过；锁定后再按最新状态确认仍在进行中
+        records = (await self.db.scalars(select(ExamRecord).where(
+            ExamRecord.id.in_(list(record_answers)),
+            ExamRecord.status == RecordStatus.IN_PROGRESS
+        ).with_for_update(skip_locked=True).execution_options(populate_existing=True))).all()
+        if not records:
+            await self.db.rollback()
+            return []
+        
+        durations = dict((await self.db.execute(select(Exam.id, Exam.duration).where(
+            Exam.id.in_({r.exam_id for r in records})
+        ))).all())
+        now = datetime.now()
+        for record in records:
+            end_time = record.start_time + timedelta(minutes=durations.get(record.exam_id) or 0)
+            record.status = RecordStatus.SUBMITTED
+            record.submit_time = min(end_time, now)
+            record.duration = int((record.submit_time - record.start_time).total_seconds())
+            record.submitted_answers = json.dumps(record_answers.get(record.id, []), ensure_ascii=False)
+        
+        await self.db.commit()
+        return [r.id for r in records]
+    
+    @staticmethod
+    def _compile_answer_key(paper: Dict[str, Any], question_map: Dict[int, Question]) -> AnswerKey:
+        """按试卷快照编译答案键（分值以快照为准）"""
+        return AnswerKey.compile(
+            (question_map[q_id] for q_id in paper["question_ids"] if q_id in question_map),
+            dict(zip(paper["question_ids"], paper["scores"]))
+        )
+    
+    @staticmethod
+    async def _grade_submissions(jobs: List[Tuple[AnswerKey, List[Dict[str, Any]]]]) -> List[List[Tuple[int, str, int, float]]]:
+        """
+        判分多份答卷
+        答案总数达到 GRADING_OFFLOAD_MIN_ANSWERS 时放入进程池计算；
+        答案较少时直接计算，进程间传输的开销比判分本身更大
+        """
+        if sum(len(answers) for _, answers in jobs) >= settings.GRADING_OFFLOAD_MIN_ANSWERS:
+            return await task_executor.run_cpu(grade_submissions, jobs)
+        return grade_submissions(jobs)
+    
+    async def grade_record(
+        self,
+        record: ExamRecord,
+        exam: Exam,
+        paper: Dict[str, Any],
+        question_map: Dict[int, Question],
+        answers: List[Dict[str, Any]],
+        submit_time: datetime,
+        answer_key: AnswerKey = None,
+        graded: List[Tuple[int, str, int, float]] = None
+    ):
+        """
+        判分并写入答题记录、错题本、学习记录，更新考试记录为已判分
+        不提交事务，由调用方统一提交
+        answer_key: 预编译的答案键，未提供时按试卷快照编译
+        graded: 已算好的判分结果（grade_submission 的返回值），提供时不再判分
+        返回: 题目计数增量 {题目ID: (使用次数增量, 正确次数增量)}
+        """
+        record_id = record.id
+        question_ids = paper["question_ids"]
+        
+        # 处理答案并判分（仅在内存中计算，持久化统一批量完成）
         total_score = 0
         correct_count = 0
         wrong_count = 0
+        answer_rows = []
+        wrong_rows = []
+        use_deltas = Counter()
+        correct_deltas = Counter()
+        now = datetime.now()
         
-        for ans in answers:
-            question_id = ans.get("question_id")
-            user_answer = ans.get("answer", "")
-            
-            question = question_map.get(question_id)
-            if not question:
-                continue
-            
-            # 判分
-            is_correct, score = self.grade_answer(question, user_answer)
-            
-            # 保存答题记录
-            exam_answer = ExamAnswer(
-                record_id=record_id,
-                question_id=question_id,
-                user_answer=user_answer,
-                is_correct=is_correct,
-                score=score
-            )
-            self.db.add(exam_answer)
+        # 按编译答案键一次判分整份答卷（分值以快照为准）
+        if graded is None:
+            if answer_key is None:
+                answer_key = self._compile_answer_key(paper, question_map)
+            graded = answer_key.grade_submission(answers)
+        
+        for question_id, user_answer, is_correct, score in graded:
+            answer_rows.append({
+                "record_id": record_id,
+                "question_id": question_id,
+                "user_answer": user_answer,
+                "is_correct": is_correct,
+                "score": score,
+                "created_at": now,
+                "updated_at": now,
+            })
             
             total_score += score
+            use_deltas[question_id] += 1
             if is_correct == 1:
                 correct_count += 1
-                # 更新题目正确率
-                question.correct_count += 1
+                correct_deltas[question_id] += 1
             else:
                 wrong_count += 1
-                # 记录错题
-                self.add_wrong_question(record.user_id, question_id, user_answer)
-            
-            # 更新题目使用次数
-            question.use_count += 1
+                wrong_rows.append({
+                    "user_id": record.user_id,
+                    "question_id": question_id,
+                    "wrong_count": 1,
+                    "last_wrong_answer": user_answer,
+                    "is_mastered": 0,
+                    "created_at": now,
+                    "updated_at": now,
+                })
+        
+        # 批量持久化：轮次固定，与试卷题量无关
+        # 1. 答题记录一次批量插入
+        if answer_rows:
+            await self.db.execute(insert(ExamAnswer), answer_rows)
+        
+        # 2. 错题本 INSERT ... ON DUPLICATE KEY UPDATE
+        await self.upsert_wrong_questions(wrong_rows)
         
         # 计算未答题数
-        unanswered_count = len(questions) - len(answers)
+        unanswered_count = len(question_ids) - len(answers)
         
         # 更新考试记录
-        now = datetime.now()
-        duration = int((now - record.start_time).total_seconds())
-        accuracy = (correct_count / len(questions) * 100) if questions else 0
+        duration = int((submit_time - record.start_time).total_seconds())
+        accuracy = (correct_count / len(question_ids) * 100) if question_ids else 0
         
         record.status = RecordStatus.GRADED
         record.score = total_score
@@ -397,33 +747,53 @@ class ExamService:
         record.unanswered_count = unanswered_count
         record.accuracy = round(accuracy, 2)
         record.duration = duration
-        record.submit_time = now
+        record.submit_time = submit_time
         record.is_passed = 1 if total_score >= exam.pass_score else 0
         
-        # 更新学习记录
-        self.update_study_record(record.user_id, len(questions), correct_count, 1)
-        
-        self.db.commit()
-        self.db.refresh(record)
+        # 3. 更新当日学习记录
+        await self.update_study_record(record.user_id, len(question_ids), correct_count, 1)
         
-        return record, ""
+        # 题目使用次数/正确次数增量，由调用方在事务提交后写入计数缓冲
+        return {q_id: (use_deltas[q_id], correct_deltas[q_id]) for q_id in use_deltas}
+    
+    async def upsert_wrong_questions(self, rows: List[Dict[str, Any]]):
+        """
+        批量写入错题本
+        依赖 idx_wrong_user_question 唯一索引，已存在的错题累加错误次数并重置掌握状态
+        """
+        if not rows:
+            return
+        
+        stmt = mysql_insert(WrongQuestion).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            wrong_count=WrongQuestion.wrong_count + 1,
+            last_wrong_answer=stmt.inserted.last_wrong_answer,
+            is_mastered=0,
+            updated_at=stmt.inserted.updated_at
+        )
+        await self.db.execute(stmt)
     
-    def grade_answer(self, question: Question, user_answer: str) -> Tuple[int, float]:
+    def grade_answer(self, question: Question, user_answer: str, score: float = None) -> Tuple[int, float]:
         """
         判分
+        score: 该题分值，默认取题目当前分值
         返回: (是否正确, 得分)
         is_correct: 0错误 1正确 2部分正确
+        交卷判分使用 AnswerKey 编译答案键，修改判分规则时两处需保持一致
         """
         if not user_answer:
             return 0, 0
         
+        if score is None:
+            score = question.score
+        
         correct_answer = question.answer.strip()
         user_answer = user_answer.strip()
         
         if question.question_type in [QuestionType.SINGLE_CHOICE, QuestionType.TRUE_FALSE]:
             # 单选题、判断题：精确匹配
             if user_answer.upper() == correct_answer.upper():
-                return 1, question.score
+                return 1, score
             return 0, 0
         
         elif question.question_type == QuestionType.MULTIPLE_CHOICE:
@@ -432,9 +802,9 @@ class ExamService:
             user_letters = set(re.sub(r'[^A-Za-z]', '', user_answer).upper())
             
             if correct_letters == user_letters:
-                return 1, question.score
+                return 1, score
             elif user_letters.issubset(correct_letters) and len(user_letters) > 0:
-                return 2, question.score * 0.5
+                return 2, score * 0.5
             return 0, 0
         
         elif question.question_type == QuestionType.FILL_BLANK:
@@ -444,7 +814,7 @@ class ExamService:
             
             # 精确匹配
             if user_answer_lower in correct_answers:
-                return 1, question.score
+                return 1, score
             
             # 模糊匹配（去除空格和标点）
             def normalize(s):
@@ -453,7 +823,7 @@ class ExamService:
             normalized_user = normalize(user_answer_lower)
             for ans in correct_answers:
                 if normalize(ans) == normalized_user:
-                    return 1, question.score
+                    return 1, score
             
             return 0, 0
         
@@ -462,134 +832,121 @@ class ExamService:
     
     # ==================== 错题管理 ====================
     
-    def add_wrong_question(self, user_id: int, question_id: int, wrong_answer: str):
-        """添加错题"""
-        wrong = self.db.query(WrongQuestion).filter(
-            WrongQuestion.user_id == user_id,
-            WrongQuestion.question_id == question_id
-        ).first()
-        
-        if wrong:
-            wrong.wrong_count += 1
-            wrong.last_wrong_answer = wrong_answer
-            wrong.is_mastered = 0
-        else:
-            wrong = WrongQuestion(
-                user_id=user_id,
-                question_id=question_id,
-                last_wrong_answer=wrong_answer
-            )
-            self.db.add(wrong)
-    
-    def get_wrong_questions(
+    async def get_wrong_questions(
         self,
         user_id: int,
-        skip: int = 0,
-        limit: int = 20,
+        page: PageParams = None,
         is_mastered: int = None
-    ) -> Tuple[List[WrongQuestion], int]:
-        """获取错题列表"""
-        query = self.db.query(WrongQuestion).filter(WrongQuestion.user_id == user_id)
+    ) -> Page:
+        """获取错题列表（按更新时间倒序，游标为 (updated_at, id)）"""
+        query = select(WrongQuestion).where(WrongQuestion.user_id == user_id)
         
         if is_mastered is not None:
-            query = query.filter(WrongQuestion.is_mastered == is_mastered)
+            query = query.where(WrongQuestion.is_mastered == is_mastered)
         
-        total = query.count()
-        wrongs = query.order_by(WrongQuestion.updated_at.desc()).offset(skip).limit(limit).all()
-        
-        return wrongs, total
+        return await paginate(
+            self.db, query, [(WrongQuestion.updated_at, True), (WrongQuestion.id, True)], page or PageParams()
+        )
     
-    def mark_mastered(self, user_id: int, wrong_id: int, is_mastered: int) -> bool:
+    async def mark_mastered(self, user_id: int, wrong_id: int, is_mastered: int) -> bool:
         """标记错题为已掌握"""
-        wrong = self.db.query(WrongQuestion).filter(
+        wrong = await self.db.scalar(select(WrongQuestion).where(
             WrongQuestion.id == wrong_id,
             WrongQuestion.user_id == user_id
-        ).first()
+        ))
         
         if not wrong:
             return False
         
         wrong.is_mastered = is_mastered
-        self.db.commit()
+        await self.db.commit()
         
         return True
     
     # ==================== 考试记录 ====================
     
-    def get_exam_records(
+    async def get_exam_records(
         self,
         user_id: int = None,
         exam_id: int = None,
-        skip: int = 0,
-        limit: int = 20
-    ) -> Tuple[List[ExamRecord], int]:
-        """获取考试记录"""
-        query = self.db.query(ExamRecord)
+        page: PageParams = None
+    ) -> Page:
+        """获取考试记录（游标分页按 id 倒序）"""
+        query = select(ExamRecord)
         
         if user_id:
-            query = query.filter(ExamRecord.user_id == user_id)
+            query = query.where(ExamRecord.user_id == user_id)
         
         if exam_id:
-            query = query.filter(ExamRecord.exam_id == exam_id)
+            query = query.where(ExamRecord.exam_id == exam_id)
         
-        total = query.count()
-        records = query.order_by(ExamRecord.id.desc()).offset(skip).limit(limit).all()
-        
-        return records, total
+        return await paginate(self.db, query, [(ExamRecord.id, True)], page or PageParams())
     
-    def get_exam_record_detail(self, record_id: int) -> Optional[ExamRecord]:
-        """获取考试记录详情"""
-        return self.db.query(ExamRecord).filter(ExamRecord.id == record_id).first()
+    async def get_exam_record_detail(self, record_id: int, with_answers: bool = False) -> Optional[ExamRecord]:
+        """
+        获取考试记录详情
+        with_answers: 同时加载答题记录（详情页使用，交卷等流程无需加载）
+        """
+        query = select(ExamRecord).where(ExamRecord.id == record_id)
+        if with_answers:
+            query = query.options(selectinload(ExamRecord.answers))
+        return await self.db.scalar(query)
     
     # ==================== 学习统计 ====================
     
-    def update_study_record(
+    async def update_study_record(
         self, 
         user_id: int, 
         question_count: int, 
         correct_count: int,
         exam_count: int = 0
     ):
-        """更新学习记录"""
-        today = datetime.now().date()
-        
-        record = self.db.query(StudyRecord).filter(
-            StudyRecord.user_id == user_id,
-            func.date(StudyRecord.study_date) == today
-        ).first()
-        
-        if record:
-            record.question_count += question_count
-            record.correct_count += correct_count
-            record.exam_count += exam_count
-        else:
-            record = StudyRecord(
-                user_id=user_id,
-                study_date=datetime.now(),
-                question_count=question_count,
-                correct_count=correct_count,
-                exam_count=exam_count
-            )
-            self.db.add(record)
+        """
+        更新学习记录：每个用户每天一行
+        依赖 uk_study_user_day 唯一索引单条语句插入或累加，并发交卷不会插入重复的当日记录
+        """
+        now = datetime.now()
+        stmt = mysql_insert(StudyRecord).values(
+            user_id=user_id,
+            study_date=now,
+            study_day=now.date(),
+            study_duration=0,
+            question_count=question_count,
+            correct_count=correct_count,
+            exam_count=exam_count,
+            created_at=now,
+            updated_at=now
+        )
+        stmt = stmt.on_duplicate_key_update(
+            question_count=StudyRecord.question_count + stmt.inserted.question_count,
+            correct_count=StudyRecord.correct_count + stmt.inserted.correct_count,
+            exam_count=StudyRecord.exam_count + stmt.inserted.exam_count,
+            updated_at=stmt.inserted.updated_at
+        )
+        await self.db.execute(stmt)
     
-    def get_study_statistics(self, user_id: int) -> Dict[str, Any]:
+    async def get_study_statistics(self, user_id: int) -> Dict[str, Any]:
         """获取学习统计"""
-        # 学习天数
-        study_days = self.db.query(func.count(func.distinct(func.date(StudyRecord.study_date)))).filter(
-            StudyRecord.user_id == user_id
-        ).scalar() or 0
+        # 学习天数（每天一行）
+        study_days = await self.db.scalar(
+            select(func.count(StudyRecord.id)).where(
+                StudyRecord.user_id == user_id
+            )
+        ) or 0
         
         # 总学习时长
-        total_duration = self.db.query(func.sum(StudyRecord.study_duration)).filter(
-            StudyRecord.user_id == user_id
-        ).scalar() or 0
+        total_duration = await self.db.scalar(
+            select(func.sum(StudyRecord.study_duration)).where(
+                StudyRecord.user_id == user_id
+            )
+        ) or 0
         
         # 练习题数和正确数
-        stats = self.db.query(
+        stats = (await self.db.execute(select(
             func.sum(StudyRecord.question_count),
             func.sum(StudyRecord.correct_count),
             func.sum(StudyRecord.exam_count)
-        ).filter(StudyRecord.user_id == user_id).first()
+        ).where(StudyRecord.user_id == user_id))).first()
         
         total_questions = stats[0] or 0
         total_correct = stats[1] or 0
@@ -599,10 +956,10 @@ class ExamService:
         avg_accuracy = (total_correct / total_questions * 100) if total_questions > 0 else 0
         
         # 错题数量
-        wrong_count = self.db.query(WrongQuestion).filter(
+        wrong_count = await self.db.scalar(select(func.count(WrongQuestion.id)).where(
             WrongQuestion.user_id == user_id,
             WrongQuestion.is_mastered == 0
-        ).count()
+        ))
         
         return {
             "total_study_days": study_days,
@@ -614,21 +971,29 @@ class ExamService:
             "wrong_question_count": wrong_count
         }
     
-    def get_study_trend(self, user_id: int, days: int = 30) -> Dict[str, Any]:
+    @staticmethod
+    def study_trend_query(user_id: int, start_date: date, end_date: date) -> Select:
+        """
+        学习趋势查询（benchmarks/explain_date_ranges.py 对同一语句检查执行计划）
+        左闭右开区间，走 uk_study_user_day 范围扫描
+        """
+        return select(StudyRecord).where(
+            StudyRecord.user_id == user_id,
+            StudyRecord.study_day >= start_date,
+            StudyRecord.study_day < end_date + timedelta(days=1)
+        )
+    
+    async def get_study_trend(self, user_id: int, days: int = 30) -> Dict[str, Any]:
         """获取学习趋势"""
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days-1)
         
-        records = self.db.query(StudyRecord).filter(
-            StudyRecord.user_id == user_id,
-            func.date(StudyRecord.study_date) >= start_date,
-            func.date(StudyRecord.study_date) <= end_date
-        ).all()
+        records = (await self.db.scalars(self.study_trend_query(user_id, start_date, end_date))).all()
         
         # 构建日期映射
         record_map = {}
         for r in records:
-            date_str = r.study_date.strftime("%Y-%m-%d")
+            date_str = r.study_day.strftime("%Y-%m-%d")
             record_map[date_str] = r
         
         dates = []
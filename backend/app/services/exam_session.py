@@ -0,0 +1,106 @@
+"""
+楚然智考系统 - 考试作答会话
+考生作答过程中逐题自动保存答案到Redis哈希（每个考试记录一个），
+断线、刷新后可恢复，交卷时与最终提交的答案合并
+"""
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, Any
+
+from app.config import settings
+from app.redis_client import redis_client, RedisClient
+
+# 会话元数据字段（与题目ID字段区分）
+OWNER_FIELD = "_user"
+START_FIELD = "_start"
+ONGOING_FIELD = "_ongoing"  # 指向本记录的 exam:ongoing 键名，删除会话时一并删除
+META_FIELDS = (OWNER_FIELD, START_FIELD, ONGOING_FIELD)
+
+
+class ExamSessionStore:
+    """考试作答会话存储"""
+
+    def __init__(self, redis: RedisClient):
+        self.redis = redis
+
+    @staticmethod
+    def _key(record_id: int) -> str:
+        return f"exam:autosave:{record_id}"
+
+    @staticmethod
+    def _ongoing_key(user_id: int, exam_id: int) -> str:
+        return f"exam:ongoing:{user_id}:{exam_id}"
+
+    @staticmethod
+    def session_ttl(start_time: datetime, duration_minutes: int) -> int:
+        """会话有效期：剩余考试时间 + 宽限期（留给超时自动交卷读取）"""
+        end_time = start_time + timedelta(minutes=duration_minutes or 0)
+        remaining = int((end_time - datetime.now()).total_seconds())
+        return max(remaining, 0) + settings.AUTOSAVE_GRACE_SECONDS
+
+    async def open(self, record_id: int, user_id: int, ttl: int):
+        """开考（或继续作答）时建立会话"""
+        key = self._key(record_id)
+        async with self.redis.pipeline() as pipe:
+            pipe.hset(key, {OWNER_FIELD: str(user_id)})
+            pipe.expire(key, ttl)
+
+    async def bind_start(self, user_id: int, exam_id: int, record_id: int, payload: str, ttl: int):
+        """记录本次作答的开考数据，重复开考请求直接返回，无需访问数据库"""
+        ongoing_key = self._ongoing_key(user_id, exam_id)
+        async with self.redis.pipeline() as pipe:
+            pipe.hset(self._key(record_id), {START_FIELD: payload, ONGOING_FIELD: ongoing_key})
+            pipe.set(ongoing_key, str(record_id), expire=ttl)
+
+    async def get_started(self, user_id: int, exam_id: int) -> Optional[str]:
+        """
+        获取进行中作答的开考数据
+        交卷后会话被删除，此处返回 None，调用方回源数据库
+        """
+        record_id = await self.redis.get(self._ongoing_key(user_id, exam_id))
+        if not record_id:
+            return None
+        values = await self.redis.hmget(self._key(int(record_id)), [START_FIELD])
+        return values[0] if values else None
+
+    async def get_owner(self, record_id: int) -> Optional[int]:
+        """会话所属用户ID，会话不存在时返回 None"""
+        values = await self.redis.hmget(self._key(record_id), [OWNER_FIELD])
+        return int(values[0]) if values and values[0] else None
+
+    async def save(self, record_id: int, answers: Dict[int, str]) -> bool:
+        """
+        保存答案（同一题目以最后一次为准）
+        只写入已存在的会话，沿用开考时设置的过期时间；会话已过期时不写入并返回 False，由调用方校验后重建
+        """
+        return await self.redis.hset_existing(
+            self._key(record_id), {str(q_id): answer for q_id, answer in answers.items()}
+        )
+
+    async def load(self, record_id: int) -> Dict[int, str]:
+        """读取已保存的答案 {题目ID: 答案}"""
+        data = await self.redis.hgetall(self._key(record_id))
+        return {
+            int(field): value for field, value in data.items()
+            if field not in META_FIELDS
+        }
+
+    async def clear(self, record_id: int):
+        """交卷后删除会话及指向它的进行中作答指针"""
+        key = self._key(record_id)
+        values = await self.redis.hmget(key, [ONGOING_FIELD])
+        await self.redis.delete(key)
+        if values and values[0]:
+            # 指针仍指向本记录时才删除（与释放锁相同的比较删除），不影响之后新开的作答
+            await self.redis.release_lock(values[0], str(record_id))
+
+    @staticmethod
+    def merge(saved: Dict[int, str], answers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """合并自动保存的答案与交卷时提交的答案，提交的答案优先"""
+        merged = dict(saved)
+        for ans in answers:
+            merged[ans["question_id"]] = ans["answer"]
+        return [{"question_id": q_id, "answer": answer} for q_id, answer in merged.items()]
+
+
+# 全局考试作答会话实例
+exam_sessions = ExamSessionStore(redis_client)
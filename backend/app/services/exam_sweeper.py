@@ -0,0 +1,120 @@
+"""
+楚然智考系统 - 超时自动交卷
+后台定期扫描超过考试时长仍在进行中的考试记录，按自动保存的答案交卷并批量判分。
+多个worker通过Redis选主，同一时刻只有一个worker执行扫描
+"""
+import asyncio
+import os
+import uuid
+from typing import Dict, List, Any
+
+from loguru import logger
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.redis_client import redis_client, RedisClient
+from app.services.exam_session import exam_sessions
+
+LEADER_KEY = "exam:sweeper:leader"
+
+
+class ExamSweeper:
+    """超时考试记录自动交卷任务"""
+
+    def __init__(self, redis: RedisClient, interval: int = None, batch_size: int = None):
+        self.redis = redis
+        self.interval = interval or settings.SWEEP_INTERVAL
+        self.batch_size = batch_size or settings.SWEEP_BATCH_SIZE
+        self.leader_ttl = self.interval * 3
+        self.token = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._task: asyncio.Task = None
+
+    # ==================== 选主 ====================
+
+    async def is_leader(self) -> bool:
+        """
+        抢占或续期主节点，租约过期后其他worker可接管
+        续期与释放均由Lua脚本校验令牌，租约已过期并被他人接管时不会误续、误删
+        """
+        if await self.redis.set(LEADER_KEY, self.token, expire=self.leader_ttl, nx=True):
+            return True
+        return await self.redis.renew_lock(LEADER_KEY, self.token, self.leader_ttl * 1000)
+
+    async def resign(self):
+        """主节点退出时释放租约"""
+        await self.redis.release_lock(LEADER_KEY, self.token)
+
+    # ==================== 扫描交卷 ====================
+
+    async def sweep(self) -> int:
+        """处理全部超时记录，返回自动交卷数量"""
+        total = 0
+        while True:
+            record_ids = await self._call("find")
+            if not record_ids:
+                break
+
+            record_answers: Dict[int, List[Dict[str, Any]]] = {}
+            for record_id in record_ids:
+                saved = await exam_sessions.load(record_id)
+                record_answers[record_id] = exam_sessions.merge(saved, [])
+
+            graded_ids = await self._call("expire", record_answers)
+            for record_id in graded_ids:
+                await exam_sessions.clear(record_id)
+            total += len(graded_ids)
+
+            # 本批被其他任务抢先处理或已取完时结束，避免空转
+            if len(record_ids) < self.batch_size or not graded_ids:
+                break
+        return total
+
+    async def _call(self, action: str, record_answers: Dict[int, List[Dict[str, Any]]] = None):
+        from app.services.exam_service import ExamService
+
+        async with AsyncSessionLocal() as db:
+            service = ExamService(db)
+            if action == "find":
+                return await service.get_expired_record_ids(settings.SWEEP_GRACE_SECONDS, self.batch_size)
+            # 交卷后走与异步判分相同的批量判分路径
+            record_ids = await service.expire_records(record_answers)
+            if record_ids:
+                try:
+                    await service.grade_submitted_records(record_ids)
+                except Exception as e:
+                    # 交卷已提交，判分失败的记录保持已提交状态，由判分兜底扫描补判
+                    logger.error(f"自动交卷后判分失败，等待兜底补判: {e}")
+            return record_ids
+
+    # ==================== 后台任务 ====================
+
+    def start(self):
+        """启动后台扫描任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.resign()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if not await self.is_leader():
+                    continue
+                count = await self.sweep()
+                if count:
+                    logger.info(f"超时自动交卷 {count} 份")
+            except Exception as e:
+                logger.error(f"超时自动交卷失败: {e}")
+
+
+# 全局超时自动交卷任务实例
+exam_sweeper = ExamSweeper(redis_client)
@@ -0,0 +1,161 @@
+"""
+楚然智考系统 - 异步判分队列
+异步判分模式下交卷只保存原始答案，记录ID进入Redis队列，
+由各worker内的判分协程批量取出判分，削平考试截止时刻的交卷峰值。
+兜底扫描只由选出的一个worker执行，不论是否开启异步判分都会运行（超时自动交卷后判分失败的记录也由它补判）：
+异步模式下重新入队，每条记录在一个扫描周期内最多重新入队一次；同步模式下没有判分协程，由主节点直接判分
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from loguru import logger
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.redis_client import redis_client, RedisClient
+
+# 待判分记录ID队列（LPUSH 入队，RPOP 出队）
+QUEUE_KEY = "grading:queue"
+
+# 兜底扫描主节点租约
+RECOVER_LEADER_KEY = "grading:recover:leader"
+
+# 已重新入队标记前缀，过期前不再重复入队
+REQUEUED_PREFIX = "grading:requeued:"
+
+# 队列为空时的轮询间隔(秒)
+POLL_INTERVAL = 0.5
+
+
+class GradingQueue:
+    """异步判分队列"""
+
+    def __init__(self, redis: RedisClient, workers: int = None, batch_size: int = None):
+        self.redis = redis
+        self.workers = workers or settings.GRADING_WORKERS
+        self.batch_size = batch_size or settings.GRADING_BATCH_SIZE
+        self.recover_seconds = settings.GRADING_RECOVER_SECONDS
+        self.token = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def enabled(self) -> bool:
+        return settings.ASYNC_GRADING
+
+    async def enqueue(self, record_id: int):
+        """已提交的考试记录加入判分队列"""
+        await self.redis.lpush(QUEUE_KEY, str(record_id))
+
+    async def size(self) -> int:
+        """队列中待判分的记录数"""
+        return await self.redis.llen(QUEUE_KEY)
+
+    # ==================== 后台判分 ====================
+
+    def start(self):
+        """启动兜底扫描任务，异步判分模式下同时启动判分协程"""
+        if self._tasks:
+            return
+        if self.enabled:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._recover()))
+
+    async def stop(self):
+        """停止后台任务，队列中未处理的记录留待下次启动后判分"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self.redis.release_lock(RECOVER_LEADER_KEY, self.token)
+
+    async def _worker(self):
+        while True:
+            try:
+                record_ids = await self.redis.rpop(QUEUE_KEY, self.batch_size)
+                if not record_ids:
+                    await asyncio.sleep(POLL_INTERVAL)
+                    continue
+                await self._grade([int(r) for r in record_ids])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"判分任务异常: {e}")
+                await asyncio.sleep(POLL_INTERVAL)
+
+    async def _grade(self, record_ids: List[int]):
+        try:
+            await self._grade_batch(record_ids)
+        except Exception as e:
+            # 整批失败时逐条重试，避免单条异常数据拖累同批次其他考生
+            logger.error(f"批量判分失败，逐条重试: {e}")
+            for record_id in record_ids:
+                try:
+                    await self._grade_batch([record_id])
+                except Exception as e:
+                    logger.error(f"考试记录 {record_id} 判分失败: {e}")
+
+    @staticmethod
+    async def _grade_batch(record_ids: List[int]) -> int:
+        from app.services.exam_service import ExamService
+
+        # 会话关闭时回滚未提交的事务
+        async with AsyncSessionLocal() as db:
+            return await ExamService(db).grade_submitted_records(record_ids)
+
+    async def _is_recover_leader(self) -> bool:
+        """抢占或续期兜底扫描主节点（租约为两个扫描周期）"""
+        ttl = self.recover_seconds * 2
+        if await self.redis.set(RECOVER_LEADER_KEY, self.token, expire=ttl, nx=True):
+            return True
+        return await self.redis.renew_lock(RECOVER_LEADER_KEY, self.token, ttl * 1000)
+
+    async def _recover(self):
+        """兜底：长时间停留在已提交状态的记录（队列丢失、进程重启、自动交卷后判分失败）重新判分"""
+        while True:
+            await asyncio.sleep(self.recover_seconds)
+            try:
+                await self.recover_once()
+            except Exception as e:
+                logger.error(f"判分兜底扫描失败: {e}")
+
+    async def recover_once(self) -> int:
+        """执行一次兜底扫描（仅主节点），返回重新入队或补判的记录数"""
+        if not await self._is_recover_leader():
+            return 0
+        record_ids = await self._find_stale()
+        if not record_ids:
+            return 0
+
+        if not self.enabled:
+            # 同步判分模式没有判分协程消费队列，直接判分
+            await self._grade(record_ids)
+            logger.warning(f"{len(record_ids)} 条已提交记录超时未判分，已重新判分")
+            return len(record_ids)
+
+        requeued = 0
+        for record_id in record_ids:
+            # 上一周期已重新入队、仍在队列中排队的记录不重复入队
+            if await self.redis.set(f"{REQUEUED_PREFIX}{record_id}", "1", expire=self.recover_seconds, nx=True):
+                await self.enqueue(record_id)
+                requeued += 1
+        if requeued:
+            logger.warning(f"{requeued} 条已提交记录超时未判分，已重新入队")
+        return requeued
+
+    async def _find_stale(self) -> List[int]:
+        from app.services.exam_service import ExamService
+
+        async with AsyncSessionLocal() as db:
+            before = datetime.now() - timedelta(seconds=self.recover_seconds)
+            return await ExamService(db).get_stale_submitted_record_ids(before)
+
+
+# 全局判分队列实例
+grading_queue = GradingQueue(redis_client)
@@ -4,11 +4,16 @@
 """
 import re
 import json
-from typing import List, Dict, Any, Tuple
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
 
-from app.models.question import QuestionType, DifficultyLevel, QuestionBank, Question
-from app.schemas.question import QuestionCreate, ImportResult
+from app.database import SessionLocal
+from app.models.question import QuestionType, DifficultyLevel, QuestionBank, Question, QuestionKnowledge
+from app.schemas.question import QuestionCreate, ImportResult, QuestionBankListResponse
+from app.services.question_service import build_question
+from app.services.query_cache import query_cache
+from app.services.task_executor import task_executor, ExecutorBusyError, ExecutorTimeoutError
 
 
 class ImportService:
@@ -17,73 +22,52 @@ class ImportService:
     def __init__(self, db: Session):
         self.db = db
     
+    def _create_questions(self, questions_data: List[QuestionCreate], creator_id: int = None, bank_id: int = None) -> List[Question]:
+        """
+        批量写入解析出的题目
+        导入流程使用同步会话（由 create_questions 在线程池中执行），题目构建逻辑与题目服务共用 build_question
+        """
+        from app.services.question_sampler import question_sampler
+        
+        questions = [build_question(q_data, creator_id, bank_id) for q_data in questions_data]
+        self.db.add_all(questions)
+        self.db.flush()
+        
+        # 关联知识点
+        for question, q_data in zip(questions, questions_data):
+            for kp_id in q_data.knowledge_ids or []:
+                self.db.add(QuestionKnowledge(question_id=question.id, knowledge_id=kp_id))
+        
+        self.db.commit()
+        
+        for question, q_data in zip(questions, questions_data):
+            question_sampler.upsert(question, q_data.knowledge_ids or [])
+        return questions
+    
     # ==================== Excel导入 ====================
     
-    def import_from_excel(self, file_path: str, creator_id: int = None) -> ImportResult:
+    async def import_from_excel(self, file_path: str, creator_id: int = None) -> ImportResult:
         """
         从Excel文件导入题库
         Excel格式：题型 | 题干 | 选项 | 答案 | 解析 | 知识点 | 难度
         """
-        import openpyxl
-        
         try:
-            wb = openpyxl.load_workbook(file_path)
-            ws = wb.active
-            
-            questions = []
-            errors = []
-            
-            # 跳过表头
-            for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                try:
-                    if not row[0] or not row[1]:  # 题型和题干必填
-                        continue
-                    
-                    question_type = self._parse_question_type(str(row[0]))
-                    title = str(row[1]).strip()
-                    options = self._parse_options(str(row[2]) if row[2] else None)
-                    answer = str(row[3]).strip() if row[3] else ""
-                    analysis = str(row[4]).strip() if row[4] else None
-                    knowledge_point = str(row[5]).strip() if row[5] else None
-                    difficulty = self._parse_difficulty(str(row[6]) if row[6] else None)
-                    
-                    if not answer:
-                        errors.append({
-                            "row": row_num,
-                            "error": "答案不能为空"
-                        })
-                        continue
-                    
-                    question = QuestionCreate(
-                        question_type=question_type,
-                        title=title,
-                        options=options,
-                        answer=answer,
-                        analysis=analysis,
-                        difficulty=difficulty,
-                        knowledge_ids=[]
-                    )
-                    questions.append(question)
-                    
-                except Exception as e:
-                    errors.append({
-                        "row": row_num,
-                        "error": str(e)
-                    })
+            questions, errors = await task_executor.run_cpu(parse_excel_file, file_path)
             
             # 批量创建题目
-            from app.services.question_service import QuestionService
-            question_service = QuestionService(self.db)
-            created = question_service.create_questions_batch(questions, creator_id)
+            created_count = await task_executor.run_io(create_questions, questions, creator_id, timeout=0)
+            await query_cache.invalidate_tags("question", "bank")
             
             return ImportResult(
                 success=True,
                 total=len(questions) + len(errors),
-                success_count=len(created),
+                success_count=created_count,
                 fail_count=len(errors),
                 errors=errors
             )
             
+        except (ExecutorBusyError, ExecutorTimeoutError):
+            raise
         except Exception as e:
             return ImportResult(
                 success=False,
@@ -93,9 +77,59 @@ class ImportService:
                 errors=[{"row": 0, "error": f"文件解析失败: {str(e)}"}]
             )
     
+    def _parse_excel(self, file_path: str) -> Tuple[List[QuestionCreate], List[Dict]]:
+        """解析Excel文件中的题目"""
+        import openpyxl
+        
+        wb = openpyxl.load_workbook(file_path)
+        ws = wb.active
+        
+        questions = []
+        errors = []
+        
+        # 跳过表头
+        for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+            try:
+                if not row[0] or not row[1]:  # 题型和题干必填
+                    continue
+                
+                question_type = self._parse_question_type(str(row[0]))
+                title = str(row[1]).strip()
+                options = self._parse_options(str(row[2]) if row[2] else None)
+                answer = str(row[3]).strip() if row[3] else ""
+                analysis = str(row[4]).strip() if row[4] else None
+                knowledge_point = str(row[5]).strip() if row[5] else None
+                difficulty = self._parse_difficulty(str(row[6]) if row[6] else None)
+                
+                if not answer:
+                    errors.append({
+                        "row": row_num,
+                        "error": "答案不能为空"
+                    })
+                    continue
+                
+                question = QuestionCreate(
+                    question_type=question_type,
+                    title=title,
+                    options=options,
+                    answer=answer,
+                    analysis=analysis,
+                    difficulty=difficulty,
+                    knowledge_ids=[]
+                )
+                questions.append(question)
+                
+            except Exception as e:
+                errors.append({
+                    "row": row_num,
+                    "error": str(e)
+                })
+        
+        return questions, errors
+    
     # ==================== Word导入 ====================
     
-    def import_from_word(self, file_path: str, bank_name: str, creator_id: int = None) -> ImportResult:
+    async def import_from_word(self, file_path: str, bank_name: str, creator_id: int = None) -> ImportResult:
         """
         从Word文件导入题库
         支持多种格式：
@@ -103,19 +137,8 @@ class ImportService:
         2. 单独答案行：答案：A
         3. 题型标题：一、单选题 / 二、多选题
         """
-        from docx import Document
-        
         try:
-            doc = Document(file_path)
-            
-            # 合并所有段落文本
-            raw_text = "\n".join([para.text for para in doc.paragraphs])
-            
-            # 预处理：格式化文本
-            formatted_text = self._format_exam_text(raw_text)
-            
-            # 解析格式化后的文本
-            questions, errors = self._parse_formatted_text(formatted_text)
+            questions, errors = await task_executor.run_cpu(parse_word_file, file_path)
             
             if not questions:
                 return ImportResult(
@@ -126,38 +149,25 @@ class ImportService:
                     errors=[{"row": 0, "error": "未识别到有效题目，请检查文档格式"}]
                 )
             
-            # 创建题库
-            bank = QuestionBank(
-                name=bank_name,
-                question_count=0,
-                creator_id=creator_id,
-                is_active=1
+            bank_id, created_count = await task_executor.run_io(
+                create_bank_with_questions, bank_name, questions, creator_id, timeout=0
             )
-            self.db.add(bank)
-            self.db.flush()  # 获取 bank.id
-            
-            # 批量创建题目并关联到题库
-            from app.services.question_service import QuestionService
-            question_service = QuestionService(self.db)
-            created = question_service.create_questions_batch(questions, creator_id, bank.id)
-            
-            # 更新题库的题目数量
-            bank.question_count = len(created)
-            self.db.commit()
+            await query_cache.invalidate_tags("question", f"bank:{bank_id}")
             
             return ImportResult(
                 success=True,
                 total=len(questions) + len(errors),
-                success_count=len(created),
+                success_count=created_count,
                 fail_count=len(errors),
                 errors=errors,
-                bank_id=bank.id
+                bank_id=bank_id
             )
             
+        except (ExecutorBusyError, ExecutorTimeoutError):
+            raise
         except Exception as e:
             import traceback
             traceback.print_exc()
-            self.db.rollback()
             return ImportResult(
                 success=False,
                 total=0,
@@ -166,16 +176,57 @@ class ImportService:
                 errors=[{"row": 0, "error": f"文件解析失败: {str(e)}"}]
             )
     
+    def _parse_word(self, file_path: str) -> Tuple[List[QuestionCreate], List[Dict]]:
+        """解析Word文件中的题目"""
+        from docx import Document
+        
+        doc = Document(file_path)
+        
+        # 合并所有段落文本
+        raw_text = "\n".join([para.text for para in doc.paragraphs])
+        
+        # 预处理：格式化文本
+        formatted_text = self._format_exam_text(raw_text)
+        
+        # 解析格式化后的文本
+        return self._parse_formatted_text(formatted_text)
+    
+    def _create_bank_with_questions(self, bank_name: str, questions: List[QuestionCreate], creator_id: int = None) -> Tuple[int, int]:
+        """
+        创建题库并写入题目（同步会话，由 create_bank_with_questions 在线程池中执行）
+        返回: (题库ID, 创建题目数)
+        """
+        try:
+            bank = QuestionBank(
+                name=bank_name,
+                question_count=0,
+                creator_id=creator_id,
+                is_active=1
+            )
+            self.db.add(bank)
+            self.db.flush()  # 获取 bank.id
+            
+            # 批量创建题目并关联到题库
+            created = self._create_questions(questions, creator_id, bank.id)
+            
+            # 更新题库的题目数量
+            bank.question_count = len(created)
+            self.db.commit()
+            return bank.id, len(created)
+        except Exception:
+            self.db.rollback()
+            raise
+    
     # ==================== PDF导入 ====================
     
-    def import_from_pdf(self, file_path: str, bank_name: str, creator_id: int = None) -> ImportResult:
+    async def import_from_pdf(self, file_path: str, bank_name: str, creator_id: int = None) -> ImportResult:
         """
         从PDF文件导入题库
         自动识别题目格式并解析
         """
         try:
-            # 提取PDF文本
-            raw_text = self._extract_pdf_text(file_path)
+            # 提取PDF文本并解析（支持题目和答案分离的格式）
+            raw_text, questions, errors = await task_executor.run_cpu(parse_pdf_file, file_path)
             
             if not raw_text or len(raw_text.strip()) < 10:
                 return ImportResult(
@@ -186,9 +237,6 @@ class ImportService:
                     errors=[{"row": 0, "error": "PDF文件内容为空或无法提取文本"}]
                 )
             
-            # 使用PDF专用解析方法（支持题目和答案分离的格式）
-            questions, errors = self._parse_pdf_exam(raw_text)
-            
             if not questions:
                 return ImportResult(
                     success=False,
@@ -198,38 +246,25 @@ class ImportService:
                     errors=[{"row": 0, "error": "未识别到有效题目，请检查PDF格式"}]
                 )
             
-            # 创建题库
-            bank = QuestionBank(
-                name=bank_name,
-                question_count=0,
-                creator_id=creator_id,
-                is_active=1
+            bank_id, created_count = await task_executor.run_io(
+                create_bank_with_questions, bank_name, questions, creator_id, timeout=0
             )
-            self.db.add(bank)
-            self.db.flush()
-            
-            # 批量创建题目并关联到题库
-            from app.services.question_service import QuestionService
-            question_service = QuestionService(self.db)
-            created = question_service.create_questions_batch(questions, creator_id, bank.id)
-            
-            # 更新题库的题目数量
-            bank.question_count = len(created)
-            self.db.commit()
+            await query_cache.invalidate_tags("question", f"bank:{bank_id}")
             
             return ImportResult(
                 success=True,
                 total=len(questions) + len(errors),
-                success_count=len(created),
+                success_count=created_count,
                 fail_count=len(errors),
                 errors=errors,
-                bank_id=bank.id
+                bank_id=bank_id
             )
             
+        except (ExecutorBusyError, ExecutorTimeoutError):
+            raise
         except Exception as e:
             import traceback
             traceback.print_exc()
-            self.db.rollback()
             return ImportResult(
                 success=False,
                 total=0,
@@ -238,13 +273,12 @@ class ImportService:
                 errors=[{"row": 0, "error": f"PDF解析失败: {str(e)}"}]
             )
     
-    def pdf_preview(self, file_path: str) -> Dict:
+    async def pdf_preview(self, file_path: str) -> Dict:
         """
         PDF预览 - 解析但不导入，返回识别结果供用户确认
         """
         try:
-            # 提取PDF文本
-            raw_text = self._extract_pdf_text(file_path)
+            raw_text, questions, errors = await task_executor.run_cpu(parse_pdf_file, file_path)
             
             if not raw_text or len(raw_text.strip()) < 10:
                 return {
@@ -254,9 +288,6 @@ class ImportService:
                     "errors": ["PDF文件内容为空或无法提取文本"]
                 }
             
-            # 使用PDF专用解析方法（支持题目和答案分离的格式）
-            questions, errors = self._parse_pdf_exam(raw_text)
-            
             return {
                 "success": True,
                 "raw_text": raw_text[:5000],  # 限制返回的原始文本长度
@@ -264,6 +295,8 @@ class ImportService:
                 "errors": errors
             }
             
+        except (ExecutorBusyError, ExecutorTimeoutError):
+            raise
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -274,6 +307,14 @@ class ImportService:
                 "errors": [str(e)]
             }
     
+    def _parse_pdf(self, file_path: str) -> Tuple[str, List[QuestionCreate], List[Dict]]:
+        """提取PDF文本并解析题目，文本过短时不解析"""
+        raw_text = self._extract_pdf_text(file_path)
+        if not raw_text or len(raw_text.strip()) < 10:
+            return raw_text, [], []
+        questions, errors = self._parse_pdf_exam(raw_text)
+        return raw_text, questions, errors
+    
     def _extract_pdf_text(self, file_path: str) -> str:
         """
         从PDF文件提取文本
@@ -698,16 +739,27 @@ class ImportService:
         """获取单个题库"""
         return self.db.query(QuestionBank).filter(QuestionBank.id == bank_id).first()
     
-    def delete_bank(self, bank_id: int) -> bool:
-        """删除题库及其所有题目"""
+    def delete_bank(self, bank_id: int) -> Optional[List[int]]:
+        """
+        删除题库及其所有题目
+        返回: 试卷中包含该题库题目的考试ID（由调用方使其试卷缓存失效），题库不存在返回 None
+        """
         bank = self.db.query(QuestionBank).filter(QuestionBank.id == bank_id).first()
         if not bank:
-            return False
+            return None
+        
+        from app.models.exam import ExamQuestion
+        exam_ids = [row[0] for row in self.db.query(ExamQuestion.exam_id).join(
+            Question, ExamQuestion.question_id == Question.id
+        ).filter(Question.bank_id == bank_id).distinct().all()]
         
         # 删除题库（由于设置了 cascade，会自动删除关联的题目）
         self.db.delete(bank)
         self.db.commit()
-        return True
+        
+        from app.services.question_sampler import question_sampler
+        question_sampler.remove_bank(bank_id)
+        return exam_ids
     
     def _format_exam_text(self, text: str) -> str:
         """
@@ -1104,48 +1156,14 @@ class ImportService:
     
     # ==================== OCR识别导入 ====================
     
-    def import_from_image(self, file_path: str, creator_id: int = None) -> ImportResult:
+    async def import_from_image(self, file_path: str, creator_id: int = None) -> ImportResult:
         """
         从图片OCR识别导入题库
         使用PaddleOCR进行文字识别
         """
         try:
-            # 图片预处理
-            from PIL import Image
-            import numpy as np
-            
-            img = Image.open(file_path)
-            
-            # 转换为灰度图
-            if img.mode != 'L':
-                img = img.convert('L')
-            
-            # 调整大小（如果太大）
-            max_size = 2000
-            if max(img.size) > max_size:
-                ratio = max_size / max(img.size)
-                new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-                img = img.resize(new_size, Image.LANCZOS)
-            
-            img_array = np.array(img)
-            
-            # OCR识别
-            from paddleocr import PaddleOCR
-            ocr = PaddleOCR(use_angle_cls=True, lang='ch', show_log=False)
-            result = ocr.ocr(img_array, cls=True)
-            
-            # 提取文本
-            texts = []
-            for line in result:
-                if line:
-                    for item in line:
-                        if item and len(item) >= 2:
-                            texts.append(item[1][0])
-            
-            raw_text = "\n".join(texts)
-            
-            # 解析题目
-            questions, errors = self._parse_ocr_text(raw_text)
+            # 识别并解析题目
+            raw_text, questions, errors = await task_executor.run_cpu(parse_image_file, file_path, 2000)
             
             if not questions:
                 return ImportResult(
@@ -1157,18 +1175,19 @@ class ImportService:
                 )
             
             # 批量创建
-            from app.services.question_service import QuestionService
-            question_service = QuestionService(self.db)
-            created = question_service.create_questions_batch(questions, creator_id)
+            created_count = await task_executor.run_io(create_questions, questions, creator_id, timeout=0)
+            await query_cache.invalidate_tags("question", "bank")
             
             return ImportResult(
                 success=True,
                 total=len(questions) + len(errors),
-                success_count=len(created),
+                success_count=created_count,
                 fail_count=len(errors),
                 errors=errors
             )
             
+        except (ExecutorBusyError, ExecutorTimeoutError):
+            raise
         except ImportError:
             return ImportResult(
                 success=False,
@@ -1186,34 +1205,13 @@ class ImportService:
                 errors=[{"row": 0, "error": f"OCR识别失败: {str(e)}"}]
             )
     
-    def ocr_preview(self, file_path: str) -> Dict[str, Any]:
+    async def ocr_preview(self, file_path: str) -> Dict[str, Any]:
         """
         OCR预览（不入库）
         返回识别结果供用户确认
         """
         try:
-            from PIL import Image
-            import numpy as np
-            from paddleocr import PaddleOCR
-            
-            img = Image.open(file_path)
-            if img.mode != 'L':
-                img = img.convert('L')
-            
-            img_array = np.array(img)
-            
-            ocr = PaddleOCR(use_angle_cls=True, lang='ch', show_log=False)
-            result = ocr.ocr(img_array, cls=True)
-            
-            texts = []
-            for line in result:
-                if line:
-                    for item in line:
-                        if item and len(item) >= 2:
-                            texts.append(item[1][0])
-            
-            raw_text = "\n".join(texts)
-            questions, errors = self._parse_ocr_text(raw_text)
+            raw_text, questions, errors = await task_executor.run_cpu(parse_image_file, file_path)
             
             return {
                 "success": True,
@@ -1222,6 +1220,8 @@ class ImportService:
                 "errors": errors
             }
             
+        except (ExecutorBusyError, ExecutorTimeoutError):
+            raise
         except Exception as e:
             return {
                 "success": False,
@@ -1230,6 +1230,42 @@ class ImportService:
                 "errors": [str(e)]
             }
     
+    def _recognize_image(self, file_path: str, max_size: int = None) -> str:
+        """
+        图片OCR识别为文本
+        max_size: 图片长边超过该值时先等比缩小
+        """
+        # 图片预处理
+        from PIL import Image
+        import numpy as np
+        
+        img = Image.open(file_path)
+        
+        # 转换为灰度图
+        if img.mode != 'L':
+            img = img.convert('L')
+        
+        # 调整大小（如果太大）
+        if max_size and max(img.size) > max_size:
+            ratio = max_size / max(img.size)
+            new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
+            img = img.resize(new_size, Image.LANCZOS)
+        
+        img_array = np.array(img)
+        
+        # OCR识别
+        result = _get_ocr_engine().ocr(img_array, cls=True)
+        
+        # 提取文本
+        texts = []
+        for line in result:
+            if line:
+                for item in line:
+                    if item and len(item) >= 2:
+                        texts.append(item[1][0])
+        
+        return "\n".join(texts)
+    
     def _parse_ocr_text(self, text: str) -> Tuple[List[QuestionCreate], List[Dict]]:
         """解析OCR识别的文本"""
         questions = []
@@ -1372,3 +1408,79 @@ class ImportService:
             return DifficultyLevel.HARD
         else:
             return DifficultyLevel.MEDIUM
+
+
+# ==================== 题库列表 ====================
+
+def load_bank_list(skip: int, limit: int) -> Dict[str, Any]:
+    """
+    查询题库列表并序列化（查询缓存的加载函数）
+    使用独立会话，可在线程池中执行，也可在请求结束后由缓存后台刷新调用
+    """
+    db = SessionLocal()
+    try:
+        result = ImportService(db).get_banks(skip, limit)
+        return QuestionBankListResponse.model_validate(result).model_dump(mode="json")
+    finally:
+        db.close()
+
+
+# ==================== 线程池写库入口 ====================
+# 导入写库与删除题库在线程池中执行，每个任务使用独立会话，不与请求的会话共享：
+# 请求被取消或结束时不会在其他线程关闭进行中的会话。调用方以 timeout=0 等待完成，
+# 线程无法中途取消，超时返回失败而数据实际已提交会误导调用方
+
+def create_questions(questions: List[QuestionCreate], creator_id: int = None, bank_id: int = None) -> int:
+    """批量写入题目，返回创建数量"""
+    db = SessionLocal()
+    try:
+        return len(ImportService(db)._create_questions(questions, creator_id, bank_id))
+    finally:
+        db.close()
+
+
+def create_bank_with_questions(bank_name: str, questions: List[QuestionCreate], creator_id: int = None) -> Tuple[int, int]:
+    """创建题库并写入题目，返回: (题库ID, 创建题目数)"""
+    db = SessionLocal()
+    try:
+        return ImportService(db)._create_bank_with_questions(bank_name, questions, creator_id)
+    finally:
+        db.close()
+
+
+def delete_bank_by_id(bank_id: int) -> Optional[List[int]]:
+    """删除题库及其所有题目，返回值同 ImportService.delete_bank"""
+    db = SessionLocal()
+    try:
+        return ImportService(db).delete_bank(bank_id)
+    finally:
+        db.close()
+
+
+# ==================== 进程池解析入口 ====================
+# 文件解析与OCR在任务执行器的进程池中执行，只做解析，不访问数据库
+
+@lru_cache(maxsize=1)
+def _get_ocr_engine():
+    """OCR模型加载较慢，每个进程只加载一次"""
+    from paddleocr import PaddleOCR
+    return PaddleOCR(use_angle_cls=True, lang='ch', show_log=False)
+
+
+def parse_excel_file(file_path: str) -> Tuple[List[QuestionCreate], List[Dict]]:
+    return ImportService(None)._parse_excel(file_path)
+
+
+def parse_word_file(file_path: str) -> Tuple[List[QuestionCreate], List[Dict]]:
+    return ImportService(None)._parse_word(file_path)
+
+
+def parse_pdf_file(file_path: str) -> Tuple[str, List[QuestionCreate], List[Dict]]:
+    return ImportService(None)._parse_pdf(file_path)
+
+
+def parse_image_file(file_path: str, max_size: int = None) -> Tuple[str, List[QuestionCreate], List[Dict]]:
+    service = ImportService(None)
+    raw_text = service._recognize_image(file_path, max_size)
+    questions, errors = service._parse_ocr_text(raw_text)
+    return raw_text, questions, errors
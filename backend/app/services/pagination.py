@@ -0,0 +1,187 @@
+"""
+楚然智考系统 - 列表分页
+默认 skip/limit 偏移分页，每页同时查询精确总数；pagination=cursor 时使用键集分页：
+游标记录上一页最后一行的 (排序键, id)，下一页从该位置之后按索引顺序读取 limit+1 行，
+翻到多深代价都相同，用 has_more 代替总数。
+管理端大表在游标模式下可按需获取总数，两种总数分别缓存：
+- exact: COUNT(*) 结果，数据写入后按标签失效
+- approx: 无筛选条件时读取表统计信息中的估算行数（MySQL），否则为较长时间不失效的 COUNT(*) 结果
+"""
+import base64
+import hashlib
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_, select, func, text, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from app.config import settings
+from app.database import async_engine, AsyncSessionLocal
+from app.services.query_cache import query_cache
+
+OFFSET = "offset"
+CURSOR = "cursor"
+
+TOTAL_NONE = "none"
+TOTAL_EXACT = "exact"
+TOTAL_APPROX = "approx"
+
+# 排序键：(列, 是否降序)，最后一列须为主键以保证顺序唯一
+Order = Sequence[Tuple[Any, bool]]
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析或与当前排序不匹配"""
+
+
+@dataclass
+class PageParams:
+    """分页参数"""
+    skip: int = 0
+    limit: int = 20
+    pagination: str = OFFSET
+    cursor: Optional[str] = None
+    total: str = TOTAL_NONE  # 游标模式下的总数: none/exact/approx
+
+    @property
+    def keyset(self) -> bool:
+        return self.pagination == CURSOR
+
+
+@dataclass
+class Page:
+    """分页结果：偏移分页返回 total，游标分页返回 has_more/next_cursor（total 按需返回）"""
+    items: List[Any] = field(default_factory=list)
+    total: Optional[int] = None
+    has_more: Optional[bool] = None
+    next_cursor: Optional[str] = None
+
+
+# ==================== 游标 ====================
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    data = json.dumps(
+        [v.isoformat() if isinstance(v, datetime) else v for v in values],
+        separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order: Order) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise InvalidCursor("无效的分页游标")
+    if not isinstance(values, list) or len(values) != len(order):
+        raise InvalidCursor("无效的分页游标")
+    try:
+        return [
+            datetime.fromisoformat(v) if isinstance(col.type, DateTime) and v is not None else v
+            for (col, _), v in zip(order, values)
+        ]
+    except (ValueError, TypeError):
+        raise InvalidCursor("无效的分页游标")
+
+
+def _after(order: Order, values: List[Any]):
+    """排序位置在游标之后的行: (a, b) 降序时为 a < x OR (a = x AND b < y)，展开写法可走索引范围扫描"""
+    clauses = []
+    for i, (col, desc) in enumerate(order):
+        prefix = [order[j][0] == values[j] for j in range(i)]
+        clauses.append(and_(*prefix, col < values[i] if desc else col > values[i]))
+    return or_(*clauses)
+
+
+def _order_by(order: Order):
+    return [col.desc() if desc else col.asc() for col, desc in order]
+
+
+# ==================== 分页 ====================
+
+async def paginate(
+    db: AsyncSession,
+    query: Select,
+    order: Order,
+    params: PageParams,
+    count_tags: Sequence[str] = (),
+    table: str = None,
+    rank=None
+) -> Page:
+    """
+    按分页参数查询一页
+    count_tags: 管理端列表精确总数的缓存标签（数据写入时会失效的标签）
+    table: 表名，无筛选条件时估算总数使用
+    rank: 相关度表达式，偏移分页时优先按其倒序排列；游标只记录列值，游标分页仍按 order 排序
+    查询不能使用 joinedload 集合预加载（limit 作用于联表后的行）
+    """
+    if not params.keyset:
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
+        order_by = _order_by(order)
+        if rank is not None:
+            order_by.insert(0, rank.desc())
+        items = (await db.scalars(
+            query.order_by(*order_by).offset(params.skip).limit(params.limit)
+        )).all()
+        return Page(items=list(items), total=total)
+
+    page_query = query
+    if params.cursor:
+        page_query = page_query.where(_after(order, decode_cursor(params.cursor, order)))
+    rows = (await db.scalars(page_query.order_by(*_order_by(order)).limit(params.limit + 1))).all()
+
+    has_more = len(rows) > params.limit
+    items = list(rows[:params.limit])
+    next_cursor = encode_cursor([getattr(items[-1], col.key) for col, _ in order]) if has_more else None
+
+    total = None
+    if params.total == TOTAL_EXACT:
+        total = await exact_total(query, count_tags)
+    elif params.total == TOTAL_APPROX:
+        total = await approx_total(query, table)
+
+    return Page(items=items, total=total, has_more=has_more, next_cursor=next_cursor)
+
+
+# ==================== 总数 ====================
+
+def _count_key(kind: str, query: Select) -> str:
+    compiled = query.compile(dialect=async_engine.dialect)
+    digest = hashlib.md5(
+        (str(compiled) + json.dumps(compiled.params, sort_keys=True, default=str)).encode()
+    ).hexdigest()
+    return f"list_total:{kind}:{digest}"
+
+
+async def exact_total(query: Select, tags: Sequence[str]) -> int:
+    """
+    精确总数，相同筛选条件共享缓存，数据写入后按标签失效
+    总数在查询缓存的共享加载任务中计算，使用独立会话（不使用请求的会话）
+    """
+    async def load():
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(select(func.count()).select_from(query.subquery()))
+
+    return await query_cache.get_or_load(
+        _count_key(TOTAL_EXACT, query), load, settings.LIST_TOTAL_EXACT_TTL, tags
+    )
+
+
+async def approx_total(query: Select, table: str = None) -> int:
+    """估算总数，不随写入失效；无筛选条件的 MySQL 表直接读取统计信息，不扫描表（独立会话）"""
+    async def load():
+        async with AsyncSessionLocal() as db:
+            if table and query.whereclause is None and async_engine.dialect.name == "mysql":
+                rows = await db.scalar(text(
+                    "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table"
+                ), {"table": table})
+                if rows is not None:
+                    return int(rows)
+            return await db.scalar(select(func.count()).select_from(query.subquery()))
+
+    return await query_cache.get_or_load(
+        _count_key(TOTAL_APPROX, query), load, settings.LIST_TOTAL_APPROX_TTL
+    )
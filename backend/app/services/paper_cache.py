@@ -0,0 +1,117 @@
+"""
+楚然智考系统 - 试卷缓存
+固定组卷的试卷内容按 (考试ID, 内容版本) 预构建并缓存：
+进程内LRU为一级缓存，Redis为二级缓存，版本号保存在Redis中供所有worker共享
+"""
+import asyncio
+import json
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Iterable, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.exam import Exam
+from app.redis_client import redis_client, RedisClient
+
+
+class PaperCache:
+    """
+    试卷缓存
+    缓存内容包含两份预序列化的题目列表：
+    student - 考生视图（不含答案、解析）
+    practice - 练习视图（含答案、解析）
+    """
+
+    def __init__(self, redis: RedisClient, max_entries: int = None, ttl: int = None):
+        self.redis = redis
+        self.max_entries = max_entries or settings.PAPER_CACHE_SIZE
+        self.ttl = ttl or settings.PAPER_CACHE_TTL
+        self._local: "OrderedDict[Tuple[int, int], Dict[str, Any]]" = OrderedDict()
+        self._building: Dict[Tuple[int, int], asyncio.Lock] = {}
+
+    @staticmethod
+    def is_cacheable(exam: Exam) -> bool:
+        """只有固定组卷的试卷内容对所有考生相同，可以缓存"""
+        return not exam.is_random and not (exam.random_question_count and exam.random_question_count > 0)
+
+    @staticmethod
+    def _version_key(exam_id: int) -> str:
+        return f"paper:ver:{exam_id}"
+
+    @staticmethod
+    def _data_key(exam_id: int, version: int) -> str:
+        return f"paper:{exam_id}:{version}"
+
+    async def get_version(self, exam_id: int) -> int:
+        """获取试卷内容版本"""
+        version = await self.redis.get(self._version_key(exam_id))
+        return int(version) if version else 0
+
+    async def get_paper(self, db: AsyncSession, exam: Exam) -> Optional[Dict[str, Any]]:
+        """
+        获取试卷缓存，未命中时构建
+        随机组卷的考试返回 None
+        """
+        if not self.is_cacheable(exam):
+            return None
+
+        version = await self.get_version(exam.id)
+        cache_key = (exam.id, version)
+
+        paper = self._get_local(cache_key)
+        if paper is not None:
+            return paper
+
+        # 同一worker内并发未命中时只构建一次；无论命中、构建成功或失败都移除构建锁
+        lock = self._building.setdefault(cache_key, asyncio.Lock())
+        try:
+            async with lock:
+                paper = self._get_local(cache_key)
+                if paper is not None:
+                    return paper
+
+                data = await self.redis.get(self._data_key(exam.id, version))
+                if data:
+                    paper = json.loads(data)
+                else:
+                    from app.services.exam_service import ExamService
+                    paper = await ExamService(db).build_paper_payload(exam)
+                    paper["version"] = version
+                    await self.redis.set(
+                        self._data_key(exam.id, version),
+                        json.dumps(paper, ensure_ascii=False),
+                        expire=self.ttl
+                    )
+
+                self._put_local(cache_key, paper)
+                return paper
+        finally:
+            self._building.pop(cache_key, None)
+
+    async def invalidate(self, exam_id: int):
+        """试卷内容变化后递增版本号，旧版本缓存自然失效"""
+        await self.redis.incr(self._version_key(exam_id))
+        for key in [k for k in self._local if k[0] == exam_id]:
+            self._local.pop(key, None)
+
+    async def invalidate_many(self, exam_ids: Iterable[int]):
+        """批量失效"""
+        for exam_id in set(exam_ids):
+            await self.invalidate(exam_id)
+
+    def _get_local(self, key: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+        paper = self._local.get(key)
+        if paper is not None:
+            self._local.move_to_end(key)
+        return paper
+
+    def _put_local(self, key: Tuple[int, int], paper: Dict[str, Any]):
+        self._local[key] = paper
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+
+# 全局试卷缓存实例
+paper_cache = PaperCache(redis_client)
@@ -0,0 +1,141 @@
+"""
+楚然智考系统 - 登录主体缓存
+鉴权只需要用户的 (ID, 是否启用, 是否超管, 权限集合, 令牌版本)，
+按用户缓存这份精简数据：进程内带过期时间的LRU为一级缓存，Redis为二级缓存，
+命中时每个请求不再查询数据库。用户、角色变更后经缓存失效总线通知所有worker
+"""
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, FrozenSet, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.user import User, Role, UserRole
+from app.redis_client import redis_client, RedisClient
+from app.services.cache_bus import cache_bus
+from app.services.role_permissions import role_permissions
+
+
+@dataclass(frozen=True)
+class Principal:
+    """当前登录用户（鉴权所需字段）"""
+    id: int
+    is_active: bool
+    is_superuser: bool
+    permissions: FrozenSet[str]
+    token_version: int = 0
+
+    def to_json(self) -> str:
+        return json.dumps([self.id, self.is_active, self.is_superuser, sorted(self.permissions), self.token_version])
+
+    @classmethod
+    def from_json(cls, data: str) -> "Principal":
+        user_id, is_active, is_superuser, permissions, token_version = json.loads(data)
+        return cls(user_id, is_active, is_superuser, frozenset(permissions), token_version)
+
+
+class PrincipalCache:
+    """
+    登录主体缓存
+    Redis 键带角色权限快照版本，角色权限变化时快照版本递增，所有用户的二级缓存一起失效；
+    一级缓存收到 "user:{id}" 事件时移除该用户，收到 "role" 相关事件时清空，
+    local_ttl 只是总线消息丢失时的兜底
+    """
+
+    def __init__(self, redis: RedisClient, max_entries: int = None, local_ttl: int = None, ttl: int = None):
+        self.redis = redis
+        self.max_entries = max_entries or settings.PRINCIPAL_CACHE_SIZE
+        self.local_ttl = local_ttl or settings.PRINCIPAL_CACHE_LOCAL_TTL
+        self.ttl = ttl or settings.PRINCIPAL_CACHE_TTL
+        self._local: "OrderedDict[int, Tuple[float, Principal]]" = OrderedDict()
+
+    @staticmethod
+    def _data_key(version: int, user_id: int) -> str:
+        return f"principal:{version}:{user_id}"
+
+    async def get(self, db: AsyncSession, user_id: int) -> Optional[Principal]:
+        """获取登录主体，未命中时查库；用户不存在返回 None"""
+        principal = self._get_local(user_id)
+        if principal is not None:
+            return principal
+
+        # 权限按快照计算，缓存键使用本worker快照的版本
+        await role_permissions.get(db)
+        key = self._data_key(role_permissions.version, user_id)
+        data = await self.redis.get(key)
+        if data:
+            principal = Principal.from_json(data)
+        else:
+            principal = await self.load(db, user_id)
+            if principal is None:
+                return None
+            await self.redis.set(key, principal.to_json(), expire=self.ttl)
+
+        self._put_local(user_id, principal)
+        return principal
+
+    @staticmethod
+    async def load(db: AsyncSession, user_id: int) -> Optional[Principal]:
+        """从数据库加载登录主体"""
+        # 用户及其角色编码一次查出（无角色时角色编码为 NULL）
+        rows = (await db.execute(
+            select(User.id, User.is_active, User.is_superuser, User.token_version, Role.code)
+            .outerjoin(UserRole, UserRole.user_id == User.id)
+            .outerjoin(Role, Role.id == UserRole.role_id)
+            .where(User.id == user_id)
+        )).all()
+        if not rows:
+            return None
+
+        row = rows[0]
+        role_codes = [r.code for r in rows if r.code]
+        return Principal(
+            id=row.id,
+            is_active=bool(row.is_active),
+            is_superuser=bool(row.is_superuser),
+            permissions=await role_permissions.permissions_for(db, role_codes),
+            token_version=row.token_version or 0
+        )
+
+    async def invalidate(self, user_id: int):
+        """用户信息、角色变化后失效（提交事务后调用）"""
+        version = int(await self.redis.get(role_permissions.VERSION_KEY) or 0)
+        await self.redis.delete(self._data_key(version, user_id))
+        await cache_bus.publish(f"user:{user_id}")
+
+    def _on_invalidate(self, event: str):
+        """总线回调：清理一级缓存（二级缓存随快照版本递增已失效）"""
+        kind, _, ident = event.partition(":")
+        if kind in ("role", "*"):
+            self._local.clear()
+        elif kind == "user":
+            if ident.isdigit():
+                self._local.pop(int(ident), None)
+            else:
+                self._local.clear()
+
+    def _get_local(self, user_id: int) -> Optional[Principal]:
+        entry = self._local.get(user_id)
+        if entry is None:
+            return None
+        expires_at, principal = entry
+        if expires_at < time.monotonic():
+            self._local.pop(user_id, None)
+            return None
+        self._local.move_to_end(user_id)
+        return principal
+
+    def _put_local(self, user_id: int, principal: Principal):
+        self._local[user_id] = (time.monotonic() + self.local_ttl, principal)
+        self._local.move_to_end(user_id)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+
+# 全局登录主体缓存实例
+principal_cache = PrincipalCache(redis_client)
+cache_bus.subscribe(principal_cache._on_invalidate)
@@ -0,0 +1,267 @@
+"""
+楚然智考系统 - 查询缓存
+读多写少的查询结果两级缓存：进程内LRU为一级缓存，Redis为二级缓存（值需可JSON序列化）。
+- 过期时间按比例随机浮动，避免同一批键同时过期
+- 同一键并发未命中时只加载一次：worker内共享同一个加载任务，worker间用Redis锁互斥；
+  加载任务不属于任何一个请求（发起的请求被取消后仍为其他等待者继续执行），加载函数须使用独立的数据库会话
+- 过期后在 stale_ttl 内仍返回旧值，同时在后台刷新
+- 写入时登记标签，数据变化后按标签失效；失效事件经缓存失效总线广播，各worker同步清理一级缓存
+"""
+import asyncio
+import functools
+import json
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from loguru import logger
+
+from app.config import settings
+from app.redis_client import redis_client, RedisClient
+from app.services.cache_bus import cache_bus, tag_matches
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+class QueryCache:
+    """两级查询缓存"""
+
+    KEY_PREFIX = "qc:"
+    TAG_PREFIX = "qc:tag:"
+    LOCK_PREFIX = "lock:qc:"
+
+    def __init__(self, redis: RedisClient, max_entries: int = None, local_ttl: int = None, jitter: float = None):
+        self.redis = redis
+        self.max_entries = max_entries or settings.QUERY_CACHE_SIZE
+        self.local_ttl = local_ttl or settings.QUERY_CACHE_LOCAL_TTL
+        self.jitter = settings.QUERY_CACHE_TTL_JITTER if jitter is None else jitter
+        # 键 -> (一级缓存过期时间, 值, 标签)
+        self._local: "OrderedDict[str, Tuple[float, Any, Tuple[str, ...]]]" = OrderedDict()
+        self._tag_index: Dict[str, Set[str]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # 每次失效递增，加载期间发生过失效的结果不写入缓存
+        self._epoch = 0
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Loader,
+        ttl: int,
+        tags: Iterable[str] = (),
+        stale_ttl: int = 0
+    ) -> Any:
+        """
+        读取缓存，未命中时调用 loader 加载并写入
+        loader: 在共享的加载任务中执行，可能在发起请求结束后才完成，不能使用请求内的数据库会话
+        ttl: 新鲜期(秒)
+        stale_ttl: 过期后仍可返回旧值的时长(秒)，期间用 loader 在后台刷新
+        """
+        tags = tuple(tags)
+        value = self._get_local(key)
+        if value is not None:
+            return value
+
+        entry = await self._get_remote(key)
+        if entry is not None:
+            value, fresh_until = entry
+            if fresh_until > time.time():
+                self._put_local(key, value, fresh_until, tags)
+                return value
+            if stale_ttl:
+                self._refresh(key, loader, ttl, tags, stale_ttl)
+                return value
+
+        return await self._load(key, loader, ttl, tags, stale_ttl)
+
+    async def set(self, key: str, value: Any, ttl: int, tags: Iterable[str] = (), stale_ttl: int = 0):
+        """写入缓存"""
+        tags = tuple(tags)
+        ttl = ttl * random.uniform(1 - self.jitter, 1 + self.jitter)
+        fresh_until = time.time() + ttl
+        expire = int(ttl + stale_ttl) + 1
+
+        tag_keys = [self.TAG_PREFIX + tag for tag in tags]
+        async with self.redis.pipeline() as pipe:
+            pipe.set(
+                self.KEY_PREFIX + key,
+                json.dumps({"v": value, "exp": fresh_until}, ensure_ascii=False),
+                expire=expire
+            )
+            for tag_key in tag_keys:
+                pipe.sadd(tag_key, key)
+                pipe.ttl(tag_key)
+        # 标签集合的过期时间不短于其中任何一个键
+        ttls = pipe.results[2::2]
+        async with self.redis.pipeline() as pipe:
+            for tag_key, tag_ttl in zip(tag_keys, ttls):
+                if tag_ttl < expire:
+                    pipe.expire(tag_key, expire)
+
+        self._put_local(key, value, fresh_until, tags)
+
+    async def invalidate(self, *keys: str):
+        """按键失效（提交事务后调用）"""
+        self._epoch += 1
+        for key in keys:
+            self._evict_local(key)
+        await self.redis.delete(*[self.KEY_PREFIX + key for key in keys])
+
+    async def invalidate_tags(self, *events: str):
+        """
+        按标签失效（提交事务后调用）
+        事件可以是标签本身（"exam"）、具体对象（"exam:42"，同时失效 "exam" 标签）或通配符（"role:*"）
+        """
+        self._epoch += 1
+        tag_keys = list({self.TAG_PREFIX + tag for event in events for tag in self._remote_tags(event)})
+        async with self.redis.pipeline() as pipe:
+            for tag_key in tag_keys:
+                pipe.smembers(tag_key)
+        keys = set().union(*pipe.results)
+        await self.redis.delete(*tag_keys, *[self.KEY_PREFIX + key for key in keys])
+        # 本worker及其他worker的一级缓存由总线回调清理
+        await cache_bus.publish(*events)
+
+    @staticmethod
+    def _remote_tags(event: str) -> Tuple[str, ...]:
+        """事件影响的二级缓存标签：事件本身及其各级前缀（通配符部分只作用于一级缓存）"""
+        parts = event.split(":")
+        tags = [":".join(parts[:i]) for i in range(1, len(parts) + 1)]
+        return tuple(tag for tag in tags if "*" not in tag and "?" not in tag and "[" not in tag)
+
+    def _on_invalidate(self, event: str):
+        """总线回调：清理一级缓存中受事件影响的条目"""
+        self._epoch += 1
+        if event == "*":
+            self._local.clear()
+            self._tag_index.clear()
+            return
+        for tag in [t for t in self._tag_index if tag_matches(t, event)]:
+            for key in self._tag_index.pop(tag, set()):
+                self._evict_local(key)
+
+    # ==================== 加载 ====================
+
+    async def _load(self, key: str, loader: Loader, ttl: int, tags: Tuple[str, ...], stale_ttl: int) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._start(key, loader, ttl, tags, stale_ttl)
+        # 调用方被取消时不影响其他等待同一结果的请求
+        return await asyncio.shield(task)
+
+    def _refresh(self, key: str, loader: Loader, ttl: int, tags: Tuple[str, ...], stale_ttl: int):
+        if key in self._inflight:
+            return
+        task = self._start(key, loader, ttl, tags, stale_ttl)
+        task.add_done_callback(functools.partial(self._log_refresh_error, key))
+
+    def _start(self, key: str, loader: Loader, ttl: int, tags: Tuple[str, ...], stale_ttl: int) -> asyncio.Task:
+        task = asyncio.create_task(self._fill(key, loader, ttl, tags, stale_ttl))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._inflight.pop(key) if self._inflight.get(key) is t else None)
+        return task
+
+    async def _fill(self, key: str, loader: Loader, ttl: int, tags: Tuple[str, ...], stale_ttl: int) -> Any:
+        # 多个worker同时未命中时只有一个加载，其余等锁释放后读取其结果；等锁超时则各自加载
+        async with self.redis.lock(
+            self.LOCK_PREFIX + key,
+            ttl_ms=settings.QUERY_CACHE_LOCK_TTL * 1000,
+            wait_timeout=settings.QUERY_CACHE_LOCK_WAIT
+        ):
+            entry = await self._get_remote(key)
+            if entry is not None and entry[1] > time.time():
+                self._put_local(key, entry[0], entry[1], tags)
+                return entry[0]
+
+            epoch = self._epoch
+            value = await loader()
+            if epoch == self._epoch:
+                await self.set(key, value, ttl, tags, stale_ttl)
+            return value
+
+    @staticmethod
+    def _log_refresh_error(key: str, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"缓存后台刷新失败 {key}: {task.exception()}")
+
+    # ==================== 本地缓存 ====================
+
+    async def _get_remote(self, key: str) -> Optional[Tuple[Any, float]]:
+        data = await self.redis.get(self.KEY_PREFIX + key)
+        if not data:
+            return None
+        entry = json.loads(data)
+        return entry["v"], entry["exp"]
+
+    def _get_local(self, key: str) -> Any:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            self._evict_local(key)
+            return None
+        self._local.move_to_end(key)
+        return entry[1]
+
+    def _put_local(self, key: str, value: Any, fresh_until: float, tags: Tuple[str, ...]):
+        # 一级缓存最多保留 local_ttl 秒，其他worker写入后的不一致时间以此为上限
+        self._local[key] = (min(fresh_until, time.time() + self.local_ttl), value, tags)
+        self._local.move_to_end(key)
+        for tag in tags:
+            self._tag_index.setdefault(tag, set()).add(key)
+        while len(self._local) > self.max_entries:
+            self._evict_local(next(iter(self._local)))
+
+    def _evict_local(self, key: str):
+        entry = self._local.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    self._tag_index.pop(tag, None)
+
+
+# 全局查询缓存实例
+query_cache = QueryCache(redis_client)
+cache_bus.subscribe(query_cache._on_invalidate)
+
+
+def _args_key(args: tuple, kwargs: dict) -> str:
+    return ":".join([str(arg) for arg in args] + [f"{k}={v}" for k, v in sorted(kwargs.items())])
+
+
+def cached(
+    namespace: str,
+    ttl: int,
+    tags: Iterable[str] = (),
+    key: Callable[..., str] = None,
+    stale_ttl: int = 0
+):
+    """
+    装饰器：缓存服务方法的返回值（需可JSON序列化）
+    缓存键为 namespace + 方法参数，key 可自定义参数到键的映射（如忽略不影响结果的参数）；
+    加载（含后台刷新）使用独立会话重新构造服务，不使用调用方的会话，服务类需可用 Service(db) 构造
+    用法: @cached("knowledge_tree", ttl=300, tags=("knowledge",), stale_ttl=60)
+    """
+    tags = tuple(tags)
+
+    def decorator(func: Callable):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            suffix = key(*args, **kwargs) if key else _args_key(args, kwargs)
+            cache_key = f"{namespace}:{suffix}" if suffix else namespace
+
+            async def load():
+                from app.database import AsyncSessionLocal
+                async with AsyncSessionLocal() as db:
+                    return await func(type(self)(db), *args, **kwargs)
+
+            return await query_cache.get_or_load(cache_key, load, ttl, tags, stale_ttl)
+
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
@@ -0,0 +1,231 @@
+"""
+楚然智考系统 - 题目计数写缓冲
+交卷时题目的使用次数/正确次数只累加到缓冲，由后台任务定期批量写入 questions 表，
+避免大量考生同时交卷时热门题目行成为锁热点
+"""
+import asyncio
+import threading
+import time
+import uuid
+from typing import Dict, Tuple, Iterable, List
+
+from loguru import logger
+from sqlalchemy import case, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.question import Question
+from app.redis_client import redis_client, RedisClient
+
+# Redis中所有worker共享的待写增量，字段为 "<题目ID>:u"（使用次数）和 "<题目ID>:c"（正确次数）
+PENDING_KEY = "qcounter:pending"
+
+# 正在写库的整批增量: qcounter:flushing:<取走时间戳>:<随机串>，写库提交后删除
+FLUSHING_PREFIX = "qcounter:flushing:"
+
+# 取走超过该时间仍未删除的整批增量视为写库进程已退出，合并回待写哈希（需远大于一次写库耗时）
+STALE_FLUSHING_SECONDS = 600
+
+# 单条 UPDATE 包含的题目数量上限
+FLUSH_BATCH_SIZE = 500
+
+
+async def apply_question_counters(db: AsyncSession, deltas: Dict[int, Tuple[int, int]]):
+    """
+    批量累加题目使用次数和正确次数
+    deltas: {题目ID: (使用次数增量, 正确次数增量)}，每批一条 UPDATE ... CASE 完成
+    """
+    items = list(deltas.items())
+    for i in range(0, len(items), FLUSH_BATCH_SIZE):
+        batch = dict(items[i:i + FLUSH_BATCH_SIZE])
+        use_case = case({q_id: d[0] for q_id, d in batch.items()}, value=Question.id, else_=0)
+        correct_case = case({q_id: d[1] for q_id, d in batch.items()}, value=Question.id, else_=0)
+        await db.execute(
+            update(Question)
+            .where(Question.id.in_(list(batch)))
+            .values(
+                use_count=Question.use_count + use_case,
+                correct_count=Question.correct_count + correct_case
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+class QuestionCounterBuffer:
+    """
+    题目计数写缓冲
+    交卷请求同步写入进程内缓冲；后台任务定期把增量汇总到Redis哈希，
+    再通过原子 RENAME 取走整批增量写库，写库提交后才删除取走的批次。Redis不可用时直接由本进程写库
+    """
+
+    def __init__(self, redis: RedisClient, flush_interval: int = None):
+        self.redis = redis
+        self.flush_interval = flush_interval or settings.COUNTER_FLUSH_INTERVAL
+        self._local: Dict[int, List[int]] = {}
+        self._lock = threading.Lock()
+        self._task: asyncio.Task = None
+        self._recovered_at = 0.0
+
+    def add(self, deltas: Dict[int, Tuple[int, int]]):
+        """累加增量（线程安全，不访问数据库和Redis）"""
+        with self._lock:
+            for q_id, (use, correct) in deltas.items():
+                item = self._local.setdefault(q_id, [0, 0])
+                item[0] += use
+                item[1] += correct
+
+    def _drain_local(self) -> Dict[int, Tuple[int, int]]:
+        with self._lock:
+            local, self._local = self._local, {}
+        return {q_id: (v[0], v[1]) for q_id, v in local.items()}
+
+    async def push(self):
+        """
+        本地增量推送到Redis哈希，使其他worker也能读到
+        Redis不可用时增量留在本进程缓冲，下次推送或刷新时重试（不写入内存缓存，避免与Redis中的增量分离后丢失）
+        """
+        if self.redis.using_memory:
+            return
+        deltas = self._drain_local()
+        if not deltas:
+            return
+        # 整批增量一次往返写入
+        async with self.redis.pipeline(fallback=False) as pipe:
+            for q_id, (use, correct) in deltas.items():
+                if use:
+                    pipe.hincrby(PENDING_KEY, f"{q_id}:u", use)
+                if correct:
+                    pipe.hincrby(PENDING_KEY, f"{q_id}:c", correct)
+        if pipe.results is None:
+            self.add(deltas)
+
+    async def flush(self):
+        """把待写增量批量写入 questions 表"""
+        if self.redis.using_memory:
+            deltas = self._drain_local()
+            try:
+                if deltas:
+                    await self._write_db(deltas)
+            except Exception as e:
+                logger.error(f"题目计数写库失败，增量保留到下次刷新: {e}")
+                self.add(deltas)
+            return
+
+        await self.push()
+        await self._recover_flushing()
+        # 原子取走整批增量，多个worker同时刷新时只有一个能取到
+        flushing_key = f"{FLUSHING_PREFIX}{int(time.time())}:{uuid.uuid4().hex}"
+        if not await self.redis.rename(PENDING_KEY, flushing_key):
+            return
+        # 不降级读取：Redis不可用时整批留在Redis中，超时后由 _recover_flushing 合并回待写哈希
+        async with self.redis.pipeline(fallback=False) as pipe:
+            pipe.hgetall(flushing_key)
+        if pipe.results is None:
+            return
+
+        deltas = self._parse(pipe.results[0])
+        try:
+            if deltas:
+                await self._write_db(deltas)
+        except Exception as e:
+            logger.error(f"题目计数写库失败，增量保留到下次刷新: {e}")
+            await self.redis.hmerge(flushing_key, PENDING_KEY)
+            return
+        await self.redis.delete(flushing_key)
+
+    async def _recover_flushing(self):
+        """合并已取走但写库进程中途退出（未删除）的整批增量，每 STALE_FLUSHING_SECONDS 扫描一次"""
+        now = time.time()
+        if now - self._recovered_at < STALE_FLUSHING_SECONDS:
+            return
+        self._recovered_at = now
+        for key in await self.redis.scan_keys(f"{FLUSHING_PREFIX}*"):
+            try:
+                taken_at = int(key[len(FLUSHING_PREFIX):].split(":")[0])
+            except ValueError:
+                taken_at = 0  # 无时间戳的旧格式键
+            if now - taken_at < STALE_FLUSHING_SECONDS:
+                continue
+            merged = await self.redis.hmerge(key, PENDING_KEY)
+            if merged:
+                logger.warning(f"题目计数批次 {key} 未完成写库，已合并回待写增量（{merged} 个字段）")
+
+    @staticmethod
+    def _parse(data: Dict[str, str]) -> Dict[int, Tuple[int, int]]:
+        deltas: Dict[int, List[int]] = {}
+        for field, value in data.items():
+            q_id, kind = field.split(":")
+            item = deltas.setdefault(int(q_id), [0, 0])
+            item[0 if kind == "u" else 1] += int(value)
+        return {q_id: (v[0], v[1]) for q_id, v in deltas.items()}
+
+    @staticmethod
+    async def _write_db(deltas: Dict[int, Tuple[int, int]]):
+        async with AsyncSessionLocal() as db:
+            await apply_question_counters(db, deltas)
+            await db.commit()
+
+    # ==================== 近实时读取 ====================
+
+    async def get_pending(self, question_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+        """获取尚未写库的增量（本进程缓冲 + Redis待写哈希）"""
+        ids = list(set(question_ids))
+        pending: Dict[int, List[int]] = {}
+        with self._lock:
+            for q_id in ids:
+                if q_id in self._local:
+                    pending[q_id] = list(self._local[q_id])
+
+        if ids and not self.redis.using_memory:
+            fields = [f"{q_id}:{kind}" for q_id in ids for kind in ("u", "c")]
+            values = await self.redis.hmget(PENDING_KEY, fields)
+            for i, q_id in enumerate(ids):
+                use, correct = int(values[2 * i] or 0), int(values[2 * i + 1] or 0)
+                if use or correct:
+                    item = pending.setdefault(q_id, [0, 0])
+                    item[0] += use
+                    item[1] += correct
+
+        return {q_id: (v[0], v[1]) for q_id, v in pending.items()}
+
+    async def apply_pending(self, questions: Iterable[Question]):
+        """在数据库值上叠加待写增量（不标记为脏数据，不会被提交）"""
+        questions = list(questions)
+        pending = await self.get_pending(q.id for q in questions)
+        for q in questions:
+            if q.id in pending:
+                use, correct = pending[q.id]
+                set_committed_value(q, "use_count", (q.use_count or 0) + use)
+                set_committed_value(q, "correct_count", (q.correct_count or 0) + correct)
+
+    # ==================== 后台刷新 ====================
+
+    def start(self):
+        """启动后台刷新任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并把剩余增量写库"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"题目计数刷新失败: {e}")
+
+
+# 全局题目计数缓冲实例
+question_counters = QuestionCounterBuffer(redis_client)
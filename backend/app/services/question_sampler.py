@@ -0,0 +1,243 @@
+"""
+楚然智考系统 - 随机抽题索引
+在进程内按 (题库, 题型, 难度) 及知识点维护紧凑的题目ID数组，
+随机组卷时直接用 random.sample 抽取ID，避免 ORDER BY RAND() 全表扫描排序
+"""
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Optional, List, Dict, Tuple, Iterable, Set
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.services.cache_bus import cache_bus
+from app.models.question import Question, QuestionKnowledge
+
+# 分桶键: (题库ID, 题型, 难度)
+BucketKey = Tuple[Optional[int], str, str]
+
+
+def _enum_value(value) -> Optional[str]:
+    """枚举统一转为字符串值"""
+    return getattr(value, "value", value)
+
+
+class _Bucket:
+    """ID分桶：紧凑数组 + 位置表，增删均为O(1)（删除时与末尾元素交换）"""
+
+    __slots__ = ("ids", "pos")
+
+    def __init__(self):
+        self.ids = array("i")
+        self.pos: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, question_id: int):
+        if question_id in self.pos:
+            return
+        self.pos[question_id] = len(self.ids)
+        self.ids.append(question_id)
+
+    def remove(self, question_id: int):
+        idx = self.pos.pop(question_id, None)
+        if idx is None:
+            return
+        last = self.ids.pop()
+        if idx < len(self.ids):
+            self.ids[idx] = last
+            self.pos[last] = idx
+
+
+class QuestionSampler:
+    """随机抽题索引（每个worker进程一份）"""
+
+    def __init__(self, refresh_seconds: int = None):
+        self._lock = threading.RLock()
+        self._refresh_seconds = refresh_seconds if refresh_seconds is not None else settings.SAMPLER_REFRESH_SECONDS
+        self._loaded_at = 0.0
+        self._reset()
+
+    def _reset(self):
+        # 主分桶：每道启用的题目恰好属于一个桶
+        self._buckets: Dict[BucketKey, _Bucket] = {}
+        # 知识点分桶：(知识点ID, 题库ID, 题型, 难度)
+        self._kp_buckets: Dict[Tuple[int, Optional[int], str, str], _Bucket] = {}
+        # 题目ID -> (主分桶键, 知识点ID元组)
+        self._meta: Dict[int, Tuple[BucketKey, Tuple[int, ...]]] = {}
+
+    # ==================== 索引维护 ====================
+
+    async def ensure_loaded(self, db: AsyncSession):
+        """首次使用或超过刷新间隔时全量重建（兜底其他worker的写入）"""
+        if self._loaded_at and time.monotonic() - self._loaded_at < self._refresh_seconds:
+            return
+        await self.rebuild(db)
+
+    async def rebuild(self, db: AsyncSession):
+        """全量重建索引：只查询ID和分桶字段"""
+        rows = (await db.execute(
+            select(Question.id, Question.bank_id, Question.question_type, Question.difficulty)
+            .where(Question.is_active == 1)
+        )).all()
+
+        kp_map: Dict[int, List[int]] = {}
+        for question_id, knowledge_id in (await db.execute(
+            select(QuestionKnowledge.question_id, QuestionKnowledge.knowledge_id)
+        )).all():
+            kp_map.setdefault(question_id, []).append(knowledge_id)
+
+        with self._lock:
+            self._reset()
+            for question_id, bank_id, question_type, difficulty in rows:
+                self._add(question_id, bank_id, question_type, difficulty, kp_map.get(question_id, ()))
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """标记索引失效，下次抽题时全量重建"""
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def _on_invalidate(self, event: str):
+        """总线回调：其他worker修改了题目或题库时，下次抽题前全量重建"""
+        if event.partition(":")[0] in ("question", "bank", "*"):
+            self.invalidate()
+
+    def upsert(self, question: Question, knowledge_ids: Iterable[int] = None):
+        """
+        题目新增/修改后增量更新索引
+        knowledge_ids 为 None 表示知识点未变化
+        """
+        if not self._loaded_at:
+            return
+        with self._lock:
+            if knowledge_ids is None:
+                old = self._meta.get(question.id)
+                knowledge_ids = old[1] if old else ()
+            self._remove(question.id)
+            if question.is_active == 1:
+                self._add(
+                    question.id, question.bank_id, question.question_type,
+                    question.difficulty, knowledge_ids
+                )
+
+    def remove(self, question_id: int):
+        """题目删除或停用后移出索引"""
+        if not self._loaded_at:
+            return
+        with self._lock:
+            self._remove(question_id)
+
+    def remove_bank(self, bank_id: int):
+        """题库删除后移出其全部题目"""
+        if not self._loaded_at:
+            return
+        with self._lock:
+            for key in [k for k in self._buckets if k[0] == bank_id]:
+                for question_id in list(self._buckets[key].ids):
+                    self._remove(question_id)
+
+    def _add(self, question_id, bank_id, question_type, difficulty, knowledge_ids):
+        key = (bank_id, _enum_value(question_type), _enum_value(difficulty))
+        kps = tuple(knowledge_ids)
+        self._buckets.setdefault(key, _Bucket()).add(question_id)
+        for kp_id in kps:
+            self._kp_buckets.setdefault((kp_id,) + key, _Bucket()).add(question_id)
+        self._meta[question_id] = (key, kps)
+
+    def _remove(self, question_id: int):
+        meta = self._meta.pop(question_id, None)
+        if not meta:
+            return
+        key, kps = meta
+        self._buckets[key].remove(question_id)
+        for kp_id in kps:
+            self._kp_buckets[(kp_id,) + key].remove(question_id)
+
+    # ==================== 抽题 ====================
+
+    async def sample(
+        self,
+        db: AsyncSession,
+        count: int,
+        bank_ids: List[int] = None,
+        question_types: List[str] = None,
+        difficulty: str = None,
+        knowledge_ids: List[int] = None,
+        exclude_ids: Iterable[int] = None
+    ) -> List[int]:
+        """
+        随机抽取题目ID
+        开销与抽题数量和排除数量相关，与题库规模无关
+        """
+        if count <= 0:
+            return []
+        await self.ensure_loaded(db)
+
+        exclude: Set[int] = set(exclude_ids or ())
+        banks = set(bank_ids) if bank_ids else None
+        types = {_enum_value(t) for t in question_types} if question_types else None
+        difficulty = _enum_value(difficulty)
+
+        def match(key: BucketKey) -> bool:
+            bank_id, q_type, q_difficulty = key
+            return (
+                (banks is None or bank_id in banks)
+                and (types is None or q_type in types)
+                and (not difficulty or q_difficulty == difficulty)
+            )
+
+        with self._lock:
+            if not knowledge_ids:
+                buckets = [b for k, b in self._buckets.items() if match(k) and len(b)]
+                return self._sample_disjoint(buckets, count, exclude)
+
+            kps = set(knowledge_ids)
+            buckets = [
+                b for k, b in self._kp_buckets.items()
+                if k[0] in kps and match(k[1:]) and len(b)
+            ]
+            if len(kps) == 1:
+                return self._sample_disjoint(buckets, count, exclude)
+
+            # 多个知识点的桶之间可能重复，合并去重后抽取
+            pool = set()
+            for b in buckets:
+                pool.update(b.ids)
+            pool.difference_update(exclude)
+            return random.sample(list(pool), min(count, len(pool)))
+
+    @staticmethod
+    def _sample_disjoint(buckets: List[_Bucket], count: int, exclude: Set[int]) -> List[int]:
+        """
+        从互不相交的多个桶中等概率抽取
+        多抽 len(exclude) 个位置，过滤排除项后仍能凑够数量
+        """
+        if not buckets:
+            return []
+        bounds = list(accumulate(len(b) for b in buckets))
+        total = bounds[-1]
+        k = min(total, count + len(exclude))
+
+        result = []
+        for idx in random.sample(range(total), k):
+            b = bisect_right(bounds, idx)
+            offset = idx - (bounds[b - 1] if b else 0)
+            question_id = buckets[b].ids[offset]
+            if question_id in exclude:
+                continue
+            result.append(question_id)
+            if len(result) >= count:
+                break
+        return result
+
+
+# 全局抽题索引实例
+question_sampler = QuestionSampler()
+cache_bus.subscribe(question_sampler._on_invalidate, remote_only=True)
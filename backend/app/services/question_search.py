@@ -0,0 +1,60 @@
+"""
+楚然智考系统 - 题目全文检索
+题干、选项、解析上建有 FULLTEXT ... WITH PARSER ngram 全文索引（中文按 ngram_token_size 切分，默认2字），
+关键词检索用 MATCH ... AGAINST 走全文索引并按相关度排序，代替逐行扫描题干的 LIKE '%关键词%'。
+- 关键词按空白拆分，每段作为必须出现的短语（+"..."），与"包含关键词"的语义一致
+- 非 MySQL 数据库（本地 SQLite），或关键词短于 ngram 切分长度（无法命中全文索引）时退回 LIKE
+"""
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.sql import ColumnElement
+
+from app.config import settings
+from app.database import async_engine
+from app.models.question import Question
+
+# 全文索引 ft_question_text 的列，MATCH 的列必须与索引定义完全一致
+SEARCH_COLUMNS = (Question.title, Question.options, Question.analysis)
+
+# 布尔模式下有特殊含义的字符
+_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+
+def split_terms(keyword: str) -> List[str]:
+    """拆分关键词并去掉布尔模式运算符"""
+    terms = [_OPERATORS.sub(" ", term).strip() for term in keyword.split()]
+    return [term for term in terms if term]
+
+
+def boolean_query(terms: List[str]) -> str:
+    """每个关键词都必须以短语形式出现: +"光合作用" +"叶绿体" """
+    return " ".join(f'+"{term}"' for term in terms)
+
+
+def use_fulltext(terms: List[str]) -> bool:
+    return (
+        async_engine.dialect.name == "mysql"
+        and bool(terms)
+        and all(len(term) >= settings.SEARCH_NGRAM_TOKEN_SIZE for term in terms)
+    )
+
+
+def search_condition(keyword: str) -> Tuple[ColumnElement, Optional[ColumnElement]]:
+    """
+    关键词检索条件
+    返回: (筛选条件, 相关度表达式)，退回 LIKE 时相关度为 None
+    """
+    terms = split_terms(keyword)
+    if use_fulltext(terms):
+        score = match(*SEARCH_COLUMNS, against=boolean_query(terms)).in_boolean_mode()
+        # MATCH 直接作为 WHERE 条件时才会走全文索引
+        return score, score
+
+    terms = terms or [keyword]
+    return and_(*[
+        or_(*[column.contains(term) for column in SEARCH_COLUMNS])
+        for term in terms
+    ]), None
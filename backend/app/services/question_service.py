@@ -4,96 +4,134 @@
 """
 import json
 from typing import Optional, List, Tuple, Dict, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from sqlalchemy import select, func, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from app.models.question import Question, KnowledgePoint, QuestionKnowledge, QuestionType, DifficultyLevel
 from app.schemas.question import QuestionCreate, QuestionUpdate, KnowledgePointCreate, KnowledgePointUpdate
+from app.services.question_sampler import question_sampler
+from app.services.query_cache import cached, query_cache
+from app.services.paper_cache import paper_cache
+from app.services.pagination import Page, PageParams, paginate
+from app.services.question_search import search_condition
+
+
+def build_question(question_data: QuestionCreate, creator_id: int = None, bank_id: int = None) -> Question:
+    """由创建数据构建题目对象（不入库，题目服务与同步导入流程共用）"""
+    # 处理选项
+    options_json = None
+    if question_data.options:
+        options_json = json.dumps(question_data.options, ensure_ascii=False)
+    
+    return Question(
+        question_type=question_data.question_type,
+        title=question_data.title,
+        options=options_json,
+        answer=question_data.answer,
+        analysis=question_data.analysis,
+        difficulty=question_data.difficulty,
+        score=question_data.score,
+        image_url=question_data.image_url,
+        source=question_data.source,
+        creator_id=creator_id,
+        bank_id=bank_id
+    )
 
 
 class QuestionService:
     """题库服务类"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
     
     # ==================== 题目管理 ====================
     
-    def get_question_by_id(self, question_id: int) -> Optional[Question]:
+    @staticmethod
+    def _detail_query():
+        """题目详情查询，预加载知识点（异步会话不能在序列化时懒加载）"""
+        return select(Question).options(selectinload(Question.knowledge_points))
+    
+    async def get_question_by_id(self, question_id: int) -> Optional[Question]:
         """根据ID获取题目"""
-        return self.db.query(Question).filter(Question.id == question_id).first()
+        return await self.db.scalar(self._detail_query().where(Question.id == question_id))
+    
+    async def _reload_question(self, question_id: int) -> Optional[Question]:
+        """写入后重新加载题目及其知识点"""
+        return await self.db.scalar(
+            self._detail_query()
+            .where(Question.id == question_id)
+            .execution_options(populate_existing=True)
+        )
+    
+    async def get_questions_by_ids(self, question_ids: List[int]) -> List[Question]:
+        """按给定ID顺序一次性获取题目（不存在的ID会被跳过）"""
+        if not question_ids:
+            return []
+        questions = (await self.db.scalars(select(Question).where(Question.id.in_(question_ids)))).all()
+        question_map = {q.id: q for q in questions}
+        return [question_map[q_id] for q_id in question_ids if q_id in question_map]
     
-    def get_questions(
+    async def get_questions(
         self,
-        skip: int = 0,
-        limit: int = 20,
+        page: PageParams = None,
         keyword: str = None,
         question_type: str = None,
         difficulty: str = None,
         knowledge_id: int = None,
         is_active: int = None,
         bank_id: int = None
-    ) -> Tuple[List[Question], int]:
+    ) -> Page:
         """
         获取题目列表
-        返回: (题目列表, 总数)
+        返回: 分页结果（游标分页按 id 倒序；偏移分页有关键词时按相关度排序）
         """
-        query = self.db.query(Question)
+        query = select(Question)
+        rank = None
         
-        # 关键词搜索
+        # 关键词搜索（全文索引，按相关度排序）
         if keyword:
-            query = query.filter(Question.title.contains(keyword))
+            condition, rank = search_condition(keyword)
+            query = query.where(condition)
         
         # 题型筛选
         if question_type:
-            query = query.filter(Question.question_type == question_type)
+            query = query.where(Question.question_type == question_type)
         
         # 难度筛选
         if difficulty:
-            query = query.filter(Question.difficulty == difficulty)
+            query = query.where(Question.difficulty == difficulty)
         
         # 知识点筛选
         if knowledge_id:
-            query = query.join(QuestionKnowledge).filter(
+            query = query.join(QuestionKnowledge).where(
                 QuestionKnowledge.knowledge_id == knowledge_id
             )
         
         # 状态筛选
         if is_active is not None:
-            query = query.filter(Question.is_active == is_active)
+            query = query.where(Question.is_active == is_active)
         
         # 题库筛选
         if bank_id is not None:
-            query = query.filter(Question.bank_id == bank_id)
-        
-        total = query.count()
-        questions = query.order_by(Question.id.desc()).offset(skip).limit(limit).all()
-        
-        return questions, total
+            query = query.where(Question.bank_id == bank_id)
+        
+        return await paginate(
+            self.db,
+            query.options(selectinload(Question.knowledge_points)),
+            [(Question.id, True)],
+            page or PageParams(),
+            count_tags=("question",),
+            table=Question.__tablename__,
+            rank=rank
+        )
     
-    def create_question(self, question_data: QuestionCreate, creator_id: int = None, bank_id: int = None) -> Question:
+    async def create_question(self, question_data: QuestionCreate, creator_id: int = None, bank_id: int = None) -> Question:
         """创建题目"""
-        # 处理选项
-        options_json = None
-        if question_data.options:
-            options_json = json.dumps(question_data.options, ensure_ascii=False)
-        
-        question = Question(
-            question_type=question_data.question_type,
-            title=question_data.title,
-            options=options_json,
-            answer=question_data.answer,
-            analysis=question_data.analysis,
-            difficulty=question_data.difficulty,
-            score=question_data.score,
-            image_url=question_data.image_url,
-            source=question_data.source,
-            creator_id=creator_id,
-            bank_id=bank_id
-        )
+        question = build_question(question_data, creator_id, bank_id)
         
         self.db.add(question)
-        self.db.flush()
+        await self.db.flush()
         
         # 关联知识点
         if question_data.knowledge_ids:
@@ -101,22 +139,25 @@ class QuestionService:
                 qk = QuestionKnowledge(question_id=question.id, knowledge_id=kp_id)
                 self.db.add(qk)
         
-        self.db.commit()
-        self.db.refresh(question)
+        await self.db.commit()
+        question = await self._reload_question(question.id)
+        
+        question_sampler.upsert(question, question_data.knowledge_ids or [])
+        await query_cache.invalidate_tags(f"question:{question.id}")
         
         return question
     
-    def create_questions_batch(self, questions_data: List[QuestionCreate], creator_id: int = None, bank_id: int = None) -> List[Question]:
+    async def create_questions_batch(self, questions_data: List[QuestionCreate], creator_id: int = None, bank_id: int = None) -> List[Question]:
         """批量创建题目"""
         questions = []
         for q_data in questions_data:
-            question = self.create_question(q_data, creator_id, bank_id)
+            question = await self.create_question(q_data, creator_id, bank_id)
             questions.append(question)
         return questions
     
-    def update_question(self, question_id: int, question_data: QuestionUpdate) -> Optional[Question]:
+    async def update_question(self, question_id: int, question_data: QuestionUpdate) -> Optional[Question]:
         """更新题目"""
-        question = self.get_question_by_id(question_id)
+        question = await self.get_question_by_id(question_id)
         if not question:
             return None
         
@@ -131,101 +172,116 @@ class QuestionService:
         
         # 更新知识点关联
         if question_data.knowledge_ids is not None:
-            self.db.query(QuestionKnowledge).filter(
+            await self.db.execute(delete(QuestionKnowledge).where(
                 QuestionKnowledge.question_id == question_id
-            ).delete()
+            ))
             for kp_id in question_data.knowledge_ids:
                 qk = QuestionKnowledge(question_id=question_id, knowledge_id=kp_id)
                 self.db.add(qk)
         
-        self.db.commit()
-        self.db.refresh(question)
+        await self.db.commit()
+        question = await self._reload_question(question_id)
+        
+        # 增量刷新抽题索引（停用的题目会被移出）
+        question_sampler.upsert(question, question_data.knowledge_ids)
+        await query_cache.invalidate_tags(f"question:{question_id}")
         
         return question
     
-    def delete_question(self, question_id: int) -> bool:
+    async def delete_question(self, question_id: int) -> bool:
         """删除题目，如果题库变空则同时删除题库和相关考试"""
-        question = self.get_question_by_id(question_id)
+        question = await self.get_question_by_id(question_id)
         if not question:
             return False
         
         bank_id = question.bank_id
         
-        self.db.delete(question)
-        self.db.commit()
+        await self.db.delete(question)
+        await self.db.commit()
+        question_sampler.remove(question_id)
+        await query_cache.invalidate_tags(f"question:{question_id}")
         
         # 检查题库是否还有题目，如果没有则删除题库和相关考试
         if bank_id:
-            remaining_count = self.db.query(Question).filter(Question.bank_id == bank_id).count()
+            remaining_count = await self.db.scalar(
+                select(func.count(Question.id)).where(Question.bank_id == bank_id)
+            )
             if remaining_count == 0:
-                self._delete_bank_and_related_exams(bank_id)
+                await self._delete_bank_and_related_exams(bank_id)
         
         return True
     
-    def _delete_bank_and_related_exams(self, bank_id: int):
+    async def _delete_bank_and_related_exams(self, bank_id: int):
         """删除题库及其相关的考试"""
         from app.models.question import QuestionBank
         from app.models.exam import Exam, ExamQuestion, ExamRecord, ExamAnswer
         
         # 获取该题库的所有题目ID（包括已删除的，通过exam_questions关联查找）
         # 查找使用了该题库题目的考试
-        bank = self.db.query(QuestionBank).filter(QuestionBank.id == bank_id).first()
+        bank = await self.db.scalar(select(QuestionBank).where(QuestionBank.id == bank_id))
         if not bank:
             return
         
         # 获取该题库曾经的题目关联的考试ID
-        exam_ids = self.db.query(ExamQuestion.exam_id).join(
-            Question, ExamQuestion.question_id == Question.id
-        ).filter(Question.bank_id == bank_id).distinct().all()
-        exam_ids = [e[0] for e in exam_ids]
+        exam_ids = (await self.db.scalars(
+            select(ExamQuestion.exam_id).join(
+                Question, ExamQuestion.question_id == Question.id
+            ).where(Question.bank_id == bank_id).distinct()
+        )).all()
         
         # 如果没有通过题目找到考试，尝试查找没有题目的考试（可能题目已删除）
         # 删除这些考试的相关数据
         if exam_ids:
+            no_sync = {"synchronize_session": False}
             # 删除考试答案
-            self.db.query(ExamAnswer).filter(
+            await self.db.execute(delete(ExamAnswer).where(
                 ExamAnswer.record_id.in_(
-                    self.db.query(ExamRecord.id).filter(ExamRecord.exam_id.in_(exam_ids))
+                    select(ExamRecord.id).where(ExamRecord.exam_id.in_(exam_ids))
                 )
-            ).delete(synchronize_session=False)
+            ), execution_options=no_sync)
             
             # 删除考试记录
-            self.db.query(ExamRecord).filter(ExamRecord.exam_id.in_(exam_ids)).delete(synchronize_session=False)
+            await self.db.execute(delete(ExamRecord).where(ExamRecord.exam_id.in_(exam_ids)), execution_options=no_sync)
             
             # 删除考试题目关联
-            self.db.query(ExamQuestion).filter(ExamQuestion.exam_id.in_(exam_ids)).delete(synchronize_session=False)
+            await self.db.execute(delete(ExamQuestion).where(ExamQuestion.exam_id.in_(exam_ids)), execution_options=no_sync)
             
             # 删除考试
-            self.db.query(Exam).filter(Exam.id.in_(exam_ids)).delete(synchronize_session=False)
+            await self.db.execute(delete(Exam).where(Exam.id.in_(exam_ids)), execution_options=no_sync)
         
         # 删除题库
-        self.db.delete(bank)
-        self.db.commit()
+        await self.db.delete(bank)
+        await self.db.commit()
+        await query_cache.invalidate_tags(f"bank:{bank_id}", *(f"exam:{exam_id}" for exam_id in exam_ids))
+        await paper_cache.invalidate_many(exam_ids)
     
-    def delete_all_questions(self) -> int:
+    async def delete_all_questions(self) -> int:
         """删除所有题目，同时删除所有题库和相关考试"""
         from app.models.question import QuestionBank
         from app.models.exam import Exam, ExamQuestion, ExamRecord, ExamAnswer
         
-        count = self.db.query(Question).count()
+        count = await self.db.scalar(select(func.count(Question.id)))
+        exam_ids = (await self.db.scalars(select(Exam.id))).all()
         
         # 删除所有考试相关数据
-        self.db.query(ExamAnswer).delete(synchronize_session=False)
-        self.db.query(ExamRecord).delete(synchronize_session=False)
-        self.db.query(ExamQuestion).delete(synchronize_session=False)
-        self.db.query(Exam).delete(synchronize_session=False)
+        no_sync = {"synchronize_session": False}
+        for model in (ExamAnswer, ExamRecord, ExamQuestion, Exam):
+            await self.db.execute(delete(model), execution_options=no_sync)
         
         # 删除所有题目
-        self.db.query(Question).delete(synchronize_session=False)
+        await self.db.execute(delete(Question), execution_options=no_sync)
         
         # 删除所有题库
-        self.db.query(QuestionBank).delete(synchronize_session=False)
+        await self.db.execute(delete(QuestionBank), execution_options=no_sync)
         
-        self.db.commit()
+        await self.db.commit()
+        question_sampler.invalidate()
+        await query_cache.invalidate_tags("question:*", "bank:*", "exam:*")
+        await paper_cache.invalidate_many(exam_ids)
         
         return count
     
-    def get_random_questions(
+    async def get_random_questions(
         self,
         count: int,
         question_type: str = None,
@@ -235,58 +291,48 @@ class QuestionService:
     ) -> List[Question]:
         """
         随机获取题目
-        用于随机组卷
+        用于随机组卷：先从内存索引抽取ID，再按ID一次性加载题目
         """
-        from sqlalchemy.sql.expression import func
-        
-        query = self.db.query(Question).filter(Question.is_active == 1)
-        
-        if question_type:
-            query = query.filter(Question.question_type == question_type)
-        
-        if difficulty:
-            query = query.filter(Question.difficulty == difficulty)
-        
-        if knowledge_ids:
-            query = query.join(QuestionKnowledge).filter(
-                QuestionKnowledge.knowledge_id.in_(knowledge_ids)
-            )
-        
-        if exclude_ids:
-            query = query.filter(~Question.id.in_(exclude_ids))
-        
-        # 随机排序并限制数量
-        questions = query.order_by(func.random()).limit(count).all()
-        
-        return questions
+        question_ids = await question_sampler.sample(
+            self.db,
+            count,
+            question_types=[question_type] if question_type else None,
+            difficulty=difficulty,
+            knowledge_ids=knowledge_ids,
+            exclude_ids=exclude_ids
+        )
+        return await self.get_questions_by_ids(question_ids)
     
     # ==================== 知识点管理 ====================
     
-    def get_knowledge_point_by_id(self, kp_id: int) -> Optional[KnowledgePoint]:
+    async def get_knowledge_point_by_id(self, kp_id: int) -> Optional[KnowledgePoint]:
         """根据ID获取知识点"""
-        return self.db.query(KnowledgePoint).filter(KnowledgePoint.id == kp_id).first()
+        return await self.db.scalar(select(KnowledgePoint).where(KnowledgePoint.id == kp_id))
     
-    def get_knowledge_points(
+    async def get_knowledge_points(
         self,
         parent_id: int = None,
         is_active: int = None
     ) -> List[KnowledgePoint]:
         """获取知识点列表"""
-        query = self.db.query(KnowledgePoint)
+        query = select(KnowledgePoint)
         
         if parent_id is not None:
-            query = query.filter(KnowledgePoint.parent_id == parent_id)
+            query = query.where(KnowledgePoint.parent_id == parent_id)
         
         if is_active is not None:
-            query = query.filter(KnowledgePoint.is_active == is_active)
+            query = query.where(KnowledgePoint.is_active == is_active)
         
-        return query.order_by(KnowledgePoint.sort_order).all()
+        return list((await self.db.scalars(query.order_by(KnowledgePoint.sort_order))).all())
     
-    def get_knowledge_tree(self) -> List[Dict[str, Any]]:
+    @cached("knowledge_tree", ttl=300, tags=("knowledge",), stale_ttl=60)
+    async def get_knowledge_tree(self) -> List[Dict[str, Any]]:
         """获取知识点树形结构"""
-        all_points = self.db.query(KnowledgePoint).filter(
-            KnowledgePoint.is_active == 1
-        ).order_by(KnowledgePoint.sort_order).all()
+        all_points = (await self.db.scalars(
+            select(KnowledgePoint).where(
+                KnowledgePoint.is_active == 1
+            ).order_by(KnowledgePoint.sort_order)
+        )).all()
         
         # 构建树形结构
         def build_tree(parent_id: int = None) -> List[Dict[str, Any]]:
@@ -307,12 +353,12 @@ class QuestionService:
         
         return build_tree(None)
     
-    def create_knowledge_point(self, kp_data: KnowledgePointCreate) -> KnowledgePoint:
+    async def create_knowledge_point(self, kp_data: KnowledgePointCreate) -> KnowledgePoint:
         """创建知识点"""
         # 计算层级
         level = 1
         if kp_data.parent_id:
-            parent = self.get_knowledge_point_by_id(kp_data.parent_id)
+            parent = await self.get_knowledge_point_by_id(kp_data.parent_id)
             if parent:
                 level = parent.level + 1
         
@@ -326,14 +372,15 @@ class QuestionService:
         )
         
         self.db.add(kp)
-        self.db.commit()
-        self.db.refresh(kp)
+        await self.db.commit()
+        await self.db.refresh(kp)
+        await query_cache.invalidate_tags(f"knowledge:{kp.id}")
         
         return kp
     
-    def update_knowledge_point(self, kp_id: int, kp_data: KnowledgePointUpdate) -> Optional[KnowledgePoint]:
+    async def update_knowledge_point(self, kp_id: int, kp_data: KnowledgePointUpdate) -> Optional[KnowledgePoint]:
         """更新知识点"""
-        kp = self.get_knowledge_point_by_id(kp_id)
+        kp = await self.get_knowledge_point_by_id(kp_id)
         if not kp:
             return None
         
@@ -342,7 +389,7 @@ class QuestionService:
         # 如果更新了父级，重新计算层级
         if "parent_id" in update_data:
             if update_data["parent_id"]:
-                parent = self.get_knowledge_point_by_id(update_data["parent_id"])
+                parent = await self.get_knowledge_point_by_id(update_data["parent_id"])
                 if parent:
                     update_data["level"] = parent.level + 1
             else:
@@ -351,51 +398,54 @@ class QuestionService:
         for field, value in update_data.items():
             setattr(kp, field, value)
         
-        self.db.commit()
-        self.db.refresh(kp)
+        await self.db.commit()
+        await self.db.refresh(kp)
+        await query_cache.invalidate_tags(f"knowledge:{kp.id}")
         
         return kp
     
-    def delete_knowledge_point(self, kp_id: int) -> bool:
+    async def delete_knowledge_point(self, kp_id: int) -> bool:
         """删除知识点"""
-        kp = self.get_knowledge_point_by_id(kp_id)
+        kp = await self.get_knowledge_point_by_id(kp_id)
         if not kp:
             return False
         
         # 检查是否有子节点
-        children = self.db.query(KnowledgePoint).filter(
-            KnowledgePoint.parent_id == kp_id
-        ).count()
+        children = await self.db.scalar(
+            select(func.count(KnowledgePoint.id)).where(KnowledgePoint.parent_id == kp_id)
+        )
         if children > 0:
             return False
         
-        self.db.delete(kp)
-        self.db.commit()
+        await self.db.delete(kp)
+        await self.db.commit()
+        await query_cache.invalidate_tags(f"knowledge:{kp_id}")
         
         return True
     
     # ==================== 统计功能 ====================
     
-    def get_question_statistics(self) -> Dict[str, Any]:
+    @cached("question_stats", ttl=60, tags=("question",), stale_ttl=300)
+    async def get_question_statistics(self) -> Dict[str, Any]:
         """获取题目统计信息"""
-        total = self.db.query(Question).filter(Question.is_active == 1).count()
+        total = await self.db.scalar(select(func.count(Question.id)).where(Question.is_active == 1))
         
         # 按题型统计
         type_stats = {}
         for qt in QuestionType:
-            count = self.db.query(Question).filter(
+            count = await self.db.scalar(select(func.count(Question.id)).where(
                 Question.is_active == 1,
                 Question.question_type == qt
-            ).count()
+            ))
             type_stats[qt.value] = count
         
         # 按难度统计
         difficulty_stats = {}
         for dl in DifficultyLevel:
-            count = self.db.query(Question).filter(
+            count = await self.db.scalar(select(func.count(Question.id)).where(
                 Question.is_active == 1,
                 Question.difficulty == dl
-            ).count()
+            ))
             difficulty_stats[dl.value] = count
         
         return {
@@ -0,0 +1,37 @@
+"""
+楚然智考系统 - 读己之写
+配置只读副本后，读接口默认查询副本，副本相对主库有复制延迟。
+用户提交写入后在一小段时间内把该用户的读请求改走主库，
+保证交卷后立即查看的成绩详情、记录列表包含刚写入的数据。标记保存在Redis中，多个worker共享
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import READ_REPLICA_ENABLED, use_primary
+from app.redis_client import redis_client, RedisClient
+
+
+class RecentWrites:
+    """用户最近写入标记"""
+
+    def __init__(self, redis: RedisClient, window: int = None):
+        self.redis = redis
+        self.window = window or settings.READ_YOUR_WRITES_SECONDS
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"recent_write:{user_id}"
+
+    async def mark(self, user_id: int):
+        """记录用户刚刚写入（提交事务后调用）"""
+        if READ_REPLICA_ENABLED:
+            await self.redis.set(self._key(user_id), "1", expire=self.window)
+
+    async def route(self, db: AsyncSession, user_id: int):
+        """用户最近有写入时，读会话改走主库"""
+        if READ_REPLICA_ENABLED and await self.redis.exists(self._key(user_id)):
+            use_primary(db)
+
+
+# 全局读己之写实例
+recent_writes = RecentWrites(redis_client)
@@ -0,0 +1,346 @@
+"""
+楚然智考系统 - 批量重新判分
+题目答案修正后，按题目/考试/题库范围重新判分已交卷的答题记录：
+按主键游标分块读取 exam_answers，每块独立事务批量更新答题记录、考试记录汇总、错题本，
+内存占用与数据总量无关，也不会长时间锁表
+"""
+import asyncio
+import json
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
+
+from loguru import logger
+from sqlalchemy import select, func, case, update, delete, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.question import Question
+from app.models.exam import Exam, ExamRecord, ExamAnswer, WrongQuestion, RecordStatus
+from app.redis_client import redis_client, RedisClient
+from app.services.answer_key import AnswerKey
+from app.services.question_counters import question_counters
+
+# 重判范围
+SCOPE_QUESTION = "question"
+SCOPE_EXAM = "exam"
+SCOPE_BANK = "bank"
+SCOPES = (SCOPE_QUESTION, SCOPE_EXAM, SCOPE_BANK)
+
+# 按考试重判时每块读取的考试记录数
+EXAM_RECORD_CHUNK = 100
+
+# 任务进度保留时间(秒)
+JOB_TTL = 86400
+
+# 进行中任务连续丢失的心跳次数达到该值时视为中断（进程重启或退出）
+HEARTBEAT_MISSES = 3
+
+# 未结束的任务状态
+ACTIVE_STATUSES = ("pending", "running")
+
+
+class RegradeService:
+    """重新判分服务（单块处理，每块一个事务）"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_scope_question_ids(self, scope: str, target_id: int) -> List[int]:
+        """获取按题目/题库范围重判时需要处理的题目ID"""
+        if scope == SCOPE_QUESTION:
+            return [target_id]
+        rows = await self.db.scalars(select(Question.id).where(Question.bank_id == target_id).order_by(Question.id))
+        return list(rows.all())
+
+    async def regrade_question_chunk(self, question_id: int, after_id: int, limit: int) -> Tuple[Optional[int], Dict[str, int]]:
+        """
+        重判某道题的一块答题记录（按答题记录ID游标分页）
+        返回: (下一块游标，处理完毕时为 None, 本块统计)
+        """
+        rows = (await self.db.execute(select(
+            ExamAnswer.id, ExamAnswer.record_id, ExamAnswer.question_id,
+            ExamAnswer.user_answer, ExamAnswer.is_correct, ExamAnswer.score
+        ).where(
+            ExamAnswer.question_id == question_id,
+            ExamAnswer.id > after_id
+        ).order_by(ExamAnswer.id).limit(limit))).all()
+
+        stats = await self._regrade_rows(rows)
+        next_cursor = rows[-1].id if len(rows) == limit else None
+        return next_cursor, stats
+
+    async def regrade_exam_chunk(self, exam_id: int, after_record_id: int, limit: int = EXAM_RECORD_CHUNK) -> Tuple[Optional[int], Dict[str, int]]:
+        """
+        重判某场考试的一块考试记录（按考试记录ID游标分页）
+        返回: (下一块游标，处理完毕时为 None, 本块统计)
+        """
+        record_ids = list((await self.db.scalars(select(ExamRecord.id).where(
+            ExamRecord.exam_id == exam_id,
+            ExamRecord.id > after_record_id
+        ).order_by(ExamRecord.id).limit(limit))).all())
+        if not record_ids:
+            return None, self._empty_stats()
+
+        rows = (await self.db.execute(select(
+            ExamAnswer.id, ExamAnswer.record_id, ExamAnswer.question_id,
+            ExamAnswer.user_answer, ExamAnswer.is_correct, ExamAnswer.score
+        ).where(ExamAnswer.record_id.in_(record_ids)))).all()
+
+        stats = await self._regrade_rows(rows)
+        next_cursor = record_ids[-1] if len(record_ids) == limit else None
+        return next_cursor, stats
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, int]:
+        return {"processed": 0, "changed": 0, "records": 0}
+
+    async def _regrade_rows(self, rows) -> Dict[str, int]:
+        """按当前答案重判一批答题记录，只写回结果发生变化的行"""
+        stats = self._empty_stats()
+        stats["processed"] = len(rows)
+        if not rows:
+            return stats
+
+        records = {
+            r.id: r for r in (await self.db.scalars(select(ExamRecord).where(
+                ExamRecord.id.in_({row.record_id for row in rows}),
+                ExamRecord.status == RecordStatus.GRADED
+            ))).all()
+        }
+        questions = (await self.db.scalars(select(Question).where(
+            Question.id.in_({row.question_id for row in rows})
+        ))).all()
+        answer_key = AnswerKey.compile(questions)
+
+        score_maps: Dict[int, Dict[int, float]] = {}
+        answer_updates = []
+        affected_records = set()
+        wrong_rows = []
+        fixed_rows = []
+        correct_deltas = Counter()
+        now = datetime.now()
+
+        for row in rows:
+            record = records.get(row.record_id)
+            if not record:
+                continue
+            if record.id not in score_maps:
+                score_maps[record.id] = self._snapshot_scores(record)
+
+            result = answer_key.grade(row.question_id, row.user_answer, score_maps[record.id].get(row.question_id))
+            if result is None:
+                continue
+            is_correct, score = result
+            if is_correct == row.is_correct and score == row.score:
+                continue
+
+            answer_updates.append({"id": row.id, "is_correct": is_correct, "score": score, "updated_at": now})
+            affected_records.add(record.id)
+
+            was_correct, now_correct = row.is_correct == 1, is_correct == 1
+            if was_correct == now_correct:
+                continue
+            if now_correct:
+                correct_deltas[row.question_id] += 1
+                fixed_rows.append({"b_user": record.user_id, "b_question": row.question_id})
+            else:
+                correct_deltas[row.question_id] -= 1
+                wrong_rows.append({
+                    "user_id": record.user_id,
+                    "question_id": row.question_id,
+                    "wrong_count": 1,
+                    "last_wrong_answer": row.user_answer,
+                    "is_mastered": 0,
+                    "created_at": now,
+                    "updated_at": now,
+                })
+
+        if answer_updates:
+            # 按主键批量更新
+            await self.db.execute(update(ExamAnswer), answer_updates)
+            await self._refresh_record_aggregates([records[r] for r in affected_records])
+            await self._apply_wrong_book(wrong_rows, fixed_rows)
+
+        await self.db.commit()
+
+        if correct_deltas:
+            question_counters.add({q_id: (0, delta) for q_id, delta in correct_deltas.items() if delta})
+
+        stats["changed"] = len(answer_updates)
+        stats["records"] = len(affected_records)
+        return stats
+
+    @staticmethod
+    def _snapshot_scores(record: ExamRecord) -> Dict[int, float]:
+        """考试记录的试卷快照分值，旧记录无快照时按题目当前分值判分"""
+        if not record.paper_snapshot:
+            return {}
+        try:
+            snapshot = json.loads(record.paper_snapshot)
+        except (TypeError, ValueError):
+            return {}
+        return dict(zip(snapshot.get("question_ids", []), snapshot.get("scores", [])))
+
+    async def _refresh_record_aggregates(self, records: List[ExamRecord]):
+        """按答题记录重新汇总考试记录的得分、正确数、正确率、是否及格"""
+        if not records:
+            return
+        totals = {
+            record_id: (total or 0, correct or 0, answered or 0)
+            for record_id, total, correct, answered in (await self.db.execute(select(
+                ExamAnswer.record_id,
+                func.sum(ExamAnswer.score),
+                func.sum(case((ExamAnswer.is_correct == 1, 1), else_=0)),
+                func.count(ExamAnswer.id)
+            ).where(
+                ExamAnswer.record_id.in_([r.id for r in records])
+            ).group_by(ExamAnswer.record_id))).all()
+        }
+        pass_scores = dict((await self.db.execute(select(Exam.id, Exam.pass_score).where(
+            Exam.id.in_({r.exam_id for r in records})
+        ))).all())
+
+        for record in records:
+            total_score, correct_count, answered = totals.get(record.id, (0, 0, 0))
+            snapshot = json.loads(record.paper_snapshot) if record.paper_snapshot else {}
+            question_count = len(snapshot.get("question_ids", [])) or answered + (record.unanswered_count or 0)
+            accuracy = (correct_count / question_count * 100) if question_count else 0
+
+            record.score = total_score
+            record.correct_count = correct_count
+            record.wrong_count = answered - correct_count
+            record.accuracy = round(accuracy, 2)
+            record.is_passed = 1 if total_score >= (pass_scores.get(record.exam_id) or 0) else 0
+
+    async def _apply_wrong_book(self, wrong_rows: List[Dict[str, Any]], fixed_rows: List[Dict[str, int]]):
+        """改判为错误的加入错题本；改判为正确的扣减错误次数，扣减到0时移出错题本"""
+        if wrong_rows:
+            from app.services.exam_service import ExamService
+            await ExamService(self.db).upsert_wrong_questions(wrong_rows)
+
+        if fixed_rows:
+            table = WrongQuestion.__table__
+            match = (table.c.user_id == bindparam("b_user")) & (table.c.question_id == bindparam("b_question"))
+            await self.db.execute(update(table).where(match).values(wrong_count=table.c.wrong_count - 1), fixed_rows)
+            await self.db.execute(delete(table).where(match, table.c.wrong_count <= 0), fixed_rows)
+
+
+class RegradeJobs:
+    """
+    重判后台任务管理，进度保存在Redis中，任意worker均可查询
+    执行中的任务定期续期心跳键；任务所在进程重启后心跳键过期，查询时将其标记为失败
+    """
+
+    def __init__(self, redis: RedisClient, chunk_size: int = None, heartbeat_interval: int = None):
+        self.redis = redis
+        self.chunk_size = chunk_size or settings.REGRADE_CHUNK_SIZE
+        self.heartbeat_interval = heartbeat_interval or settings.REGRADE_HEARTBEAT_SECONDS
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"regrade:job:{job_id}"
+
+    @staticmethod
+    def _heartbeat_key(job_id: str) -> str:
+        return f"regrade:heartbeat:{job_id}"
+
+    async def submit(self, scope: str, target_id: int, operator_id: int = None) -> Dict[str, Any]:
+        """创建重判任务并在后台执行"""
+        job = {
+            "job_id": uuid.uuid4().hex[:16],
+            "scope": scope,
+            "target_id": target_id,
+            "operator_id": operator_id,
+            "status": "pending",
+            "processed": 0,
+            "changed": 0,
+            "records": 0,
+            "created_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "error": None,
+        }
+        await self._save(job)
+        await self._beat(job["job_id"])
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job["job_id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job["job_id"], None))
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务进度，心跳已过期的未结束任务标记为失败"""
+        data = await self.redis.get(self._job_key(job_id))
+        if not data:
+            return None
+        job = json.loads(data)
+        if job["status"] in ACTIVE_STATUSES and not await self.redis.exists(self._heartbeat_key(job_id)):
+            job["status"] = "failed"
+            job["error"] = "任务已中断（服务重启或进程退出），请重新提交"
+            job["finished_at"] = datetime.now().isoformat()
+            await self._save(job)
+        return job
+
+    async def _save(self, job: Dict[str, Any]):
+        await self.redis.set(self._job_key(job["job_id"]), json.dumps(job), expire=JOB_TTL)
+
+    async def _beat(self, job_id: str):
+        await self.redis.set(self._heartbeat_key(job_id), "1", expire=self.heartbeat_interval * HEARTBEAT_MISSES)
+
+    async def _heartbeat(self, job_id: str):
+        """任务执行期间定期续期心跳（单块耗时较长时进度不会更新）"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self._beat(job_id)
+            except Exception as e:
+                logger.error(f"重判任务 {job_id} 心跳失败: {e}")
+
+    async def _run(self, job: Dict[str, Any]):
+        job["status"] = "running"
+        await self._save(job)
+        heartbeat = asyncio.create_task(self._heartbeat(job["job_id"]))
+        try:
+            if job["scope"] == SCOPE_EXAM:
+                await self._run_chunks(job, lambda db, cursor: RegradeService(db).regrade_exam_chunk(
+                    job["target_id"], cursor
+                ))
+            else:
+                question_ids = await self._call(
+                    lambda db: RegradeService(db).get_scope_question_ids(job["scope"], job["target_id"])
+                )
+                for question_id in question_ids:
+                    await self._run_chunks(job, lambda db, cursor, q_id=question_id: RegradeService(db).regrade_question_chunk(
+                        q_id, cursor, self.chunk_size
+                    ))
+            job["status"] = "completed"
+        except Exception as e:
+            logger.error(f"重判任务 {job['job_id']} 失败: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            heartbeat.cancel()
+        job["finished_at"] = datetime.now().isoformat()
+        await self._save(job)
+        await self.redis.delete(self._heartbeat_key(job["job_id"]))
+
+    async def _run_chunks(self, job: Dict[str, Any], process):
+        """逐块处理直到游标耗尽，每块完成后更新进度"""
+        cursor = 0
+        while cursor is not None:
+            cursor, stats = await self._call(lambda db: process(db, cursor))
+            for key, value in stats.items():
+                job[key] += value
+            await self._save(job)
+
+    @staticmethod
+    async def _call(func):
+        """每块使用独立会话，会话关闭时回滚未提交的事务"""
+        async with AsyncSessionLocal() as db:
+            return await func(db)
+
+
+# 全局重判任务管理实例
+regrade_jobs = RegradeJobs(redis_client)
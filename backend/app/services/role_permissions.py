@@ -0,0 +1,86 @@
+"""
+楚然智考系统 - 角色权限快照
+一次联表查询加载全部 角色编码 -> 权限编码集合，按版本号缓存在进程内。
+签发令牌、/auth/me、加载登录主体时只需查询用户及其角色编码，权限从快照合并；
+角色增删改后递增Redis中的版本号，其他worker收到 "role" 相关失效事件后在下次使用时比对版本重新加载，
+检查间隔只是总线消息丢失时的兜底
+"""
+import asyncio
+import time
+from typing import Dict, FrozenSet, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.user import Role, Permission, RolePermission
+from app.redis_client import redis_client, RedisClient
+from app.services.cache_bus import cache_bus
+
+EMPTY: FrozenSet[str] = frozenset()
+
+
+class RolePermissionSnapshot:
+    """角色权限快照"""
+
+    VERSION_KEY = "role_perms:ver"
+
+    def __init__(self, redis: RedisClient, check_interval: int = None):
+        self.redis = redis
+        self.check_interval = check_interval or settings.ROLE_PERMISSION_CHECK_INTERVAL
+        self.version: Optional[int] = None  # 未加载时为 None
+        self._roles: Dict[str, FrozenSet[str]] = {}
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def permissions_for(self, db: AsyncSession, role_codes: Iterable[str]) -> FrozenSet[str]:
+        """合并多个角色的权限编码"""
+        roles = await self.get(db)
+        return EMPTY.union(*(roles.get(code, EMPTY) for code in role_codes))
+
+    async def get(self, db: AsyncSession) -> Dict[str, FrozenSet[str]]:
+        """获取快照，超过检查间隔时比对版本号，版本变化则重新加载"""
+        if self.version is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return self._roles
+
+        async with self._lock:
+            if self.version is None or time.monotonic() - self._checked_at >= self.check_interval:
+                version = int(await self.redis.get(self.VERSION_KEY) or 0)
+                if version != self.version:
+                    await self._load(db, version)
+                self._checked_at = time.monotonic()
+        return self._roles
+
+    async def invalidate(self, db: AsyncSession, role_id: int = None):
+        """角色或角色权限变化后递增版本号、通知其他worker并立即重建（提交事务后调用）"""
+        version = await self.redis.incr(self.VERSION_KEY)
+        await cache_bus.publish(f"role:{role_id}" if role_id else "role:*")
+        async with self._lock:
+            await self._load(db, version)
+            self._checked_at = time.monotonic()
+
+    def _on_invalidate(self, event: str):
+        """总线回调：角色变化后下次使用时立即比对版本号"""
+        if event.partition(":")[0] in ("role", "*"):
+            self._checked_at = 0.0
+
+    async def _load(self, db: AsyncSession, version: int):
+        rows = (await db.execute(
+            select(Role.code, Permission.code)
+            .outerjoin(RolePermission, RolePermission.role_id == Role.id)
+            .outerjoin(Permission, Permission.id == RolePermission.permission_id)
+        )).all()
+
+        roles: Dict[str, set] = {}
+        for role_code, perm_code in rows:
+            codes = roles.setdefault(role_code, set())
+            if perm_code:
+                codes.add(perm_code)
+
+        self._roles = {code: frozenset(perms) for code, perms in roles.items()}
+        self.version = version
+
+
+# 全局角色权限快照实例
+role_permissions = RolePermissionSnapshot(redis_client)
+cache_bus.subscribe(role_permissions._on_invalidate)
@@ -0,0 +1,182 @@
+"""
+楚然智考系统 - 任务执行器
+CPU密集任务（文档解析、OCR、验证码渲染、批量判分）放入进程池，阻塞IO（同步数据库会话、文件读写）放入线程池，
+不在事件循环中执行，导入大文件时其他接口的响应时间不受影响。
+两类池都限制排队任务数，排满直接拒绝；单个任务超时后调用方立即返回，同时统计运行指标
+"""
+import asyncio
+import functools
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+from app.config import settings
+
+
+class ExecutorBusyError(Exception):
+    """执行器排队任务已满"""
+
+
+class ExecutorTimeoutError(Exception):
+    """任务执行超时"""
+
+
+class BoundedPool:
+    """
+    有界执行池
+    同时提交的任务数不超过 workers + queue_size，超出时抛出 ExecutorBusyError；
+    超时的任务在排队中则取消，已开始执行的会继续占用名额直到执行完毕
+    """
+
+    def __init__(self, name: str, workers: int, queue_size: int, timeout: float, processes: bool = False):
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.processes = processes
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0,
+        }
+
+    def _ensure_executor(self) -> Executor:
+        if self._executor is None:
+            if self.processes:
+                # spawn 启动：不继承父进程的事件循环、数据库连接和锁
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix=f"executor-{self.name}"
+                )
+        return self._executor
+
+    def _on_done(self, loop: asyncio.AbstractEventLoop, started: float, future):
+        # 在执行线程中回调，计数回到事件循环线程更新
+        try:
+            loop.call_soon_threadsafe(self._release, started, future)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    def _release(self, started: float, future):
+        self._pending -= 1
+        elapsed = time.perf_counter() - started
+        self._stats["total_seconds"] += elapsed
+        self._stats["max_seconds"] = max(self._stats["max_seconds"], elapsed)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self._stats["failed"] += 1
+        else:
+            self._stats["completed"] += 1
+
+    async def run(self, func: Callable, *args, timeout: float = None, **kwargs) -> Any:
+        """
+        提交任务并等待结果
+        timeout: 覆盖默认超时(秒)，0 表示不限
+        """
+        if self._pending >= self.workers + self.queue_size:
+            self._stats["rejected"] += 1
+            raise ExecutorBusyError(f"{self.name} 执行队列已满，请稍后重试")
+
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        try:
+            future = self._ensure_executor().submit(call)
+        except BrokenProcessPool:
+            # 子进程异常退出后进程池不可用，重建后重试一次
+            logger.error(f"{self.name} 进程池已损坏，重新创建")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            future = self._ensure_executor().submit(call)
+
+        self._pending += 1
+        self._stats["submitted"] += 1
+        started = time.perf_counter()
+        future.add_done_callback(functools.partial(self._on_done, loop, started))
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or None)
+        except asyncio.TimeoutError:
+            future.cancel()
+            self._stats["timeouts"] += 1
+            raise ExecutorTimeoutError(f"{self.name} 任务执行超时({timeout}秒)")
+
+    def stats(self) -> Dict[str, Any]:
+        completed = self._stats["completed"] + self._stats["failed"]
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self._pending,
+            **self._stats,
+            "avg_seconds": round(self._stats["total_seconds"] / completed, 4) if completed else 0.0,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class TaskExecutor:
+    """进程池（cpu）+ 线程池（io）"""
+
+    def __init__(self):
+        self.cpu = BoundedPool(
+            "cpu", settings.EXECUTOR_CPU_WORKERS, settings.EXECUTOR_CPU_QUEUE,
+            settings.EXECUTOR_CPU_TIMEOUT, processes=True
+        )
+        self.io = BoundedPool(
+            "io", settings.EXECUTOR_IO_WORKERS, settings.EXECUTOR_IO_QUEUE,
+            settings.EXECUTOR_IO_TIMEOUT
+        )
+
+    async def run_cpu(self, func: Callable, *args, timeout: float = None, **kwargs) -> Any:
+        """
+        在进程池中执行CPU密集任务
+        func 及参数、返回值需可被pickle（模块级函数、普通数据对象）
+        """
+        return await self.cpu.run(func, *args, timeout=timeout, **kwargs)
+
+    async def run_io(self, func: Callable, *args, timeout: float = None, **kwargs) -> Any:
+        """在线程池中执行阻塞IO任务"""
+        return await self.io.run(func, *args, timeout=timeout, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cpu": self.cpu.stats(), "io": self.io.stats()}
+
+    def shutdown(self):
+        self.cpu.shutdown()
+        self.io.shutdown()
+
+
+# 全局任务执行器实例
+task_executor = TaskExecutor()
+
+
+def offload(timeout: float = None):
+    """
+    装饰器：同步函数改为在线程池中执行，调用方 await 结果
+    进程池任务需要可pickle的原函数，请直接使用 task_executor.run_cpu
+    """
+    def decorator(func: Callable):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await task_executor.run_io(func, *args, timeout=timeout, **kwargs)
+        return wrapper
+    return decorator
@@ -3,51 +3,67 @@
 处理用户CRUD、角色管理等功能
 """
 from typing import Optional, List, Tuple
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import select, func, delete, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from app.models.user import User, Role, Permission, UserRole, RolePermission
 from app.schemas.user import UserCreate, UserUpdate, RoleCreate, RoleUpdate
-from app.services.auth_service import AuthService
+from app.services.auth_service import AuthService, USER_ROLES_LOADER, USER_ROLES_ONLY_LOADER
+from app.services.principal_cache import principal_cache
+from app.services.role_permissions import role_permissions
+from app.services.query_cache import query_cache
+from app.services.pagination import Page, PageParams, paginate
 
 
 class UserService:
     """用户服务类"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
     
     # ==================== 用户管理 ====================
     
-    def get_user_by_id(self, user_id: int) -> Optional[User]:
-        """根据ID获取用户"""
-        return self.db.query(User).filter(User.id == user_id).first()
+    async def get_user_by_id(self, user_id: int, refresh: bool = False) -> Optional[User]:
+        """
+        根据ID获取用户（含角色及权限）
+        refresh: 写入后重新加载，覆盖会话中已加载的旧数据
+        """
+        query = select(User).options(USER_ROLES_LOADER).where(User.id == user_id)
+        if refresh:
+            query = query.execution_options(populate_existing=True)
+        return await self.db.scalar(query)
+    
+    async def get_user_with_roles(self, user_id: int) -> Optional[User]:
+        """根据ID获取用户（只含角色，与用户同一条SQL查出）"""
+        return (await self.db.scalars(
+            select(User).options(USER_ROLES_ONLY_LOADER).where(User.id == user_id)
+        )).unique().first()
     
-    def get_user_by_username(self, username: str) -> Optional[User]:
+    async def get_user_by_username(self, username: str) -> Optional[User]:
         """根据用户名获取用户"""
-        return self.db.query(User).filter(User.username == username).first()
+        return await self.db.scalar(select(User).options(USER_ROLES_LOADER).where(User.username == username))
     
-    def get_user_by_phone(self, phone: str) -> Optional[User]:
+    async def get_user_by_phone(self, phone: str) -> Optional[User]:
         """根据手机号获取用户"""
-        return self.db.query(User).filter(User.phone == phone).first()
+        return await self.db.scalar(select(User).options(USER_ROLES_LOADER).where(User.phone == phone))
     
-    def get_users(
+    async def get_users(
         self, 
-        skip: int = 0, 
-        limit: int = 20,
+        page: PageParams = None,
         keyword: str = None,
         role_id: int = None,
         is_active: bool = None
-    ) -> Tuple[List[User], int]:
+    ) -> Page:
         """
         获取用户列表
-        返回: (用户列表, 总数)
+        返回: 分页结果（按 id 正序）
         """
-        query = self.db.query(User)
+        query = select(User)
         
         # 关键词搜索
         if keyword:
-            query = query.filter(
+            query = query.where(
                 or_(
                     User.username.contains(keyword),
                     User.real_name.contains(keyword),
@@ -57,18 +73,22 @@ class UserService:
         
         # 角色筛选
         if role_id:
-            query = query.join(UserRole).filter(UserRole.role_id == role_id)
+            query = query.join(UserRole).where(UserRole.role_id == role_id)
         
         # 状态筛选
         if is_active is not None:
-            query = query.filter(User.is_active == is_active)
-        
-        total = query.count()
-        users = query.offset(skip).limit(limit).all()
-        
-        return users, total
+            query = query.where(User.is_active == is_active)
+        
+        return await paginate(
+            self.db,
+            query.options(USER_ROLES_LOADER),
+            [(User.id, False)],
+            page or PageParams(),
+            count_tags=("user_list",),
+            table=User.__tablename__
+        )
     
-    def create_user(self, user_data: UserCreate) -> User:
+    async def create_user(self, user_data: UserCreate) -> User:
         """创建用户"""
         # 加密密码
         hashed_password = AuthService.hash_password(user_data.password)
@@ -84,7 +104,7 @@ class UserService:
         )
         
         self.db.add(user)
-        self.db.flush()
+        await self.db.flush()
         
         # 分配角色
         if user_data.role_ids:
@@ -93,19 +113,19 @@ class UserService:
                 self.db.add(user_role)
         else:
             # 默认分配学员角色
-            student_role = self.db.query(Role).filter(Role.code == "student").first()
+            student_role = await self.db.scalar(select(Role).where(Role.code == "student"))
             if student_role:
                 user_role = UserRole(user_id=user.id, role_id=student_role.id)
                 self.db.add(user_role)
         
-        self.db.commit()
-        self.db.refresh(user)
+        await self.db.commit()
+        await query_cache.invalidate_tags("user_list")
         
-        return user
+        return await self.get_user_by_id(user.id, refresh=True)
     
-    def update_user(self, user_id: int, user_data: UserUpdate) -> Optional[User]:
+    async def update_user(self, user_id: int, user_data: UserUpdate) -> Optional[User]:
         """更新用户"""
-        user = self.get_user_by_id(user_id)
+        user = await self.get_user_by_id(user_id)
         if not user:
             return None
         
@@ -113,25 +133,28 @@ class UserService:
         for field, value in update_data.items():
             setattr(user, field, value)
         
-        self.db.commit()
-        self.db.refresh(user)
+        await self.db.commit()
+        await principal_cache.invalidate(user_id)
+        await query_cache.invalidate_tags("user_list")
         
-        return user
+        return await self.get_user_by_id(user_id, refresh=True)
     
-    def delete_user(self, user_id: int) -> bool:
+    async def delete_user(self, user_id: int) -> bool:
         """删除用户"""
-        user = self.get_user_by_id(user_id)
+        user = await self.get_user_by_id(user_id)
         if not user:
             return False
         
-        self.db.delete(user)
-        self.db.commit()
+        await self.db.delete(user)
+        await self.db.commit()
+        await principal_cache.invalidate(user_id)
+        await query_cache.invalidate_tags("user_list")
         
         return True
     
-    def change_password(self, user_id: int, old_password: str, new_password: str) -> Tuple[bool, str]:
+    async def change_password(self, user_id: int, old_password: str, new_password: str) -> Tuple[bool, str]:
         """修改密码"""
-        user = self.get_user_by_id(user_id)
+        user = await self.get_user_by_id(user_id)
         if not user:
             return False, "用户不存在"
         
@@ -139,53 +162,65 @@ class UserService:
             return False, "原密码错误"
         
         user.hashed_password = AuthService.hash_password(new_password)
-        self.db.commit()
+        await self.db.commit()
         
         return True, "密码修改成功"
     
-    def reset_password(self, phone: str, new_password: str) -> Tuple[bool, str]:
+    async def reset_password(self, phone: str, new_password: str) -> Tuple[bool, str]:
         """重置密码"""
-        user = self.get_user_by_phone(phone)
+        user = await self.get_user_by_phone(phone)
         if not user:
             return False, "用户不存在"
         
         user.hashed_password = AuthService.hash_password(new_password)
-        self.db.commit()
+        # 找回密码后之前签发的令牌全部失效
+        user.token_version = (user.token_version or 0) + 1
+        await self.db.commit()
+        await principal_cache.invalidate(user.id)
         
         return True, "密码重置成功"
     
-    def assign_roles(self, user_id: int, role_ids: List[int]) -> bool:
+    async def assign_roles(self, user_id: int, role_ids: List[int]) -> bool:
         """分配角色"""
-        user = self.get_user_by_id(user_id)
+        user = await self.get_user_by_id(user_id)
         if not user:
             return False
         
         # 删除现有角色
-        self.db.query(UserRole).filter(UserRole.user_id == user_id).delete()
+        await self.db.execute(delete(UserRole).where(UserRole.user_id == user_id))
         
         # 添加新角色
         for role_id in role_ids:
             user_role = UserRole(user_id=user_id, role_id=role_id)
             self.db.add(user_role)
         
-        self.db.commit()
+        await self.db.commit()
+        await principal_cache.invalidate(user_id)
+        await query_cache.invalidate_tags("user_list")
         
         return True
     
     # ==================== 角色管理 ====================
     
-    def get_role_by_id(self, role_id: int) -> Optional[Role]:
-        """根据ID获取角色"""
-        return self.db.query(Role).filter(Role.id == role_id).first()
+    async def get_role_by_id(self, role_id: int, refresh: bool = False) -> Optional[Role]:
+        """
+        根据ID获取角色（含权限）
+        refresh: 写入后重新加载，覆盖会话中已加载的旧数据
+        """
+        query = select(Role).options(selectinload(Role.permissions)).where(Role.id == role_id)
+        if refresh:
+            query = query.execution_options(populate_existing=True)
+        return await self.db.scalar(query)
     
-    def get_roles(self, skip: int = 0, limit: int = 100) -> Tuple[List[Role], int]:
+    async def get_roles(self, skip: int = 0, limit: int = 100) -> Tuple[List[Role], int]:
         """获取角色列表"""
-        query = self.db.query(Role)
-        total = query.count()
-        roles = query.offset(skip).limit(limit).all()
-        return roles, total
+        total = await self.db.scalar(select(func.count(Role.id)))
+        roles = (await self.db.scalars(
+            select(Role).options(selectinload(Role.permissions)).offset(skip).limit(limit)
+        )).all()
+        return list(roles), total
     
-    def create_role(self, role_data: RoleCreate) -> Role:
+    async def create_role(self, role_data: RoleCreate) -> Role:
         """创建角色"""
         role = Role(
             name=role_data.name,
@@ -194,7 +229,7 @@ class UserService:
         )
         
         self.db.add(role)
-        self.db.flush()
+        await self.db.flush()
         
         # 分配权限
         if role_data.permission_ids:
@@ -202,14 +237,14 @@ class UserService:
                 role_perm = RolePermission(role_id=role.id, permission_id=perm_id)
                 self.db.add(role_perm)
         
-        self.db.commit()
-        self.db.refresh(role)
+        await self.db.commit()
+        await role_permissions.invalidate(self.db, role.id)
         
-        return role
+        return await self.get_role_by_id(role.id, refresh=True)
     
-    def update_role(self, role_id: int, role_data: RoleUpdate) -> Optional[Role]:
+    async def update_role(self, role_id: int, role_data: RoleUpdate) -> Optional[Role]:
         """更新角色"""
-        role = self.get_role_by_id(role_id)
+        role = await self.get_role_by_id(role_id)
         if not role:
             return None
         
@@ -219,43 +254,38 @@ class UserService:
         
         # 更新权限
         if role_data.permission_ids is not None:
-            self.db.query(RolePermission).filter(RolePermission.role_id == role_id).delete()
+            await self.db.execute(delete(RolePermission).where(RolePermission.role_id == role_id))
             for perm_id in role_data.permission_ids:
                 role_perm = RolePermission(role_id=role_id, permission_id=perm_id)
                 self.db.add(role_perm)
         
-        self.db.commit()
-        self.db.refresh(role)
+        await self.db.commit()
+        await role_permissions.invalidate(self.db, role_id)
         
-        return role
+        return await self.get_role_by_id(role_id, refresh=True)
     
-    def delete_role(self, role_id: int) -> bool:
+    async def delete_role(self, role_id: int) -> bool:
         """删除角色"""
-        role = self.get_role_by_id(role_id)
+        role = await self.get_role_by_id(role_id)
         if not role:
             return False
         
-        self.db.delete(role)
-        self.db.commit()
+        await self.db.delete(role)
+        await self.db.commit()
+        await role_permissions.invalidate(self.db, role_id)
         
         return True
     
     # ==================== 权限管理 ====================
     
-    def get_permissions(self) -> List[Permission]:
+    async def get_permissions(self) -> List[Permission]:
         """获取所有权限"""
-        return self.db.query(Permission).all()
+        return list((await self.db.scalars(select(Permission))).all())
     
-    def get_user_permissions(self, user_id: int) -> List[str]:
+    async def get_user_permissions(self, user_id: int) -> List[str]:
         """获取用户所有权限编码"""
-        user = self.get_user_by_id(user_id)
-        if not user:
-            return []
-        
-        permissions = []
-        for role in user.roles:
-            for perm in role.permissions:
-                if perm.code not in permissions:
-                    permissions.append(perm.code)
+        role_codes = (await self.db.scalars(
+            select(Role.code).join(UserRole, UserRole.role_id == Role.id).where(UserRole.user_id == user_id)
+        )).all()
         
-        return permissions
+        return sorted(await role_permissions.permissions_for(self.db, role_codes))
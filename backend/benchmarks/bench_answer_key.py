@@ -0,0 +1,120 @@
+"""
+楚然智考系统 - 判分微基准
+对比 ExamService.grade_answer 逐题判分与 AnswerKey 编译答案键判分的单题耗时，
+并用随机答案校验两者结果完全一致
+
+运行: cd backend && python benchmarks/bench_answer_key.py [--questions 100] [--submissions 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.models.question import Question, QuestionType
+from app.services.answer_key import AnswerKey
+from app.services.exam_service import ExamService
+
+LETTERS = "ABCDEF"
+BLANK_ANSWERS = ["北京|beijing", "1949年10月1日", "光合作用", "H2O|水", "牛顿第二定律"]
+
+
+def build_questions(count: int):
+    """构造各题型均匀分布的题目（不入库）"""
+    types = [
+        QuestionType.SINGLE_CHOICE, QuestionType.MULTIPLE_CHOICE,
+        QuestionType.TRUE_FALSE, QuestionType.FILL_BLANK, QuestionType.SHORT_ANSWER,
+    ]
+    questions = []
+    for i in range(count):
+        q_type = types[i % len(types)]
+        if q_type == QuestionType.SINGLE_CHOICE:
+            answer = random.choice(LETTERS[:4])
+        elif q_type == QuestionType.MULTIPLE_CHOICE:
+            answer = ",".join(sorted(random.sample(LETTERS, random.randint(2, 4))))
+        elif q_type == QuestionType.TRUE_FALSE:
+            answer = random.choice(["对", "错"])
+        elif q_type == QuestionType.FILL_BLANK:
+            answer = random.choice(BLANK_ANSWERS)
+        else:
+            answer = "参考答案"
+        questions.append(Question(id=i + 1, question_type=q_type, answer=answer, score=random.choice([1, 2, 5])))
+    return questions
+
+
+def random_answer(question: Question) -> str:
+    """生成随机作答：正确、部分正确、错误、空答案及带符号变体"""
+    roll = random.random()
+    if roll < 0.05:
+        return ""
+    if question.question_type == QuestionType.MULTIPLE_CHOICE:
+        letters = random.sample(LETTERS, random.randint(1, 4))
+        sep = random.choice(["", ",", " ", "，"])
+        text = sep.join(letters)
+        return text.lower() if random.random() < 0.2 else text
+    if question.question_type == QuestionType.FILL_BLANK:
+        alt = random.choice(question.answer.split("|"))
+        return random.choice([alt, f" {alt.upper()}。", alt.replace("", " ").strip(), "错误答案"])
+    if question.question_type in (QuestionType.SINGLE_CHOICE, QuestionType.TRUE_FALSE):
+        pool = list(LETTERS[:4]) if question.question_type == QuestionType.SINGLE_CHOICE else ["对", "错"]
+        return random.choice(pool + [f" {question.answer.lower()} "])
+    return "作答内容"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="判分微基准")
+    parser.add_argument("--questions", type=int, default=100, help="每份试卷题数")
+    parser.add_argument("--submissions", type=int, default=2000, help="答卷份数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    questions = build_questions(args.questions)
+    question_map = {q.id: q for q in questions}
+    scores = {q.id: q.score for q in questions}
+    submissions = [
+        [{"question_id": q.id, "answer": random_answer(q)} for q in questions]
+        for _ in range(args.submissions)
+    ]
+    total_answers = args.questions * args.submissions
+
+    # 逐题判分（原实现）
+    service = ExamService(db=None)
+    start = time.perf_counter()
+    baseline = [
+        [
+            (a["question_id"], a["answer"]) + service.grade_answer(
+                question_map[a["question_id"]], a["answer"], scores[a["question_id"]]
+            )
+            for a in answers
+        ]
+        for answers in submissions
+    ]
+    baseline_seconds = time.perf_counter() - start
+
+    # 编译答案键 + 批量判分
+    start = time.perf_counter()
+    answer_key = AnswerKey.compile(questions, scores)
+    compile_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    compiled = answer_key.grade_batch(submissions)
+    compiled_seconds = time.perf_counter() - start
+
+    mismatches = sum(
+        1 for base_rows, rows in zip(baseline, compiled)
+        for base, row in zip(base_rows, rows) if base != row
+    )
+
+    print(f"答卷 {args.submissions} 份 x {args.questions} 题 = {total_answers} 个作答")
+    print(f"grade_answer 逐题判分: {baseline_seconds * 1e9 / total_answers:8.0f} ns/题")
+    print(f"AnswerKey 批量判分:    {compiled_seconds * 1e9 / total_answers:8.0f} ns/题"
+          f"（编译 {compile_seconds * 1e6:.0f} us）")
+    print(f"加速比: {baseline_seconds / compiled_seconds:.1f}x")
+    print(f"结果不一致: {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
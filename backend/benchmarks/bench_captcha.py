@@ -0,0 +1,117 @@
+"""
+楚然智考系统 - 验证码生成压测
+对比三种实现的单进程吞吐量(ops/s)：
+  legacy  逐像素 draw.rectangle 绘制大图后整图缩放（原实现，作为基准）
+  render  预栅格化字形 + NumPy 整块写入调色板图像（后台批量生成、池取空时的单张耗时）
+  pool    从预填充的验证码池弹出（获取验证码接口的实际路径）
+目标: pool 相对 legacy 至少 10 倍（仅在验证码池使用 Redis 时判断）
+
+运行: cd backend && python benchmarks/bench_captcha.py [--count 2000]
+      （需配置可用的 REDIS_URL；未连上 Redis 时验证码池使用内存缓存，结果不含网络往返，
+       只作进程内参考，不输出是否达标）
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import random
+import sys
+import time
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.redis_client import redis_client
+from app.services.captcha import DIGIT_PATTERNS, POOL_KEY, CaptchaPool, generate_captchas, new_captcha
+
+TARGET_SPEEDUP = 10
+
+
+def legacy_captcha():
+    """原实现：160x60 大图逐块绘制后缩放到 120x40"""
+    code = ''.join(random.choices("0123456789", k=4))
+    width, height = 160, 60
+    bg_color = (random.randint(245, 255), random.randint(245, 255), random.randint(245, 255))
+    image = Image.new('RGB', (width, height), color=bg_color)
+    draw = ImageDraw.Draw(image)
+
+    for _ in range(2):
+        x1, y1 = random.randint(0, width), random.randint(0, height)
+        x2, y2 = random.randint(0, width), random.randint(0, height)
+        draw.line([(x1, y1), (x2, y2)], fill=(200, 200, 200), width=1)
+
+    for i, char in enumerate(code):
+        x_offset = 10 + i * 38
+        y_offset = random.randint(5, 15)
+        color = (random.randint(20, 80), random.randint(20, 80), random.randint(20, 80))
+        for row_idx, row in enumerate(DIGIT_PATTERNS[char]):
+            for col_idx, pixel in enumerate(row):
+                if pixel == '#':
+                    px = x_offset + col_idx * 3
+                    py = y_offset + row_idx * 4
+                    draw.rectangle([px, py, px + 2, py + 3], fill=color)
+
+    image = image.resize((120, 40), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return code, base64.b64encode(buffer.getvalue()).decode()
+
+
+def bench_sync(func, count: int) -> float:
+    func()  # 预热
+    begin = time.perf_counter()
+    for _ in range(count):
+        func()
+    return count / (time.perf_counter() - begin)
+
+
+async def bench_pool(count: int):
+    """返回 (ops/s, 验证码池实际使用的存储 redis/memory)"""
+    await redis_client.connect()
+    backend = "memory" if redis_client.using_memory else "redis"
+    pool = CaptchaPool(redis_client, size=count)
+    await redis_client.delete(POOL_KEY)
+    # 直接在当前进程填充，不计入弹出耗时
+    for start in range(0, count, 500):
+        batch = generate_captchas(min(500, count - start))
+        await redis_client.lpush(POOL_KEY, *[f"{code}:{image}" for code, image in batch])
+
+    begin = time.perf_counter()
+    for _ in range(count):
+        await pool.pop()
+    elapsed = time.perf_counter() - begin
+    # 压测过程中断开降级时，结果同样不能代表 Redis
+    if redis_client.using_memory:
+        backend = "memory"
+    await redis_client.delete(POOL_KEY)
+    await redis_client.disconnect()
+    return count / elapsed, backend
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=2000, help="每种实现生成的数量")
+    args = parser.parse_args()
+
+    legacy = bench_sync(legacy_captcha, args.count)
+    render = bench_sync(new_captcha, args.count)
+    pool, backend = asyncio.run(bench_pool(args.count))
+
+    print(f"生成 {args.count} 张验证码，验证码池存储: {backend}")
+    for name, ops in (("legacy", legacy), ("render", render), ("pool", pool)):
+        speedup = ops / legacy
+        mark = ""
+        if name == "pool":
+            if backend == "redis":
+                mark = "  达标" if speedup >= TARGET_SPEEDUP else "  未达标"
+            else:
+                mark = "  (内存缓存，仅进程内参考)"
+        print(f"  {name:<7}{ops:10.0f} ops/s  {speedup:6.1f}x{mark}")
+    if backend != "redis":
+        print("未使用 Redis，pool 结果不含网络往返，不作达标判断；请配置 REDIS_URL 后重新运行")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+楚然智考系统 - 题目检索基准
+在 20 万题规模的语料上对比原 LIKE '%关键词%' 检索与全文索引检索（MATCH ... AGAINST，ngram 分词）
+的单次查询延迟，覆盖 无筛选 / 题库 / 题库+题型 / 题库+题型+难度 四种组合，每次查询含总数与首页20条
+
+准备: 已执行 db_migration_question_fulltext.sql 的 MySQL 库（DATABASE_URL）；
+      语料由脚本直接写库（bench_search 题库，可重复执行，已有的题目不重复写入）
+运行: cd backend && python benchmarks/bench_question_search.py [--count 200000] [--queries 50]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+from sqlalchemy import select, func, insert
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.database import engine, SessionLocal, AsyncSessionLocal
+from app.models.question import Question, QuestionBank, QuestionType, DifficultyLevel
+from app.services.pagination import PageParams
+from app.services.question_service import QuestionService
+
+BANK_NAME = "bench_search"
+BATCH_SIZE = 2000
+
+TERMS = [
+    "光合作用", "叶绿体", "细胞膜", "线粒体", "染色体", "遗传信息", "生态系统", "食物链",
+    "牛顿第二定律", "加速度", "电磁感应", "欧姆定律", "动能定理", "万有引力", "折射率", "电阻",
+    "化学反应", "氧化还原", "化学平衡", "电解质", "有机物", "催化剂", "物质的量", "元素周期表",
+    "函数", "导数", "数列", "三角函数", "概率", "向量", "不等式", "立体几何",
+    "改革开放", "工业革命", "文艺复兴", "丝绸之路", "辛亥革命", "社会主义", "市场经济", "宪法",
+    "安全生产", "操作规程", "应急预案", "消防设施", "劳动保护", "职业健康", "隐患排查", "事故报告",
+]
+FILLER = "下列关于的说法正确错误是哪一项以下描述中不属于根据材料分析判断选择"
+TYPES = [QuestionType.SINGLE_CHOICE, QuestionType.MULTIPLE_CHOICE, QuestionType.TRUE_FALSE, QuestionType.FILL_BLANK]
+DIFFICULTIES = [DifficultyLevel.EASY, DifficultyLevel.MEDIUM, DifficultyLevel.HARD]
+
+
+def sentence(terms: int) -> str:
+    parts = []
+    for _ in range(terms):
+        parts.append("".join(random.sample(FILLER, random.randint(2, 6))))
+        parts.append(random.choice(TERMS))
+    return "".join(parts) + "。"
+
+
+def build_row(bank_id: int) -> dict:
+    q_type = random.choice(TYPES)
+    options = None
+    if q_type in (QuestionType.SINGLE_CHOICE, QuestionType.MULTIPLE_CHOICE):
+        options = "{" + ", ".join(f'"{k}": "{sentence(1)}"' for k in "ABCD") + "}"
+    return {
+        "bank_id": bank_id,
+        "question_type": q_type,
+        "title": sentence(random.randint(1, 3)),
+        "options": options,
+        "answer": "A",
+        "analysis": sentence(random.randint(1, 2)),
+        "difficulty": random.choice(DIFFICULTIES),
+        "score": 1,
+        "is_active": 1,
+    }
+
+
+def prepare_corpus(count: int) -> int:
+    """写入（或补足）基准语料，返回题库ID"""
+    db = SessionLocal()
+    try:
+        bank = db.query(QuestionBank).filter(QuestionBank.name == BANK_NAME).first()
+        if not bank:
+            bank = QuestionBank(name=BANK_NAME, description="题目检索基准语料")
+            db.add(bank)
+            db.commit()
+        existing = db.scalar(select(func.count(Question.id)).where(Question.bank_id == bank.id))
+        missing = count - existing
+        if missing > 0:
+            print(f"写入语料 {missing} 题 ...")
+            begin = time.perf_counter()
+            for start in range(0, missing, BATCH_SIZE):
+                rows = [build_row(bank.id) for _ in range(min(BATCH_SIZE, missing - start))]
+                db.execute(insert(Question), rows)
+                db.commit()
+            print(f"写入完成，耗时 {time.perf_counter() - begin:.1f}s")
+        return bank.id
+    finally:
+        db.close()
+
+
+async def like_search(db, keyword: str, filters: dict):
+    """原实现：题干 LIKE '%关键词%'，总数 + 按 id 倒序首页"""
+    query = select(Question).where(Question.title.contains(keyword))
+    for column, value in filters.items():
+        query = query.where(getattr(Question, column) == value)
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    items = (await db.scalars(query.order_by(Question.id.desc()).limit(20))).all()
+    return total, items
+
+
+async def fulltext_search(db, keyword: str, filters: dict):
+    """现实现：QuestionService.get_questions（全文索引，按相关度排序）"""
+    page = await QuestionService(db).get_questions(page=PageParams(limit=20), keyword=keyword, **filters)
+    return page.total, page.items
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run(bank_id: int, queries: int):
+    combos = {
+        "无筛选": {},
+        "题库": {"bank_id": bank_id},
+        "题库+题型": {"bank_id": bank_id, "question_type": QuestionType.SINGLE_CHOICE.value},
+        "题库+题型+难度": {
+            "bank_id": bank_id,
+            "question_type": QuestionType.SINGLE_CHOICE.value,
+            "difficulty": DifficultyLevel.MEDIUM.value,
+        },
+    }
+    keywords = [random.choice(TERMS) for _ in range(queries)]
+    latencies = defaultdict(list)
+    hits = defaultdict(list)
+
+    async with AsyncSessionLocal() as db:
+        for combo, filters in combos.items():
+            for name, search in (("LIKE", like_search), ("FULLTEXT", fulltext_search)):
+                await search(db, keywords[0], filters)  # 预热
+                for keyword in keywords:
+                    begin = time.perf_counter()
+                    total, _ = await search(db, keyword, filters)
+                    latencies[(combo, name)].append(time.perf_counter() - begin)
+                    hits[(combo, name)].append(total)
+
+    print(f"{'筛选':<14}{'方式':<10}{'p50':>10}{'p99':>10}{'平均命中':>10}")
+    for combo in combos:
+        for name in ("LIKE", "FULLTEXT"):
+            values = latencies[(combo, name)]
+            print(
+                f"{combo:<14}{name:<10}{statistics.median(values) * 1000:8.1f}ms{percentile(values, 0.99) * 1000:8.1f}ms"
+                f"{statistics.mean(hits[(combo, name)]):10.0f}"
+            )
+    print("注: LIKE 只匹配题干，FULLTEXT 同时匹配题干、选项和解析，命中数不要求一致")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="题目检索基准")
+    parser.add_argument("--count", type=int, default=200000, help="语料题目数")
+    parser.add_argument("--queries", type=int, default=50, help="每种组合的查询次数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if engine.dialect.name != "mysql":
+        print(f"需要 MySQL 数据库，当前为 {engine.dialect.name}")
+        sys.exit(2)
+
+    random.seed(args.seed)
+    bank_id = prepare_corpus(args.count)
+    asyncio.run(run(bank_id, args.queries))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+楚然智考系统 - 开考/交卷压测
+多个考生并发循环执行 开始考试 -> 交卷，统计吞吐量(rps)与各接口 p50/p99 延迟，
+用于对比同步会话与异步会话两种实现（分别启动两版服务，用相同参数各跑一次）
+
+准备: 已发布、不限尝试次数的考试；压测账号由脚本直接写库创建（bench_ 前缀，可重复执行）
+运行: cd backend && python benchmarks/bench_start_submit.py --base-url http://127.0.0.1:8000 \
+          --exam-id 1 [--users 50] [--rounds 10] [--label async]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+from sqlalchemy import select
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.database import SessionLocal, AsyncSessionLocal
+from app.models.user import User, Role, UserRole
+from app.services.auth_service import AuthService, USER_ROLES_ONLY_LOADER
+
+API = "/api/v1/exams"
+
+
+def prepare_users(count: int):
+    """创建（或复用）学员角色的压测账号"""
+    db = SessionLocal()
+    try:
+        student = db.query(Role).filter(Role.code == "student").first()
+        user_ids = []
+        for i in range(count):
+            username = f"bench_{i:04d}"
+            user = db.query(User).filter(User.username == username).first()
+            if not user:
+                user = User(username=username, hashed_password=AuthService.hash_password("bench123"))
+                db.add(user)
+                db.flush()
+                db.add(UserRole(user_id=user.id, role_id=student.id))
+                db.commit()
+            user_ids.append(user.id)
+        return user_ids
+    finally:
+        db.close()
+
+
+async def prepare_tokens(count: int):
+    """为压测账号签发令牌"""
+    user_ids = prepare_users(count)
+    async with AsyncSessionLocal() as db:
+        auth_service = AuthService(db, None)
+        users = (await db.scalars(
+            select(User).options(USER_ROLES_ONLY_LOADER).where(User.id.in_(user_ids))
+        )).unique().all()
+        return [(await auth_service.create_access_token(user))[0] for user in users]
+
+
+def random_answer(question: dict) -> str:
+    options = question.get("options") or {}
+    if options:
+        return random.choice(list(options))
+    return random.choice(["对", "错", "答案"])
+
+
+async def run_user(client: httpx.AsyncClient, exam_id: int, token: str, rounds: int, latencies, errors):
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(rounds):
+        begin = time.perf_counter()
+        resp = await client.post(f"{API}/{exam_id}/start", headers=headers)
+        latencies["start"].append(time.perf_counter() - begin)
+        if resp.status_code != 200:
+            errors[f"start {resp.status_code}"] += 1
+            continue
+        paper = resp.json()
+        answers = [
+            {"question_id": q["id"], "answer": random_answer(q)}
+            for q in paper["questions"]
+        ]
+
+        begin = time.perf_counter()
+        resp = await client.post(f"{API}/submit", json={"record_id": paper["record_id"], "answers": answers}, headers=headers)
+        latencies["submit"].append(time.perf_counter() - begin)
+        if resp.status_code != 200:
+            errors[f"submit {resp.status_code}"] += 1
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--exam-id", type=int, required=True)
+    parser.add_argument("--users", type=int, default=50, help="并发考生数")
+    parser.add_argument("--rounds", type=int, default=10, help="每个考生开考/交卷轮数")
+    parser.add_argument("--label", default="", help="结果标签，如 sync / async")
+    args = parser.parse_args()
+
+    tokens = await prepare_tokens(args.users)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        begin = time.perf_counter()
+        await asyncio.gather(*[
+            run_user(client, args.exam_id, token, args.rounds, latencies, errors)
+            for token in tokens
+        ])
+        elapsed = time.perf_counter() - begin
+
+    total = sum(len(v) for v in latencies.values())
+    label = f"[{args.label}] " if args.label else ""
+    print(f"{label}{args.users} 考生 x {args.rounds} 轮, 请求 {total}, 耗时 {elapsed:.2f}s, {total / elapsed:.1f} rps")
+    for name in ("start", "submit"):
+        values = latencies[name]
+        if not values:
+            continue
+        print(
+            f"  {name:<7}n={len(values):<6} p50={statistics.median(values) * 1000:7.1f}ms  "
+            f"p99={percentile(values, 0.99) * 1000:7.1f}ms  {len(values) / elapsed:.1f} rps"
+        )
+    if errors:
+        print(f"  错误: {dict(errors)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
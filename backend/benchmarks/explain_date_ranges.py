@@ -0,0 +1,97 @@
+"""
+楚然智考系统 - 日期条件执行计划检查
+对学习趋势、系统概览中的日期查询执行 EXPLAIN，断言均命中预期索引且不是全表扫描；
+语句直接取自业务代码（ExamService.study_trend_query、statistics.overview_date_range_queries），
+业务查询改回 DATE(列) 写法时检查随之失败。同时列出改写前写法的执行计划作对照。
+任一查询不满足时退出码为 1，可作为回归检查
+
+准备: 已执行 db_migration_study_day.sql 的 MySQL 库（DATABASE_URL），需有一定数据量
+      （表只有几行时优化器可能认为全表扫描更便宜）
+运行: cd backend && python benchmarks/explain_date_ranges.py [--user-id 1]
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.api.statistics import overview_date_range_queries
+from app.database import engine
+from app.models.exam import ExamRecord, StudyRecord
+from app.models.user import User
+from app.services.exam_service import ExamService
+
+
+def build_queries(user_id: int):
+    """业务代码实际执行的查询: (名称, 语句, 允许使用的索引)"""
+    today = datetime.now().date()
+    overview = overview_date_range_queries(today)
+
+    return [
+        (
+            "学习趋势 get_study_trend",
+            ExamService.study_trend_query(user_id, today - timedelta(days=29), today),
+            {"uk_study_user_day"},
+        ),
+        ("今日新增用户", overview["new_users_today"], {"idx_user_created"}),
+        ("今日考试记录", overview["today_records"], {"idx_record_created"}),
+        ("今日活跃用户", overview["today_active"], {"idx_study_date"}),
+        ("近7天考试记录趋势", overview["daily_records"], {"idx_record_created"}),
+    ]
+
+
+def build_legacy_queries():
+    """改写前的 DATE(列) 写法（仅作对照，不参与断言）"""
+    today = datetime.now().date()
+    return [
+        ("[改写前] 今日新增用户", select(func.count(User.id)).where(func.date(User.created_at) == today)),
+        ("[改写前] 今日考试记录", select(func.count(ExamRecord.id)).where(func.date(ExamRecord.created_at) == today)),
+        ("[改写前] 今日活跃用户", select(func.count(func.distinct(StudyRecord.user_id))).where(
+            func.date(StudyRecord.study_date) == today
+        )),
+    ]
+
+
+def explain(conn, stmt):
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    return [dict(row._mapping) for row in conn.execute(text("EXPLAIN " + sql))]
+
+
+def format_plan(rows) -> str:
+    return "; ".join(
+        f"{r.get('table')} type={r.get('type')} key={r.get('key')} rows={r.get('rows')}" for r in rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日期条件执行计划检查")
+    parser.add_argument("--user-id", type=int, default=1)
+    args = parser.parse_args()
+
+    if engine.dialect.name != "mysql":
+        print(f"需要 MySQL 数据库，当前为 {engine.dialect.name}")
+        sys.exit(2)
+
+    failures = 0
+    with engine.connect() as conn:
+        for name, stmt, keys in build_queries(args.user_id):
+            rows = explain(conn, stmt)
+            # table 为空表示查询被优化掉（如无匹配行），不需要访问表
+            ok = all(r.get("table") is None or (r.get("type") != "ALL" and r.get("key") in keys) for r in rows)
+            failures += not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {name}: {format_plan(rows)}")
+
+        print()
+        for name, stmt in build_legacy_queries():
+            print(f"     {name}: {format_plan(explain(conn, stmt))}")
+
+    if failures:
+        print(f"\n{failures} 个查询未使用预期索引")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
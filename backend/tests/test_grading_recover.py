@@ -0,0 +1,96 @@
+"""
+超时自动交卷后判分失败的记录由兜底扫描补判（同步判分模式，默认配置）
+数据库访问替换为内存中的考试记录，Redis 使用内存缓存
+运行: cd backend && python -m pytest -q tests
+"""
+import asyncio
+
+import pytest
+
+import app.services.exam_service as exam_service_module
+import app.services.exam_sweeper as exam_sweeper_module
+import app.services.grading_queue as grading_queue_module
+from app.config import settings
+from app.models.exam import RecordStatus
+from app.redis_client import RedisClient
+from app.services.exam_sweeper import ExamSweeper
+from app.services.grading_queue import GradingQueue
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeExamService:
+    """内存中的考试记录：{记录ID: 状态}，fail_grading 次数内判分抛出异常"""
+
+    records = {}
+    fail_grading = 0
+
+    def __init__(self, db):
+        self.db = db
+
+    async def get_expired_record_ids(self, grace_seconds=0, limit=200):
+        return [r for r, status in self.records.items() if status == RecordStatus.IN_PROGRESS][:limit]
+
+    async def expire_records(self, record_answers):
+        expired = [r for r in record_answers if self.records[r] == RecordStatus.IN_PROGRESS]
+        for record_id in expired:
+            self.records[record_id] = RecordStatus.SUBMITTED
+        return expired
+
+    async def grade_submitted_records(self, record_ids):
+        if FakeExamService.fail_grading:
+            FakeExamService.fail_grading -= 1
+            raise RuntimeError("判分线程池繁忙")
+        for record_id in record_ids:
+            self.records[record_id] = RecordStatus.GRADED
+        return len(record_ids)
+
+    async def get_stale_submitted_record_ids(self, before, limit=1000):
+        return [r for r, status in self.records.items() if status == RecordStatus.SUBMITTED][:limit]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    FakeExamService.records = {1: RecordStatus.IN_PROGRESS, 2: RecordStatus.IN_PROGRESS}
+    FakeExamService.fail_grading = 1
+    monkeypatch.setattr(exam_service_module, "ExamService", FakeExamService)
+    monkeypatch.setattr(exam_sweeper_module, "AsyncSessionLocal", FakeSession)
+    monkeypatch.setattr(grading_queue_module, "AsyncSessionLocal", FakeSession)
+    monkeypatch.setattr(settings, "ASYNC_GRADING", False)
+    return FakeExamService.records
+
+
+def test_expired_records_graded_after_grading_failure(fake_db):
+    async def run():
+        redis = RedisClient()
+        sweeper = ExamSweeper(redis)
+        queue = GradingQueue(redis)
+
+        # 自动交卷成功但判分失败：记录停留在已提交状态，扫描本身不中断
+        assert await sweeper.sweep() == 2
+        assert set(fake_db.values()) == {RecordStatus.SUBMITTED}
+
+        # 同步判分模式下兜底扫描直接补判
+        assert await queue.recover_once() == 2
+        assert set(fake_db.values()) == {RecordStatus.GRADED}
+
+    asyncio.run(run())
+
+
+def test_recover_runs_without_async_grading(fake_db):
+    async def run():
+        queue = GradingQueue(RedisClient())
+        queue.start()
+        try:
+            # 未开启异步判分时只启动兜底扫描任务
+            assert len(queue._tasks) == 1
+        finally:
+            await queue.stop()
+
+    asyncio.run(run())
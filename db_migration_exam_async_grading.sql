@@ -0,0 +1,13 @@
+-- 进入目标数据库
+USE `system`;
+
+-- ========================
+-- exam_records 新增待判分答案字段
+-- 异步判分模式下交卷只保存原始答案并将记录置为 submitted，
+-- 后台判分任务判分后写入答题记录并清空该字段
+-- ========================
+
+ALTER TABLE `exam_records`
+  ADD COLUMN `submitted_answers` TEXT NULL
+    COMMENT '待判分的原始答案JSON（异步判分，判分后清空）'
+    AFTER `paper_snapshot`;
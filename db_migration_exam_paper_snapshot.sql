@@ -0,0 +1,13 @@
+-- 进入目标数据库
+USE `system`;
+
+-- ========================
+-- exam_records 新增试卷快照字段
+-- 开始考试时写入本次作答的题目ID顺序、分值及答案版本，
+-- 交卷、记录详情、继续作答均读取该快照，不再重新组卷
+-- ========================
+
+ALTER TABLE `exam_records`
+  ADD COLUMN `paper_snapshot` TEXT NULL
+    COMMENT '试卷快照JSON：题目ID顺序、分值、答案版本'
+    AFTER `is_passed`;
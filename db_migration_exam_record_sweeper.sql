@@ -0,0 +1,10 @@
+-- 进入目标数据库
+USE `system`;
+
+-- ========================
+-- exam_records 新增 (status, start_time) 联合索引
+-- 超时自动交卷任务按 状态=进行中 AND start_time < 截止时间 范围扫描
+-- ========================
+
+ALTER TABLE `exam_records`
+  ADD INDEX `idx_record_status_start` (`status`, `start_time`);
@@ -0,0 +1,11 @@
+-- 进入目标数据库
+USE `system`;
+
+-- ========================
+-- 错题列表游标分页按 (updated_at, id) 倒序定位，
+-- (user_id, updated_at) 索引（InnoDB 二级索引末尾隐含主键 id）使翻页只做范围扫描、无需排序
+-- 其余列表按 id 排序，已有的 user_id / bank_id 等单列索引同样隐含主键，不需新增
+-- ========================
+
+ALTER TABLE `wrong_questions`
+  ADD INDEX `idx_wrong_user_updated` (`user_id`, `updated_at`);
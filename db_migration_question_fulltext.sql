@@ -0,0 +1,15 @@
+-- 进入目标数据库
+USE `system`;
+
+-- ========================
+-- questions 新增题干/选项/解析全文索引（ngram 分词，支持中文）
+-- 题目关键词检索改为 MATCH ... AGAINST 走全文索引并按相关度排序
+--
+-- 执行前建议在 my.cnf 的 [mysqld] 中确认并重启：
+--   ngram_token_size = 2          -- 需与后端 SEARCH_NGRAM_TOKEN_SIZE 一致
+--   innodb_ft_enable_stopword = 0 -- ngram 分词下包含英文停用词（如 a、in）的词元会被忽略
+-- 修改以上参数后需重建索引才生效
+-- ========================
+
+ALTER TABLE `questions`
+  ADD FULLTEXT INDEX `ft_question_text` (`title`, `options`, `analysis`) WITH PARSER ngram;
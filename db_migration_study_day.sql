@@ -0,0 +1,48 @@
+-- 进入目标数据库
+USE `system`;
+
+-- ========================
+-- study_records 新增学习日列及 (user_id, study_day) 唯一索引
+-- 当日学习记录改为 INSERT ... ON DUPLICATE KEY UPDATE 单条语句写入，
+-- 不再先按 DATE(study_date) 更新、未命中再插入（并发交卷时会插入重复的当日记录）
+-- ========================
+
+ALTER TABLE `study_records`
+  ADD COLUMN `study_day` DATE NULL COMMENT '学习日（每个用户每天一行）' AFTER `study_date`;
+
+UPDATE `study_records` SET `study_day` = DATE(`study_date`);
+
+-- 合并历史上同一用户同一天的重复记录：累加到最早的一行后删除其余行
+UPDATE `study_records` s
+JOIN (
+  SELECT MIN(id) AS keep_id,
+         SUM(study_duration) AS study_duration,
+         SUM(question_count) AS question_count,
+         SUM(correct_count) AS correct_count,
+         SUM(exam_count) AS exam_count
+  FROM `study_records`
+  GROUP BY user_id, study_day
+  HAVING COUNT(*) > 1
+) d ON s.id = d.keep_id
+SET s.study_duration = d.study_duration,
+    s.question_count = d.question_count,
+    s.correct_count = d.correct_count,
+    s.exam_count = d.exam_count;
+
+DELETE s FROM `study_records` s
+JOIN `study_records` k
+  ON k.user_id = s.user_id AND k.study_day = s.study_day AND k.id < s.id;
+
+ALTER TABLE `study_records`
+  MODIFY COLUMN `study_day` DATE NOT NULL COMMENT '学习日（每个用户每天一行）',
+  ADD UNIQUE INDEX `uk_study_user_day` (`user_id`, `study_day`);
+
+-- ========================
+-- 概览统计按 created_at 时间区间计数（今日新增用户、今日/近7天考试记录）
+-- ========================
+
+ALTER TABLE `users`
+  ADD INDEX `idx_user_created` (`created_at`);
+
+ALTER TABLE `exam_records`
+  ADD INDEX `idx_record_created` (`created_at`);
@@ -0,0 +1,10 @@
+-- 进入目标数据库
+USE `system`;
+
+-- ========================
+-- users 新增令牌版本号
+-- 令牌中携带签发时的版本号，重置密码后递增，之前签发的令牌全部失效
+-- ========================
+
+ALTER TABLE `users`
+  ADD COLUMN `token_version` INT NOT NULL DEFAULT 0 COMMENT '令牌版本，递增后之前签发的令牌失效' AFTER `is_superuser`;
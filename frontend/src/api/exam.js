@@ -49,6 +49,16 @@ export const examApi = {
     return request.post('/exams/submit', data)
   },
   
+  // 自动保存答案
+  saveAnswers(recordId, data) {
+    return request.put(`/exams/records/${recordId}/answers`, data)
+  },
+  
+  // 获取已自动保存的答案（继续作答）
+  getSavedAnswers(recordId) {
+    return request.get(`/exams/records/${recordId}/answers`)
+  },
+  
   // 获取我的考试记录
   getMyRecords(params) {
     return request.get('/exams/records/my', { params })
@@ -59,6 +69,11 @@ export const examApi = {
     return request.get(`/exams/records/${id}`)
   },
   
+  // 获取考试记录判分状态（异步判分轮询）
+  getRecordStatus(id) {
+    return request.get(`/exams/records/${id}/status`)
+  },
+  
   // 获取错题列表
   getWrongQuestions(params) {
     return request.get('/exams/wrong/list', { params })
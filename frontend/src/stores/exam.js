@@ -3,6 +3,10 @@
  */
 import { defineStore } from 'pinia'
 import { ref, computed } from 'vue'
+import { examApi } from '@/api/exam'
+
+// 自动保存防抖间隔（毫秒）
+const AUTOSAVE_DELAY = 1500
 
 export const useExamStore = defineStore('exam', () => {
   // 当前考试状态
@@ -15,6 +19,10 @@ export const useExamStore = defineStore('exam', () => {
   const endTime = ref(null)
   const isSubmitting = ref(false)
   
+  // 待自动保存的答案 { questionId: answer }
+  let pendingSaves = {}
+  let autosaveTimer = null
+  
   // 计算属性
   const currentQuestion = computed(() => questions.value[currentIndex.value] || null)
   const totalQuestions = computed(() => questions.value.length)
@@ -50,6 +58,37 @@ export const useExamStore = defineStore('exam', () => {
   // 设置答案
   const setAnswer = (questionId, answer) => {
     answers.value[questionId] = answer
+    pendingSaves[questionId] = answer
+    if (autosaveTimer) clearTimeout(autosaveTimer)
+    autosaveTimer = setTimeout(flushAutosave, AUTOSAVE_DELAY)
+  }
+  
+  // 把变化的答案保存到服务端，失败时保留待下次重试
+  const flushAutosave = async () => {
+    autosaveTimer = null
+    const recordId = currentRecord.value?.id
+    const items = pendingSaves
+    pendingSaves = {}
+    if (!recordId || Object.keys(items).length === 0) return
+    try {
+      await examApi.saveAnswers(recordId, {
+        answers: Object.entries(items).map(([questionId, answer]) => ({
+          question_id: parseInt(questionId),
+          answer: answer
+        }))
+      })
+    } catch (error) {
+      pendingSaves = { ...items, ...pendingSaves }
+    }
+  }
+  
+  // 恢复已自动保存的答案（继续作答）
+  const restoreAnswers = (savedAnswers) => {
+    savedAnswers.forEach(item => {
+      if (answers.value[item.question_id] === undefined) {
+        answers.value[item.question_id] = item.answer
+      }
+    })
   }
   
   // 获取答案
@@ -91,6 +130,9 @@ export const useExamStore = defineStore('exam', () => {
   
   // 清除考试状态
   const clearExam = () => {
+    if (autosaveTimer) clearTimeout(autosaveTimer)
+    autosaveTimer = null
+    pendingSaves = {}
     currentExam.value = null
     currentRecord.value = null
     questions.value = []
@@ -122,6 +164,7 @@ export const useExamStore = defineStore('exam', () => {
     remainingTime,
     progress,
     initExam,
+    restoreAnswers,
     setAnswer,
     getAnswer,
     goToQuestion,